@@ -1,41 +1,154 @@
-from django.contrib import admin
-from .models import Category, Product, Profile, Cart, CartItem, Order, OrderItem
+from collections import Counter
+
+from django.contrib import admin, messages
+from django.utils import timezone
+from . import analytics, fulfillment
+from .admin_performance import CreatedDateFilter, PerformanceAdminMixin
+from .models import Category, Product, Profile, Cart, CartItem, Order, OrderItem, Job, Deployment
 
 class CategoryAdmin(admin.ModelAdmin):
     list_display = ('name', 'created_at')
     search_fields = ('name',)
 
-class ProductAdmin(admin.ModelAdmin):
-    list_display = ('name', 'price', 'stock', 'category', 'is_active')
+class ProductAdmin(PerformanceAdminMixin, admin.ModelAdmin):
+    list_display = ('name', 'sku', 'price', 'stock', 'category', 'is_active')
     list_filter = ('is_active', 'category')
-    search_fields = ('name', 'description')
+    list_select_related = ('category',)
+    search_fields = ('name', 'sku', 'description')
+    prefix_search_fields = ('sku', 'name')
+    autocomplete_fields = ('category',)
+    # Set with the shard_stock command and by the image render jobs
+    readonly_fields = ('stock_shards', 'image_variants')
+    change_list_template = 'admin/api/product/change_list.html'
+
+    def changelist_view(self, request, extra_context=None):
+        # Top sellers come from the daily product rollups, not from OrderItem
+        start, end = analytics.dashboard_periods()[-1][1:]
+        extra_context = {
+            **(extra_context or {}),
+            'top_products': analytics.top_products(start, end, limit=10),
+            'rollups_as_of': analytics.get_watermark(),
+        }
+        return super().changelist_view(request, extra_context=extra_context)
 
-class ProfileAdmin(admin.ModelAdmin):
+class ProfileAdmin(PerformanceAdminMixin, admin.ModelAdmin):
     list_display = ('user', 'phone_number')
+    list_select_related = ('user',)
     search_fields = ('user__username', 'phone_number')
+    prefix_search_fields = ('user__username',)
+    raw_id_fields = ('user',)
 
 class CartItemInline(admin.TabularInline):
     model = CartItem
     extra = 0
+    # A <select> of every product doesn't scale; search them instead
+    autocomplete_fields = ('product',)
 
-class CartAdmin(admin.ModelAdmin):
-    list_display = ('user', 'created_at')
+class CartAdmin(PerformanceAdminMixin, admin.ModelAdmin):
+    list_display = ('user', 'item_count', 'subtotal', 'created_at')
+    list_select_related = ('user',)
+    search_fields = ('user__username',)
+    prefix_search_fields = ('user__username',)
+    readonly_fields = ('item_count', 'subtotal')
+    raw_id_fields = ('user',)
     inlines = [CartItemInline]
 
+    def save_related(self, request, form, formsets, change):
+        super().save_related(request, form, formsets, change)
+        # Inline edits bypass the cart views, so recompute the stored totals
+        Cart.objects.filter(pk=form.instance.pk).reconcile_totals()
+
 class OrderItemInline(admin.TabularInline):
     model = OrderItem
     extra = 0
     readonly_fields = ('product', 'quantity', 'price')
 
-class OrderAdmin(admin.ModelAdmin):
+    def get_queryset(self, request):
+        return super().get_queryset(request).select_related('product')
+
+class OrderAdmin(PerformanceAdminMixin, admin.ModelAdmin):
     list_display = ('id', 'user', 'full_name', 'status', 'total_amount', 'created_at')
-    list_filter = ('status', 'created_at')
+    list_filter = ('status', CreatedDateFilter)
+    list_select_related = ('user',)
     search_fields = ('user__username', 'full_name', 'email')
+    prefix_search_fields = ('email', 'full_name', 'user__username')
     readonly_fields = ('total_amount',)
+    raw_id_fields = ('user',)
     inlines = [OrderItemInline]
+    change_list_template = 'admin/api/order/change_list.html'
+    actions = ['mark_processing', 'mark_shipped', 'mark_delivered', 'cancel']
+
+    def changelist_view(self, request, extra_context=None):
+        # Revenue summaries come from the daily sales rollups, not from OrderItem
+        extra_context = {
+            **(extra_context or {}),
+            'sales_summary': [
+                (label, analytics.sales_totals(start, end)) for label, start, end in analytics.dashboard_periods()
+            ],
+            'rollups_as_of': analytics.get_watermark(),
+        }
+        return super().changelist_view(request, extra_context=extra_context)
+
+    def transition(self, request, queryset, target):
+        results, restocked = fulfillment.transition_orders(queryset.values_list('pk', flat=True), target)
+        outcomes = Counter(result['outcome'] for result in results)
+        message = f"{outcomes[fulfillment.UPDATED]} orders marked {target}"
+        if restocked:
+            message += f", {restocked} units restocked"
+        skipped = [
+            f"{result['id']} ({result['from']})" for result in results
+            if result['outcome'] == fulfillment.INVALID
+        ]
+        if skipped:
+            listed = ', '.join(skipped[:20]) + (f' and {len(skipped) - 20} more' if len(skipped) > 20 else '')
+            self.message_user(request, f"{message}. Not allowed from their status: {listed}.", messages.WARNING)
+        else:
+            self.message_user(request, f"{message}.")
+
+    @admin.action(description='Mark selected orders as processing')
+    def mark_processing(self, request, queryset):
+        self.transition(request, queryset, fulfillment.PROCESSING)
+
+    @admin.action(description='Mark selected orders as shipped')
+    def mark_shipped(self, request, queryset):
+        self.transition(request, queryset, fulfillment.SHIPPED)
+
+    @admin.action(description='Mark selected orders as delivered')
+    def mark_delivered(self, request, queryset):
+        self.transition(request, queryset, fulfillment.DELIVERED)
+
+    @admin.action(description='Cancel selected orders and restock their items')
+    def cancel(self, request, queryset):
+        self.transition(request, queryset, fulfillment.CANCELLED)
+
+class JobAdmin(PerformanceAdminMixin, admin.ModelAdmin):
+    list_display = ('id', 'name', 'status', 'attempts', 'run_after', 'locked_by', 'updated_at')
+    list_filter = ('status', 'name')
+    readonly_fields = ('attempts', 'locked_by', 'locked_at', 'last_error', 'created_at', 'updated_at')
+    actions = ['retry']
+
+    @admin.action(description='Retry selected jobs now')
+    def retry(self, request, queryset):
+        updated = queryset.exclude(status=Job.RUNNING).update(
+            status=Job.PENDING, run_after=timezone.now(), attempts=0, last_error=''
+        )
+        self.message_user(request, f'{updated} jobs queued again.')
+
+class DeploymentAdmin(admin.ModelAdmin):
+    list_display = ('id', 'status', 'revision_before', 'revision_after', 'created_at', 'finished_at')
+    list_filter = ('status',)
+    readonly_fields = (
+        'status', 'revision_before', 'revision_after', 'steps', 'log', 'created_at', 'started_at', 'finished_at'
+    )
+
+    def has_add_permission(self, request):
+        # Deployments are started by the webhook
+        return False
 
 admin.site.register(Category, CategoryAdmin)
 admin.site.register(Product, ProductAdmin)
 admin.site.register(Profile, ProfileAdmin)
 admin.site.register(Cart, CartAdmin)
 admin.site.register(Order, OrderAdmin)
+admin.site.register(Job, JobAdmin)
+admin.site.register(Deployment, DeploymentAdmin)
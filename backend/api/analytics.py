@@ -0,0 +1,190 @@
+"""
+Daily sales and stock rollups behind the admin dashboards and analytics API.
+
+Sales rollups are recomputed a whole day at a time from OrderItem, so a
+refresh is idempotent. The incremental refresh only recomputes the days of
+orders created or updated (e.g. a status change) since the previous run;
+``rebuild_rollups`` recomputes every day, which also drops days whose orders
+were deleted. Reads aggregate the small rollup tables and never touch the
+order history.
+"""
+import datetime
+from itertools import islice
+
+from django.db import transaction
+from django.db.models import Count, DecimalField, F, Q, Sum
+from django.db.models.functions import TruncDate
+from django.utils import timezone
+
+from .models import (
+    DailyCategorySales, DailyProductSales, DailySales, Order, OrderItem, Product, RollupWatermark, StockSnapshot
+)
+
+WATERMARK = 'sales'
+# Re-read orders updated shortly before the previous run started, in case their
+# transactions had not committed yet when it looked
+OVERLAP = datetime.timedelta(minutes=10)
+# Days recomputed per transaction
+DAYS_PER_BATCH = 31
+BATCH_SIZE = 5000
+ONE_DAY = datetime.timedelta(days=1)
+
+
+def chunked(iterable, size):
+    iterator = iter(iterable)
+    while chunk := list(islice(iterator, size)):
+        yield chunk
+
+
+def day_start(day):
+    return timezone.make_aware(datetime.datetime.combine(day, datetime.time.min))
+
+
+def created_on(days, prefix=''):
+    """Q matching rows whose ``created_at`` falls on one of ``days``, as index-friendly ranges."""
+    condition = Q()
+    runs = []
+    for day in sorted(days):
+        if runs and runs[-1][1] == day:
+            runs[-1][1] = day + ONE_DAY
+        else:
+            runs.append([day, day + ONE_DAY])
+    for start, end in runs:
+        condition |= Q(**{f'{prefix}created_at__gte': day_start(start), f'{prefix}created_at__lt': day_start(end)})
+    return condition
+
+
+def recompute_days(days):
+    """Replace the sales rollups of ``days`` with fresh aggregates of their order items."""
+    revenue = Sum(F('quantity') * F('price'), output_field=DecimalField(max_digits=14, decimal_places=2))
+    for batch in chunked(sorted(days), DAYS_PER_BATCH):
+        items = (
+            OrderItem.objects.filter(created_on(batch, prefix='order__'))
+            .exclude(order__status='cancelled')
+            .annotate(day=TruncDate('order__created_at'))
+            .order_by()
+        )
+        totals = dict(orders=Count('order', distinct=True), units=Sum('quantity'), revenue=revenue)
+        with transaction.atomic():
+            for model in (DailySales, DailyCategorySales, DailyProductSales):
+                model.objects.filter(date__in=batch).delete()
+            DailySales.objects.bulk_create(
+                DailySales(date=row.pop('day'), **row) for row in items.values('day').annotate(**totals)
+            )
+            DailyCategorySales.objects.bulk_create(
+                DailyCategorySales(date=row.pop('day'), category_id=row.pop('product__category'), **row)
+                for row in items.filter(product__category__isnull=False)
+                .values('day', 'product__category').annotate(**totals)
+            )
+            rows = items.values('day', 'product').annotate(**totals).iterator(chunk_size=BATCH_SIZE)
+            for chunk in chunked(rows, BATCH_SIZE):
+                DailyProductSales.objects.bulk_create(
+                    DailyProductSales(date=row.pop('day'), product_id=row.pop('product'), **row) for row in chunk
+                )
+
+
+def order_days(orders):
+    return set(
+        orders.annotate(day=TruncDate('created_at')).order_by().values_list('day', flat=True).distinct()
+    )
+
+
+def refresh_rollups():
+    """Recompute the days touched since the last refresh; returns them. The first run rebuilds."""
+    started = timezone.now()
+    watermark = get_watermark()
+    if watermark is None:
+        return rebuild_rollups()
+    days = order_days(Order.objects.filter(updated_at__gte=watermark - OVERLAP))
+    recompute_days(days)
+    set_watermark(started)
+    return days
+
+
+def rebuild_rollups(start=None, end=None):
+    """Recompute every day between ``start`` and ``end`` (inclusive, both optional); returns them."""
+    started = timezone.now()
+    orders = Order.objects.all()
+    existing = DailySales.objects.all()
+    if start:
+        orders, existing = orders.filter(created_at__gte=day_start(start)), existing.filter(date__gte=start)
+    if end:
+        orders, existing = orders.filter(created_at__lt=day_start(end + ONE_DAY)), existing.filter(date__lte=end)
+    # Days already rolled up are included so that days whose orders were deleted are cleared
+    days = order_days(orders) | set(existing.values_list('date', flat=True))
+    recompute_days(days)
+    if start is None and end is None:
+        set_watermark(started)
+    return days
+
+
+def get_watermark():
+    return RollupWatermark.objects.filter(name=WATERMARK).values_list('value', flat=True).first()
+
+
+def set_watermark(value):
+    RollupWatermark.objects.update_or_create(name=WATERMARK, defaults={'value': value})
+
+
+def take_stock_snapshot(day=None):
+    """Upsert every product's current stock as its snapshot for ``day`` (default today)."""
+    day = day or timezone.localdate()
+    last_pk = 0
+    count = 0
+    while batch := list(
+        Product.objects.filter(pk__gt=last_pk).order_by('pk').values_list('pk', 'stock')[:BATCH_SIZE]
+    ):
+        StockSnapshot.objects.bulk_create(
+            [StockSnapshot(date=day, product_id=pk, stock=stock) for pk, stock in batch],
+            update_conflicts=True,
+            unique_fields=['product', 'date'],
+            update_fields=['stock'],
+        )
+        last_pk = batch[-1][0]
+        count += len(batch)
+    return count
+
+
+# Reads
+
+
+def sales_totals(start, end):
+    return DailySales.objects.filter(date__range=(start, end)).aggregate(
+        orders=Sum('orders', default=0), units=Sum('units', default=0), revenue=Sum('revenue', default=0)
+    )
+
+
+def daily_sales(start, end):
+    return DailySales.objects.filter(date__range=(start, end)).order_by('date')
+
+
+def category_sales(start, end):
+    return (
+        DailyCategorySales.objects.filter(date__range=(start, end))
+        .values('category', name=F('category__name'))
+        .annotate(orders=Sum('orders'), units=Sum('units'), revenue=Sum('revenue'))
+        .order_by('-revenue', 'category')
+    )
+
+
+def top_products(start, end, limit=10, by='revenue'):
+    return (
+        DailyProductSales.objects.filter(date__range=(start, end))
+        .values('product', name=F('product__name'))
+        .annotate(orders=Sum('orders'), units=Sum('units'), revenue=Sum('revenue'))
+        .order_by(f'-{by}', 'product')[:limit]
+    )
+
+
+def stock_history(product_id, start, end):
+    return StockSnapshot.objects.filter(product_id=product_id, date__range=(start, end)).order_by('date')
+
+
+def dashboard_periods():
+    """(label, start, end) for the admin summaries."""
+    today = timezone.localdate()
+    return [
+        ('Today', today, today),
+        ('Last 7 days', today - datetime.timedelta(days=6), today),
+        ('Last 30 days', today - datetime.timedelta(days=29), today),
+    ]
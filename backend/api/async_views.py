@@ -0,0 +1,113 @@
+"""
+Async variants of the public catalog read endpoints, for ASGI deployments.
+
+They share filters, pagination and serializers with the DRF views and return
+the same JSON, but read through Django's async ORM. Serializers only run over
+rows that are already loaded (categories come in via select_related), so
+nothing blocks the event loop. Featured products come from the precomputed
+``newest`` ranking, like FeaturedProductListView; looking its ids up is sync
+code and runs in a thread.
+"""
+from asgiref.sync import sync_to_async
+from django.core.exceptions import ObjectDoesNotExist
+from django.http import HttpResponse
+from django.views.decorators.http import require_safe
+from rest_framework.exceptions import NotFound
+from rest_framework.renderers import JSONRenderer
+from rest_framework.request import Request
+from rest_framework.settings import api_settings
+from rest_framework.utils.urls import remove_query_param, replace_query_param
+
+from . import rankings
+from .filters import filter_products
+from .models import Category, Product
+from .pagination import ProductPagination
+from .serializers import CategorySerializer, ProductSerializer
+
+
+def json_response(data, status=200):
+    return HttpResponse(JSONRenderer().render(data), status=status, content_type='application/json')
+
+
+async def paginate_by_page_number(request, queryset, page_size=None):
+    """Same page and response shape as DRF's PageNumberPagination, evaluated asynchronously."""
+    page_size = page_size or api_settings.PAGE_SIZE
+    try:
+        page = int(request.query_params.get('page', 1))
+        if page < 1:
+            raise ValueError
+    except ValueError:
+        raise NotFound('Invalid page.')
+
+    count = await queryset.acount()
+    start = (page - 1) * page_size
+    if page > 1 and start >= count:
+        raise NotFound('Invalid page.')
+    results = [obj async for obj in queryset[start:start + page_size].aiterator()]
+
+    url = request.build_absolute_uri()
+    next_link = replace_query_param(url, 'page', page + 1) if start + page_size < count else None
+    if page == 1:
+        previous_link = None
+    elif page == 2:
+        previous_link = remove_query_param(url, 'page')
+    else:
+        previous_link = replace_query_param(url, 'page', page - 1)
+    return {'count': count, 'next': next_link, 'previous': previous_link}, results
+
+
+@require_safe
+async def product_list(request):
+    request = Request(request)
+    queryset = filter_products(
+        ProductSerializer.setup_eager_loading(Product.objects.filter(is_active=True)),
+        request.query_params,
+    )
+    paginator = ProductPagination()
+    try:
+        if paginator.use_page_numbers(request):
+            queryset = paginator.order_for_page_numbers(queryset, request)
+            data, products = await paginate_by_page_number(request, queryset, paginator.get_page_size(request))
+        else:
+            products = paginator.page_from([p async for p in paginator.seek(queryset, request).aiterator()])
+            data = {'next': paginator.get_next_link(), 'previous': paginator.get_previous_link()}
+    except NotFound as e:
+        return json_response({'detail': e.detail}, status=404)
+
+    data['results'] = ProductSerializer(products, many=True).data
+    return json_response(data)
+
+
+@require_safe
+async def product_detail(request, pk):
+    queryset = ProductSerializer.setup_eager_loading(Product.objects.filter(is_active=True))
+    try:
+        product = await queryset.aget(pk=pk)
+    except ObjectDoesNotExist:
+        return json_response({'detail': 'No Product matches the given query.'}, status=404)
+    return json_response(ProductSerializer(product).data)
+
+
+@require_safe
+async def featured_products(request):
+    request = Request(request)
+    queryset = await sync_to_async(rankings.ranked_products)(
+        rankings.NEWEST, limit=4, queryset=ProductSerializer.setup_eager_loading(Product.objects.all()),
+    )
+    try:
+        data, products = await paginate_by_page_number(request, queryset)
+    except NotFound as e:
+        return json_response({'detail': e.detail}, status=404)
+    data['results'] = ProductSerializer(products, many=True).data
+    return json_response(data)
+
+
+@require_safe
+async def category_list(request):
+    request = Request(request)
+    try:
+        data, categories = await paginate_by_page_number(request, Category.objects.order_by('pk'))
+    except NotFound as e:
+        return json_response({'detail': e.detail}, status=404)
+    data['results'] = CategorySerializer(categories, many=True).data
+    return json_response(data)
@@ -0,0 +1,129 @@
+"""
+Stateless JWT authentication.
+
+Tokens carry the user id plus the few claims the API needs on every request
+(username, is_staff and the cart id), so authenticating a request reads no
+rows: ``StatelessJWTAuthentication`` returns a ``ShopTokenUser`` built from
+the token, which only loads the User row if something asks for a field the
+token doesn't carry.
+
+Since nothing is looked up, logging out, deactivating or deleting a user
+records a revocation in the cache instead: tokens issued for that user up to
+that moment are refused, access and refresh alike. With several server
+processes the cache must be shared (set REDIS_URL), or a revocation only
+applies to the process that recorded it.
+"""
+import contextvars
+import time
+
+from django.contrib.auth.backends import ModelBackend
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.utils.functional import cached_property
+from rest_framework_simplejwt.authentication import JWTStatelessUserAuthentication
+from rest_framework_simplejwt.exceptions import AuthenticationFailed, InvalidToken
+from rest_framework_simplejwt.models import TokenUser
+from rest_framework_simplejwt.serializers import TokenObtainPairSerializer, TokenRefreshSerializer
+from rest_framework_simplejwt.settings import api_settings
+
+from .models import Cart
+
+
+def _revocation_key(user_id):
+    return f'auth:revoked:{user_id}'
+
+
+def revoke_tokens(user_id):
+    """Refuse every token issued for ``user_id`` until now."""
+    # Past the refresh lifetime every token issued before now has expired anyway
+    lifetime = max(api_settings.ACCESS_TOKEN_LIFETIME, api_settings.REFRESH_TOKEN_LIFETIME)
+    cache.set(_revocation_key(user_id), time.time(), timeout=int(lifetime.total_seconds()))
+
+
+def is_revoked(token):
+    revoked_at = cache.get(_revocation_key(token.get(api_settings.USER_ID_CLAIM)))
+    # iat only has whole seconds; issued_at tells apart tokens issued just before and just after
+    # a revocation in the same second. Access tokens inherit it from their refresh token.
+    return revoked_at is not None and token.get('issued_at', token.get('iat', 0)) < revoked_at
+
+
+class ShopTokenUser(TokenUser):
+    """
+    The requesting user as described by their access token. Fields the token
+    doesn't carry are read from the User row, loaded on first use.
+    """
+
+    @cached_property
+    def cart_id(self):
+        return self.token.get('cart_id')
+
+    @cached_property
+    def user(self):
+        return User.objects.get(pk=self.id)
+
+    def __getattr__(self, name):
+        if name.startswith('_') or name == 'token':
+            raise AttributeError(name)
+        return getattr(self.user, name)
+
+
+class StatelessJWTAuthentication(JWTStatelessUserAuthentication):
+    def get_user(self, validated_token):
+        if is_revoked(validated_token):
+            raise AuthenticationFailed('Token has been revoked.', code='token_revoked')
+        return super().get_user(validated_token)
+
+
+class ShopTokenObtainPairSerializer(TokenObtainPairSerializer):
+    @classmethod
+    def get_token(cls, user):
+        # Claims on the refresh token are copied into every access token minted from it
+        token = super().get_token(user)
+        token['username'] = user.get_username()
+        token['is_staff'] = user.is_staff
+        token['cart_id'] = Cart.objects.filter(user=user).values_list('pk', flat=True).first()
+        token['issued_at'] = time.time()
+        return token
+
+
+class ShopTokenRefreshSerializer(TokenRefreshSerializer):
+    def validate(self, attrs):
+        if is_revoked(self.token_class(attrs['refresh'])):
+            raise InvalidToken('Token has been revoked.')
+        return super().validate(attrs)
+
+
+_authenticating = contextvars.ContextVar('authenticating', default=False)
+
+
+class ShopModelBackend(ModelBackend):
+    """
+    Django's ModelBackend, marking the time spent checking credentials: a
+    correct password stored with outdated hasher settings is re-encoded and
+    saved then, which mustn't count as a password change.
+    """
+
+    def authenticate(self, request, username=None, password=None, **kwargs):
+        marker = _authenticating.set(True)
+        try:
+            return super().authenticate(request, username=username, password=password, **kwargs)
+        finally:
+            _authenticating.reset(marker)
+
+
+def is_login_rehash(update_fields):
+    """Whether a User save is the password re-encoding of a login in progress."""
+    return _authenticating.get() and update_fields is not None and set(update_fields) == {'password'}
+
+
+def user_cart(user):
+    """
+    A handle on ``user``'s cart for filtering and updating, without reading
+    the row when the token carries its id; None if the user has no cart.
+    """
+    cart_id = getattr(user, 'cart_id', None)
+    if cart_id is None:
+        cart_id = Cart.objects.filter(user_id=user.id).values_list('pk', flat=True).first()
+        if cart_id is None:
+            return None
+    return Cart(pk=cart_id, user_id=user.id)
@@ -0,0 +1,6 @@
+"""
+Benchmarks for the API, run through the ``bench_*`` management commands.
+
+They never touch the configured database: each run migrates a throwaway
+copy (see ``utils.scratch_database``) and drops it afterwards.
+"""
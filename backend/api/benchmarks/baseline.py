@@ -0,0 +1,73 @@
+"""
+JSON baselines for ``bench_api`` and the comparison that fails a run.
+
+Latency and throughput are compared with a relative tolerance, since they
+vary between runs on the same machine. Query counts are deterministic for a
+given seed, so any increase is a regression.
+"""
+import json
+import platform
+from dataclasses import dataclass
+
+import django
+from django.db import connection
+from django.utils import timezone
+
+# (metric, True if higher is better)
+TIMED_METRICS = (('p50_ms', False), ('p95_ms', False), ('throughput', True))
+
+
+def build_report(scale, seed, results):
+    return {
+        'created_at': timezone.now().isoformat(),
+        'environment': {
+            'python': platform.python_version(),
+            'django': django.get_version(),
+            'database': connection.vendor,
+        },
+        'scale': scale,
+        'seed': seed,
+        'scenarios': results,
+    }
+
+
+def save(report, path):
+    with open(path, 'w') as f:
+        json.dump(report, f, indent=2, sort_keys=True)
+        f.write('\n')
+
+
+def load(path):
+    with open(path) as f:
+        return json.load(f)
+
+
+@dataclass
+class Regression:
+    scenario: str
+    metric: str
+    baseline: float
+    current: float
+
+    def __str__(self):
+        return f'{self.scenario}: {self.metric} {self.baseline:.2f} -> {self.current:.2f}'
+
+
+def compare(baseline, report, threshold):
+    """Regressions of ``report`` against ``baseline`` beyond ``threshold`` (0.2 = 20%)."""
+    regressions = []
+    for name, current in report['scenarios'].items():
+        previous = baseline['scenarios'].get(name)
+        if previous is None:
+            continue
+        for metric, higher_is_better in TIMED_METRICS:
+            before, after = previous[metric], current[metric]
+            if higher_is_better:
+                regressed = after < before * (1 - threshold)
+            else:
+                regressed = after > before * (1 + threshold)
+            if regressed:
+                regressions.append(Regression(name, metric, before, after))
+        if current['queries_max'] > previous['queries_max']:
+            regressions.append(Regression(name, 'queries_max', previous['queries_max'], current['queries_max']))
+    return regressions
@@ -0,0 +1,117 @@
+"""
+Bulk factories for a synthetic shop: categories, products, users with a
+profile and a cart, and order histories.
+
+Everything goes through ``bulk_create`` in batches, so seeding a million
+products takes minutes rather than hours. That skips the model signals: the
+search index is rebuilt once at the end, and nothing is cached yet in a fresh
+scratch database.
+"""
+import random
+from dataclasses import dataclass
+from decimal import Decimal
+
+from django.contrib.auth.hashers import make_password
+from django.contrib.auth.models import User
+from django.db import transaction
+
+from api.models import Cart, Category, Order, OrderItem, Product, Profile
+from api.search import get_search_backend
+
+BATCH_SIZE = 5000
+PASSWORD = 'bench-password'
+
+WORDS = [
+    'alpine', 'basic', 'classic', 'compact', 'deluxe', 'eco', 'essential', 'flex', 'fresh', 'grand', 'heavy',
+    'light', 'linen', 'micro', 'nova', 'organic', 'pocket', 'premium', 'pro', 'rapid', 'smart', 'solar',
+    'steel', 'studio', 'swift', 'travel', 'ultra', 'urban', 'vintage', 'wireless',
+]
+NOUNS = [
+    'backpack', 'blender', 'bottle', 'camera', 'chair', 'charger', 'desk', 'headphones', 'jacket', 'kettle',
+    'keyboard', 'lamp', 'monitor', 'mug', 'notebook', 'pan', 'phone', 'scarf', 'shoes', 'speaker', 'tent',
+    'toaster', 'towel', 'watch',
+]
+
+SCALES = {
+    'small': dict(categories=20, products=10_000, users=200, orders_per_user=3),
+    'medium': dict(categories=100, products=100_000, users=2_000, orders_per_user=5),
+    'large': dict(categories=500, products=1_000_000, users=20_000, orders_per_user=5),
+}
+
+
+@dataclass
+class Dataset:
+    """What was seeded, for scenarios to pick their inputs from."""
+    category_ids: list
+    product_ids: list
+    user_ids: list
+    vocabulary: list
+
+
+def batches(total, size=BATCH_SIZE):
+    for start in range(0, total, size):
+        yield start, min(size, total - start)
+
+
+def seed(categories, products, users, orders_per_user, seed=42, progress=None):
+    """Seed a shop of the given size and return a ``Dataset`` describing it."""
+    rng = random.Random(seed)
+    progress = progress or (lambda message: None)
+
+    progress(f'{categories} categories')
+    Category.objects.bulk_create([Category(name=f'Category {i}') for i in range(categories)])
+    category_ids = list(Category.objects.order_by('id').values_list('id', flat=True))
+
+    progress(f'{products} products')
+    for start, count in batches(products):
+        Product.objects.bulk_create([
+            Product(
+                name=f'{rng.choice(WORDS)} {rng.choice(WORDS)} {rng.choice(NOUNS)}',
+                description=' '.join(rng.choices(WORDS + NOUNS, k=20)),
+                sku=f'BENCH-{start + i:07d}',
+                price=Decimal(rng.randint(100, 50_000)) / 100,
+                # Plenty, so cart and checkout scenarios measure the happy path
+                stock=rng.randint(1_000, 10_000),
+                category_id=rng.choice(category_ids),
+            )
+            for i in range(count)
+        ])
+    with transaction.atomic():
+        get_search_backend().rebuild()
+    product_ids = list(Product.objects.order_by('id').values_list('id', flat=True))
+
+    progress(f'{users} users with profiles and carts')
+    # Hashing is deliberately slow; every bench user shares one hash
+    password = make_password(PASSWORD)
+    for start, count in batches(users):
+        created = User.objects.bulk_create([
+            User(username=f'bench{start + i}', email=f'bench{start + i}@example.com', password=password)
+            for i in range(count)
+        ])
+        Profile.objects.bulk_create([Profile(user=user) for user in created])
+        Cart.objects.bulk_create([Cart(user=user) for user in created])
+    user_ids = list(User.objects.filter(username__startswith='bench').order_by('id').values_list('id', flat=True))
+
+    progress(f'{users * orders_per_user} orders')
+    prices = dict(Product.objects.values_list('id', 'price'))
+    orders_total = users * orders_per_user
+    for start, count in batches(orders_total):
+        lines = []
+        orders = []
+        for i in range(start, start + count):
+            picked = [(product_id, rng.randint(1, 3)) for product_id in rng.sample(product_ids, rng.randint(1, 4))]
+            lines.append(picked)
+            orders.append(Order(
+                user_id=user_ids[i % len(user_ids)], full_name='Bench Buyer', email='buyer@example.com',
+                address='Bench street 1', phone_number='000',
+                status=rng.choice(['pending', 'processing', 'shipped', 'delivered']),
+                total_amount=sum(prices[product_id] * quantity for product_id, quantity in picked),
+            ))
+        Order.objects.bulk_create(orders)
+        OrderItem.objects.bulk_create([
+            OrderItem(order=order, product_id=product_id, quantity=quantity, price=prices[product_id])
+            for order, picked in zip(orders, lines)
+            for product_id, quantity in picked
+        ])
+
+    return Dataset(category_ids, product_ids, user_ids, vocabulary=WORDS + NOUNS)
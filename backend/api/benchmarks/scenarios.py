@@ -0,0 +1,184 @@
+"""
+Request mixes driven through the real URL conf, middleware and views with
+DRF's test client.
+
+Each scenario yields (user id, method, path, body) tuples. ``run_scenario``
+sends them one at a time, timing each request and counting the SQL queries
+it ran, so query counts are exact and comparable between runs. Untimed setup
+a scenario needs (lines to update, carts to check out) happens in
+``prepare``.
+"""
+from django.contrib.auth.models import User
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+from rest_framework.test import APIClient
+
+from api.models import Cart, CartItem
+
+from .utils import Stopwatch, percentile, summarize
+
+CHECKOUT_DETAILS = {
+    'full_name': 'Bench Buyer', 'email': 'buyer@example.com', 'address': 'Bench street 1', 'phone_number': '000',
+}
+
+
+class Scenario:
+    name = None
+    # Read-only scenarios get warm-up requests before timing starts
+    read_only = True
+    ok_status = 200
+
+    def __init__(self, dataset, rng, count):
+        self.dataset = dataset
+        self.rng = rng
+        self.count = count
+
+    def prepare(self):
+        pass
+
+    def requests(self):
+        raise NotImplementedError
+
+
+class Browse(Scenario):
+    name = 'browse'
+
+    def requests(self):
+        for _ in range(self.count):
+            if self.rng.random() < 0.5:
+                path = f'/api/products/?page={self.rng.randint(1, 20)}'
+            else:
+                path = f'/api/products/?category={self.rng.choice(self.dataset.category_ids)}'
+            yield None, 'get', path, None
+
+
+class ProductDetail(Scenario):
+    name = 'product_detail'
+
+    def requests(self):
+        for _ in range(self.count):
+            yield None, 'get', f'/api/products/{self.rng.choice(self.dataset.product_ids)}/', None
+
+
+class Search(Scenario):
+    name = 'search'
+
+    def requests(self):
+        for _ in range(self.count):
+            terms = ' '.join(self.rng.sample(self.dataset.vocabulary, self.rng.randint(1, 2)))
+            yield None, 'get', f'/api/products/?search={terms}', None
+
+
+class CartAdd(Scenario):
+    name = 'cart_add'
+    read_only = False
+
+    def requests(self):
+        for _ in range(self.count):
+            body = {'product_id': self.rng.choice(self.dataset.product_ids), 'quantity': 1}
+            yield self.rng.choice(self.dataset.user_ids), 'post', '/api/cart/items/', body
+
+
+class CartUpdate(Scenario):
+    name = 'cart_update'
+    read_only = False
+
+    def prepare(self):
+        self.lines = list(
+            CartItem.objects.filter(cart__user_id__in=self.dataset.user_ids).values_list('cart__user_id', 'id')
+        )
+
+    def requests(self):
+        if not self.lines:
+            return
+        for _ in range(self.count):
+            user_id, line_id = self.rng.choice(self.lines)
+            yield user_id, 'put', f'/api/cart/items/{line_id}/', {'quantity': self.rng.randint(1, 3)}
+
+
+class Checkout(Scenario):
+    name = 'checkout'
+    read_only = False
+    ok_status = 201
+
+    def prepare(self):
+        # One cart per checkout: give the first ``count`` users a line or two to buy
+        self.buyers = self.dataset.user_ids[:self.count]
+        carts = dict(Cart.objects.filter(user_id__in=self.buyers).values_list('user_id', 'id'))
+        CartItem.objects.filter(cart_id__in=carts.values()).delete()
+        CartItem.objects.bulk_create([
+            CartItem(cart_id=carts[user_id], product_id=product_id, quantity=1)
+            for user_id in self.buyers
+            for product_id in self.rng.sample(self.dataset.product_ids, self.rng.randint(1, 3))
+        ])
+        Cart.objects.filter(pk__in=carts.values()).reconcile_totals()
+
+    def requests(self):
+        for user_id in self.buyers:
+            yield user_id, 'post', '/api/orders/', CHECKOUT_DETAILS
+
+
+class OrderHistory(Scenario):
+    name = 'order_history'
+
+    def requests(self):
+        for _ in range(self.count):
+            yield self.rng.choice(self.dataset.user_ids), 'get', '/api/orders/', None
+
+
+SCENARIOS = {
+    scenario.name: scenario
+    for scenario in (Browse, ProductDetail, Search, CartAdd, CartUpdate, Checkout, OrderHistory)
+}
+
+
+class Users:
+    """Users by id, loaded once; the client authenticates as them without a token round trip."""
+
+    def __init__(self):
+        self.loaded = {}
+
+    def __getitem__(self, user_id):
+        if user_id not in self.loaded:
+            self.loaded[user_id] = User.objects.get(pk=user_id)
+        return self.loaded[user_id]
+
+
+def run_scenario(scenario, warmup=0, users=None):
+    """Run ``scenario``'s requests; returns summarize() figures plus query counts and errors."""
+    users = users or Users()
+    client = APIClient()
+    scenario.prepare()
+    requests = list(scenario.requests())
+    # Load the users up front so their lookups aren't timed or counted
+    for user_id, *_ in requests:
+        if user_id:
+            users[user_id]
+
+    def send(user_id, method, path, body):
+        client.force_authenticate(users[user_id] if user_id else None)
+        if body is None:
+            return getattr(client, method)(path)
+        return getattr(client, method)(path, body, format='json')
+
+    if scenario.read_only:
+        for request in requests[:warmup]:
+            send(*request)
+
+    latencies, queries, errors = [], [], 0
+    with Stopwatch() as wall:
+        for request in requests:
+            with CaptureQueriesContext(connection) as captured, Stopwatch() as timer:
+                response = send(*request)
+            latencies.append(timer.elapsed)
+            queries.append(len(captured))
+            if response.status_code != scenario.ok_status:
+                errors += 1
+
+    figures = summarize(latencies, wall.elapsed)
+    figures.update(
+        queries_p50=percentile(queries, 50),
+        queries_max=max(queries, default=0),
+        errors=errors,
+    )
+    return figures
@@ -0,0 +1,68 @@
+import contextlib
+import math
+import os
+import shutil
+import tempfile
+import time
+
+from django.db import connections
+from django.test.utils import setup_test_environment, teardown_test_environment
+
+
+@contextlib.contextmanager
+def scratch_database(alias='default', verbosity=0):
+    """
+    Create and migrate a disposable database for a benchmark run.
+
+    SQLite gets a temporary file rather than the usual in-memory test database
+    so that worker threads share it and wait on its lock like a real deployment.
+    """
+    connection = connections[alias]
+    test_settings = connection.settings_dict.setdefault('TEST', {})
+    tmpdir = None
+    if connection.vendor == 'sqlite' and not test_settings.get('NAME'):
+        tmpdir = tempfile.mkdtemp(prefix='bench-')
+        test_settings['NAME'] = os.path.join(tmpdir, 'bench.sqlite3')
+
+    setup_test_environment()
+    old_name = connection.creation.create_test_db(verbosity=verbosity, autoclobber=True, serialize=False)
+    try:
+        yield connection
+    finally:
+        connections.close_all()
+        connection.creation.destroy_test_db(old_name, verbosity=verbosity)
+        teardown_test_environment()
+        if tmpdir:
+            test_settings.pop('NAME', None)
+            shutil.rmtree(tmpdir, ignore_errors=True)
+
+
+def percentile(samples, pct):
+    """Nearest-rank percentile of a list of numbers (0 for an empty list)."""
+    if not samples:
+        return 0
+    ordered = sorted(samples)
+    rank = max(1, math.ceil(pct / 100 * len(ordered)))
+    return ordered[rank - 1]
+
+
+def summarize(latencies, elapsed):
+    """Throughput and latency percentiles (in ms) for a list of per-call durations in seconds."""
+    return {
+        'count': len(latencies),
+        'throughput': len(latencies) / elapsed if elapsed else 0,
+        'p50_ms': percentile(latencies, 50) * 1000,
+        'p95_ms': percentile(latencies, 95) * 1000,
+        'p99_ms': percentile(latencies, 99) * 1000,
+    }
+
+
+class Stopwatch:
+    """Context manager recording the wall time of its block in ``elapsed``."""
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self.elapsed = time.perf_counter() - self.start
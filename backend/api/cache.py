@@ -0,0 +1,143 @@
+import hashlib
+import time
+
+from django.conf import settings
+from django.core.cache import caches
+from django.db import transaction
+from rest_framework.response import Response
+
+from .db_router import primary_reads
+
+# Query parameters that change catalog responses; anything else is ignored in the key
+CACHE_QUERY_PARAMS = (
+    'category', 'search', 'min_price', 'max_price',
+    'page', 'page_size', 'cursor', 'ordering', 'pagination', 'limit',
+)
+GENERATION_KEY = 'catalog:gen:{}'
+# When the generation last moved, for Last-Modified
+GENERATION_TIME_KEY = 'catalog:gen:{}:at'
+STATS_KEY = 'catalog:stats:{}'
+
+
+def get_cache():
+    return caches[getattr(settings, 'CATALOG_CACHE_ALIAS', 'default')]
+
+
+def _incr(key, initial=1):
+    cache = get_cache()
+    try:
+        return cache.incr(key)
+    except ValueError:
+        # Missing (never set or evicted): seed it, or count it if another process just did
+        if cache.add(key, initial, timeout=None):
+            return initial
+        return cache.incr(key)
+
+
+def get_generations(models):
+    """Current generation of each model label, in the order given."""
+    cache = get_cache()
+    keys = [GENERATION_KEY.format(model) for model in models]
+    generations = cache.get_many(keys)
+    for key in keys:
+        if key not in generations:
+            # Start from the clock rather than 0 so an evicted counter can't
+            # come back to a value that old cache entries were keyed on
+            cache.add(key, time.time_ns(), timeout=None)
+            generations[key] = cache.get(key)
+    return [generations[key] for key in keys]
+
+
+def _bump(model):
+    # Seeded from the clock like get_generations, should the counter have been evicted
+    _incr(GENERATION_KEY.format(model), initial=time.time_ns())
+    # Dated after the counter moves: a response built in between is dated before the change, never after
+    get_cache().set(GENERATION_TIME_KEY.format(model), time.time(), timeout=None)
+
+
+def bump_generation(model):
+    """Invalidate every cached response that depends on the model, in O(1)."""
+    transaction.on_commit(lambda: _bump(model))
+
+
+def last_modified(models):
+    """When the generation of any of the model labels last moved, as a Unix timestamp."""
+    cache = get_cache()
+    keys = [GENERATION_TIME_KEY.format(model) for model in models]
+    times = cache.get_many(keys)
+    for key in keys:
+        if key not in times:
+            # Never bumped or evicted: count it as changed now
+            cache.add(key, time.time(), timeout=None)
+            times[key] = cache.get(key)
+    return max(times.values())
+
+
+def record(outcome):
+    _incr(STATS_KEY.format(outcome))
+
+
+def cache_stats():
+    values = get_cache().get_many([STATS_KEY.format('hit'), STATS_KEY.format('miss')])
+    hits = values.get(STATS_KEY.format('hit'), 0)
+    misses = values.get(STATS_KEY.format('miss'), 0)
+    lookups = hits + misses
+    return {'hits': hits, 'misses': misses, 'hit_rate': hits / lookups if lookups else 0.0}
+
+
+def reset_stats():
+    get_cache().delete_many([STATS_KEY.format('hit'), STATS_KEY.format('miss')])
+
+
+def catalog_cache_key(request, models):
+    params = sorted(
+        (name, value)
+        for name in CACHE_QUERY_PARAMS
+        for value in request.query_params.getlist(name)
+    )
+    generations = '.'.join(str(g) for g in get_generations(models))
+    # The host is part of the key because paginated responses contain absolute links
+    raw = f'{request.get_host()}{request.path}?{params}'
+    return f'catalog:{generations}:{hashlib.sha1(raw.encode()).hexdigest()}'
+
+
+class CatalogCacheMixin:
+    """
+    Serve GET list/retrieve responses from the cache until the models they are
+    built from change.
+
+    Keys embed a generation counter per model in ``cache_models``, bumped by the
+    save/delete signals, so one cache write invalidates every page and filter
+    combination at once and stale entries simply age out. Misses are rebuilt
+    from the primary database even in views reading from a replica.
+    """
+    cache_models = ('product', 'category')
+    cache_anonymous_only = False
+
+    def should_cache(self, request):
+        if request.method != 'GET':
+            return False
+        return not (self.cache_anonymous_only and request.user.is_authenticated)
+
+    def cached(self, request, build):
+        if not self.should_cache(request):
+            return build()
+        cache = get_cache()
+        key = catalog_cache_key(request, self.cache_models)
+        data = cache.get(key)
+        if data is not None:
+            record('hit')
+            return Response(data)
+        record('miss')
+        # Every later request gets this entry: don't fill it from a replica that may lag the generation
+        with primary_reads():
+            response = build()
+        if response.status_code == 200:
+            cache.set(key, response.data, getattr(settings, 'CATALOG_CACHE_TIMEOUT', 300))
+        return response
+
+    def list(self, request, *args, **kwargs):
+        return self.cached(request, lambda: super(CatalogCacheMixin, self).list(request, *args, **kwargs))
+
+    def retrieve(self, request, *args, **kwargs):
+        return self.cached(request, lambda: super(CatalogCacheMixin, self).retrieve(request, *args, **kwargs))
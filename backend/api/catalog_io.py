@@ -0,0 +1,255 @@
+"""
+Bulk catalog export and import.
+
+Both directions stream: exports read products with ``iterator(chunk_size=...)``
+and yield one encoded line at a time, and imports read the input a line at a
+time and upsert it in fixed-size chunks keyed on ``Product.sku``. Memory use
+depends on the chunk size, not on the size of the catalog.
+
+An import only writes the columns its rows have, so a file of sku and price
+reprices products without touching their stock. New products get the model
+defaults for the rest, and must have every column without one. The stock of
+sharded products is set through their shards.
+"""
+import csv
+import json
+from dataclasses import dataclass, field
+from itertools import islice
+
+from django.core.exceptions import ValidationError
+from django.db import transaction
+from django.utils import timezone
+
+from .cache import bump_generation
+from .inventory import set_sharding
+from .jobs import enqueue
+from .models import Category, Product
+from .search import get_search_backend
+
+EXPORT_FIELDS = ('sku', 'name', 'description', 'price', 'stock', 'is_active', 'category', 'image_url')
+# Columns written straight to Product; 'category' is a name resolved to a Category row
+PRODUCT_FIELDS = ('name', 'description', 'price', 'stock', 'is_active', 'image_url')
+EXPORT_FORMATS = ('ndjson', 'csv')
+CONTENT_TYPES = {'ndjson': 'application/x-ndjson', 'csv': 'text/csv'}
+DEFAULT_CHUNK_SIZE = 2000
+MAX_REPORTED_ERRORS = 100
+
+
+def export_rows(queryset=None, chunk_size=DEFAULT_CHUNK_SIZE):
+    """Yield one dict per product in EXPORT_FIELDS order, reading ``chunk_size`` rows at a time."""
+    if queryset is None:
+        queryset = Product.objects.all()
+    rows = (
+        queryset.order_by('id')
+        .values_list('sku', *PRODUCT_FIELDS, 'category__name')
+        .iterator(chunk_size=chunk_size)
+    )
+    for sku, name, description, price, stock, is_active, image_url, category in rows:
+        yield {
+            'sku': sku,
+            'name': name,
+            'description': description,
+            'price': str(price),
+            'stock': stock,
+            'is_active': is_active,
+            'category': category,
+            'image_url': image_url,
+        }
+
+
+class _Echo:
+    """File-like object whose write() hands back the line instead of buffering it."""
+
+    def write(self, value):
+        return value
+
+
+def render_ndjson(rows):
+    for row in rows:
+        yield json.dumps(row, ensure_ascii=False) + '\n'
+
+
+def render_csv(rows):
+    writer = csv.writer(_Echo())
+    yield writer.writerow(EXPORT_FIELDS)
+    for row in rows:
+        yield writer.writerow(['' if row[name] is None else row[name] for name in EXPORT_FIELDS])
+
+
+RENDERERS = {'ndjson': render_ndjson, 'csv': render_csv}
+
+
+def read_ndjson(lines):
+    """Yield (line number, row dict) from an iterable of NDJSON lines, skipping blank ones."""
+    for number, line in enumerate(lines, start=1):
+        if line.strip():
+            try:
+                yield number, json.loads(line)
+            except ValueError as exc:
+                yield number, exc
+
+
+def read_csv(lines):
+    """Yield (line number, row dict) from an iterable of CSV lines with a header row."""
+    reader = csv.DictReader(lines)
+    for row in reader:
+        yield reader.line_num, row
+
+
+READERS = {'ndjson': read_ndjson, 'csv': read_csv}
+
+
+@dataclass
+class ImportResult:
+    rows: int = 0
+    upserted: int = 0
+    categories_created: int = 0
+    errors: list = field(default_factory=list)
+    error_count: int = 0
+
+    def add_error(self, line, message):
+        self.error_count += 1
+        if len(self.errors) < MAX_REPORTED_ERRORS:
+            self.errors.append({'line': line, 'error': message})
+
+
+def _clean(name, value):
+    model_field = Product._meta.get_field(name)
+    if value == '' and model_field.null:
+        value = None
+    return model_field.clean(value, None)
+
+
+def parse_row(row):
+    """
+    Validate one input row; returns (sku, values) with a value for each column
+    the row has, 'category' being a category name.
+    """
+    if not isinstance(row, dict):
+        raise ValidationError('Expected an object per line.')
+    sku = _clean('sku', row.get('sku'))
+    if not sku:
+        raise ValidationError('sku is required.')
+    values = {name: _clean(name, row[name]) for name in PRODUCT_FIELDS if name in row}
+    if 'category' in row:
+        values['category'] = (row['category'] or '').strip() or None
+    return sku, values
+
+
+def new_product_values(values):
+    """A row's values completed with the model defaults, for a product it creates."""
+    defaults = {
+        name: _clean(name, Product._meta.get_field(name).get_default())
+        for name in PRODUCT_FIELDS if name not in values
+    }
+    return {**defaults, **values}
+
+
+class CatalogImporter:
+    """
+    Upserts products by sku in chunks of ``chunk_size`` rows, one transaction
+    per chunk. Category names are resolved once per chunk, creating the ones
+    that don't exist yet, and remembered for the rest of the import.
+    """
+
+    def __init__(self, chunk_size=DEFAULT_CHUNK_SIZE):
+        self.chunk_size = chunk_size
+        self.categories = {}
+        self.result = ImportResult()
+
+    def run(self, numbered_rows, progress=None):
+        numbered_rows = iter(numbered_rows)
+        while chunk := list(islice(numbered_rows, self.chunk_size)):
+            self.import_chunk(chunk)
+            if progress:
+                progress(self.result)
+        if self.result.upserted:
+            bump_generation('product')
+            enqueue('rankings.refresh', unique=True)
+        return self.result
+
+    def import_chunk(self, chunk):
+        parsed = {}
+        for line, row in chunk:
+            self.result.rows += 1
+            if isinstance(row, Exception):
+                self.result.add_error(line, f'Invalid JSON: {row}')
+                continue
+            try:
+                sku, values = parse_row(row)
+            except ValidationError as exc:
+                self.result.add_error(line, '; '.join(exc.messages))
+                continue
+            # A sku repeated within a chunk keeps its last row, as if applied in order
+            parsed[sku] = (line, values)
+        if not parsed:
+            return
+
+        with transaction.atomic():
+            existing = {
+                sku: (pk, shards)
+                for sku, pk, shards in Product.objects.select_for_update()
+                .filter(sku__in=list(parsed)).values_list('sku', 'id', 'stock_shards')
+            }
+            self.resolve_categories({values['category'] for _, values in parsed.values() if values.get('category')})
+            created, updated, restocked, repriced = [], {}, [], []
+            for sku, (line, values) in parsed.items():
+                if sku not in existing:
+                    try:
+                        created.append(self.product(sku, new_product_values(values)))
+                    except ValidationError as exc:
+                        self.result.add_error(line, '; '.join(exc.messages))
+                    continue
+                pk, shards = existing[sku]
+                if 'price' in values:
+                    repriced.append(pk)
+                if shards and 'stock' in values:
+                    # Product.stock is only a copy of the shards' total
+                    values = dict(values)
+                    restocked.append((pk, values.pop('stock')))
+                product = self.product(sku, values)
+                product.pk = pk
+                # Rows with the same columns are updated together, and only those columns
+                updated.setdefault(tuple(sorted(values)), []).append(product)
+
+            Product.objects.bulk_create(
+                created,
+                update_conflicts=True,
+                unique_fields=['sku'],
+                update_fields=[*PRODUCT_FIELDS, 'category', 'updated_at'],
+            )
+            now = timezone.now()
+            for columns, products in updated.items():
+                for product in products:
+                    product.updated_at = now
+                Product.objects.bulk_update(products, [*columns, 'updated_at'])
+            for pk, stock in restocked:
+                set_sharding(pk, stock=stock)
+
+            # Bulk writes skip the model signals: refresh the search index, and have the
+            # worker update the stored totals of carts holding a product that may have been repriced
+            written = [product.sku for product in created] + list(existing)
+            get_search_backend().index(list(Product.objects.filter(sku__in=written).only('id', 'name', 'description')))
+            if repriced:
+                enqueue('carts.reprice', {'product_ids': repriced})
+        self.result.upserted += len(written)
+
+    def product(self, sku, values):
+        values = dict(values)
+        if 'category' in values:
+            values['category_id'] = self.categories.get(values.pop('category'))
+        return Product(sku=sku, **values)
+
+    def resolve_categories(self, names):
+        missing = names.difference(self.categories)
+        if not missing:
+            return
+        for pk, name in Category.objects.filter(name__in=missing).order_by('-id').values_list('id', 'name'):
+            # Names aren't unique; the lowest id wins, matching what the admin lists first
+            self.categories[name] = pk
+        new = missing.difference(self.categories)
+        if new:
+            Category.objects.bulk_create([Category(name=name) for name in sorted(new)])
+            self.categories.update(Category.objects.filter(name__in=new).values_list('name', 'id'))
+            self.result.categories_created += len(new)
+            bump_generation('category')
@@ -0,0 +1,54 @@
+import hashlib
+import time
+
+from django.utils.cache import get_conditional_response
+from django.utils.http import http_date
+
+from .cache import catalog_cache_key, last_modified
+from .db_router import tracking_replica_reads
+
+
+class ConditionalGetMixin:
+    """
+    Add ETag and Last-Modified to GET list/retrieve responses and answer
+    matching conditional requests with 304 Not Modified.
+
+    The ETag is built like the response cache key: the cache generations of
+    ``cache_models`` (bumped by every save or delete, see api.cache) plus the
+    normalized URL. Last-Modified is the time of the latest of those bumps.
+    Neither runs a query, so a 304 costs neither the page query nor
+    serialization, and a cache hit no extra scan. A response read from a
+    replica gets neither: the replica may not have caught up with the
+    generations they stand for.
+    """
+
+    def get_etag(self, request):
+        # The same rows render differently per renderer; host and URL are part of the key
+        fingerprint = f'{catalog_cache_key(request, self.cache_models)}|{request.accepted_renderer.media_type}'
+        return f'"{hashlib.sha1(fingerprint.encode()).hexdigest()}"'
+
+    def get_last_modified(self):
+        modified_at = int(last_modified(self.cache_models))
+        # HTTP dates have whole seconds: until the second of the change is over, a later change could share it
+        return modified_at if time.time() >= modified_at + 1 else None
+
+    def conditional(self, request, build):
+        etag = self.get_etag(request)
+        modified_at = self.get_last_modified()
+        with tracking_replica_reads() as replica_read:
+            response = get_conditional_response(request, etag=etag, last_modified=modified_at)
+            if response is None:
+                response = build()
+        if response.status_code in (200, 304) and not replica_read[0]:
+            response['ETag'] = etag
+            if modified_at is not None:
+                response['Last-Modified'] = http_date(modified_at)
+        return response
+
+    def list(self, request, *args, **kwargs):
+        return self.conditional(request, lambda: super(ConditionalGetMixin, self).list(request, *args, **kwargs))
+
+    def retrieve(self, request, *args, **kwargs):
+        return self.conditional(
+            request, lambda: super(ConditionalGetMixin, self).retrieve(request, *args, **kwargs)
+        )
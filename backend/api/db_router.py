@@ -0,0 +1,132 @@
+"""
+Read-replica routing for the catalog.
+
+Views using ``ReplicaReadMixin`` (products, categories, featured products)
+send their GET reads to one of the DATABASE_REPLICAS aliases; everything
+else, and every write, goes to the primary. After a user writes (adding to
+the cart, checking out) ``PrimaryPinningMiddleware`` pins that user's reads
+to the primary for REPLICA_PIN_SECONDS, so they don't see stale stock or
+prices while the replicas catch up.
+
+A replica can lag the primary, so nothing read from one outlives the
+request: the catalog cache rebuilds its entries from the primary (see
+``primary_reads``), and responses read from a replica carry no ETag or
+Last-Modified, which stand for the current cache generations.
+
+With no replicas configured the router returns None and Django uses the
+default database, so a single-database deployment behaves as before. To try
+it locally, point DB_REPLICAS at a couple of SQLite files. Under the test
+runner the replica aliases mirror the test database; test routing from a
+TransactionTestCase, since a TestCase's open transaction on the primary is
+invisible to (and locks out) the replica connections.
+"""
+import contextlib
+import contextvars
+import random
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import DEFAULT_DB_ALIAS, connections
+from rest_framework.permissions import SAFE_METHODS
+
+_read_alias = contextvars.ContextVar('replica_read_alias', default=None)
+_wrote = contextvars.ContextVar('primary_wrote', default=None)
+_replica_read = contextvars.ContextVar('replica_read', default=None)
+
+
+def replica_aliases():
+    return [alias for alias in getattr(settings, 'DATABASE_REPLICAS', ()) if alias in settings.DATABASES]
+
+
+def _pin_key(user_id):
+    return f'db:pin:{user_id}'
+
+
+def pin_to_primary(user_id):
+    cache.set(_pin_key(user_id), True, timeout=getattr(settings, 'REPLICA_PIN_SECONDS', 5))
+
+
+def is_pinned(user_id):
+    return user_id is not None and cache.get(_pin_key(user_id)) is not None
+
+
+class ReplicaRouter:
+    def db_for_read(self, model, **hints):
+        alias = _read_alias.get()
+        # Reads inside a transaction on the primary must see its uncommitted writes
+        if alias is None or connections[DEFAULT_DB_ALIAS].in_atomic_block:
+            return None
+        read = _replica_read.get()
+        if read is not None:
+            read[0] = True
+        return alias
+
+    def db_for_write(self, model, **hints):
+        wrote = _wrote.get()
+        if wrote is not None:
+            wrote[0] = True
+        return DEFAULT_DB_ALIAS
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # Replicas hold the same data as the primary
+        return True
+
+
+@contextlib.contextmanager
+def primary_reads():
+    """Send the block's reads to the primary, for data that is kept beyond the request."""
+    token = _read_alias.set(None)
+    try:
+        yield
+    finally:
+        _read_alias.reset(token)
+
+
+@contextlib.contextmanager
+def tracking_replica_reads():
+    """Yield a one-item list that is set to True if a read in the block goes to a replica."""
+    read = [False]
+    token = _replica_read.set(read)
+    try:
+        yield read
+    finally:
+        _replica_read.reset(token)
+
+
+class ReplicaReadMixin:
+    """Serve the view's GET requests from a replica unless the user is pinned to the primary."""
+
+    def initial(self, request, *args, **kwargs):
+        super().initial(request, *args, **kwargs)
+        replicas = replica_aliases()
+        if replicas and request.method in SAFE_METHODS and not is_pinned(request.user.id):
+            self._replica_token = _read_alias.set(random.choice(replicas))
+
+    def finalize_response(self, request, response, *args, **kwargs):
+        token = getattr(self, '_replica_token', None)
+        if token is not None:
+            _read_alias.reset(token)
+            self._replica_token = None
+        return super().finalize_response(request, response, *args, **kwargs)
+
+
+class PrimaryPinningMiddleware:
+    """Pin the requesting user's reads to the primary for a while after a request that wrote."""
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        if not replica_aliases():
+            return self.get_response(request)
+        wrote = [False]
+        token = _wrote.set(wrote)
+        try:
+            response = self.get_response(request)
+        finally:
+            _wrote.reset(token)
+        # DRF copies the user it authenticated onto the underlying request
+        user_id = getattr(getattr(request, 'user', None), 'id', None)
+        if wrote[0] and user_id is not None:
+            pin_to_primary(user_id)
+        return response
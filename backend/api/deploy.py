@@ -0,0 +1,306 @@
+"""
+Deployments triggered by the webhook, run in the background by the job worker.
+
+The webhook records a Deployment, queues a ``deploy.run`` job and answers
+202 straight away. The job takes the deploy lock (at most one Deployment
+may be running, enforced by a constraint) and runs the steps in order,
+appending their output to ``Deployment.log`` as it arrives and recording
+each step's status and duration:
+
+- pull: ``git pull`` of DEPLOY_BRANCH
+- install: ``pip install -r requirements.txt``, only if it changed
+- migrate: ``manage.py migrate``, only if a migration changed
+- reload: the PythonAnywhere reload API, when PA_API_TOKEN is set
+
+Changes are counted since the revision of the last successful deployment,
+so whatever a failed one pulled is still installed and migrated by the
+next. When HEAD is still that revision everything after the pull is
+skipped; with no successful deployment yet every step runs. A step that
+fails (or runs longer than DEPLOY_STEP_TIMEOUT) fails the deployment.
+The worker itself keeps running the code it started with; restart
+``run_jobs`` after deploys that change job handlers.
+"""
+import contextlib
+import datetime
+import logging
+import os
+import subprocess
+import sys
+import threading
+import time
+
+import requests
+from django.conf import settings
+from django.db import IntegrityError, transaction
+from django.db.models import Value
+from django.db.models.functions import Concat
+from django.utils import timezone
+
+from .jobs import enqueue
+from .models import Deployment
+
+logger = logging.getLogger(__name__)
+
+PA_API_TOKEN = os.environ.get('PA_API_TOKEN')
+PA_USERNAME = 'SyncWIvan' # Your PythonAnywhere username
+PA_WEBAPP_DOMAIN = 'syncwivan.pythonanywhere.com' # Your webapp domain
+
+REQUIREMENTS = 'requirements.txt'
+# How long a deployment waits before trying the lock again
+LOCK_RETRY_SECONDS = 30
+# Output is written to the log at most this often while a command runs
+FLUSH_SECONDS = 1.0
+
+STEPS = ('pull', 'install', 'migrate', 'reload')
+# Step statuses
+DONE = 'done'
+SKIPPED = 'skipped'
+FAILED = 'failed'
+RUNNING = 'running'
+
+
+class StepFailed(Exception):
+    pass
+
+
+def repo_dir():
+    # BASE_DIR is 'backend', the repository is its parent
+    return os.path.dirname(settings.BASE_DIR)
+
+
+def python_executable():
+    # The worker runs in the deployed virtualenv
+    return getattr(settings, 'DEPLOY_PYTHON', None) or sys.executable
+
+
+def step_timeout():
+    return getattr(settings, 'DEPLOY_STEP_TIMEOUT', 300)
+
+
+def request_deployment():
+    """The deployment that will pick up the latest push: a queued one, or a new one. Returns (deployment, created)."""
+    with transaction.atomic():
+        queued = Deployment.objects.filter(status=Deployment.QUEUED).order_by('pk').first()
+        if queued is not None:
+            return queued, False
+        deployment = Deployment.objects.create()
+        # Never retried automatically: a failed deploy needs a look, or a new push
+        enqueue('deploy.run', {'deployment_id': deployment.pk}, max_attempts=1)
+    return deployment, True
+
+
+def last_deployed_revision():
+    """The revision the last successful deployment left checked out, or None."""
+    return (
+        Deployment.objects.filter(status=Deployment.SUCCEEDED).exclude(revision_after='')
+        .order_by('-finished_at', '-pk').values_list('revision_after', flat=True).first()
+    )
+
+
+def run_deployment(deployment_id):
+    deployment = Deployment.objects.filter(pk=deployment_id).first()
+    if deployment is None or deployment.status in (Deployment.SUCCEEDED, Deployment.FAILED):
+        return
+    now = timezone.now()
+    stale_before = now - len(STEPS) * datetime.timedelta(seconds=step_timeout())
+    if deployment.status == Deployment.RUNNING and deployment.started_at > stale_before:
+        # Requeued after its worker died mid-deploy; the next deployment fails it once it's stale
+        return
+    # A deployment still marked running long after it started lost its worker; release its lock
+    Deployment.objects.filter(status=Deployment.RUNNING, started_at__lt=stale_before).exclude(
+        pk=deployment_id
+    ).update(status=Deployment.FAILED, finished_at=now)
+    try:
+        with transaction.atomic():
+            Deployment.objects.filter(pk=deployment_id).update(
+                status=Deployment.RUNNING, started_at=now, steps=[], log=''
+            )
+    except IntegrityError:
+        logger.info('Deployment #%s waiting for the one in progress', deployment_id)
+        enqueue(
+            'deploy.run', {'deployment_id': deployment_id},
+            delay=datetime.timedelta(seconds=LOCK_RETRY_SECONDS), max_attempts=1,
+        )
+        return
+
+    runner = Runner(deployment_id)
+    try:
+        runner.deploy()
+    except Exception as exc:
+        logger.error('Deployment #%s failed: %s', deployment_id, exc)
+        runner.write(f'Deployment failed: {exc}\n')
+        outcome = Deployment.FAILED
+    else:
+        logger.info('Deployment #%s finished', deployment_id)
+        outcome = Deployment.SUCCEEDED
+    runner.flush()
+    Deployment.objects.filter(pk=deployment_id).update(status=outcome, finished_at=timezone.now())
+
+
+class Runner:
+    """Runs the steps of one deployment, keeping its log and steps up to date in the database."""
+
+    def __init__(self, deployment_id):
+        self.deployment_id = deployment_id
+        self.steps = []
+        self.pending = []
+        self.flushed_at = time.monotonic()
+
+    def deploy(self):
+        with self.step('pull'):
+            before = self.capture(['git', 'rev-parse', 'HEAD'])
+            self.command(['git', 'pull', 'origin', getattr(settings, 'DEPLOY_BRANCH', 'main')])
+            after = self.capture(['git', 'rev-parse', 'HEAD'])
+            Deployment.objects.filter(pk=self.deployment_id).update(revision_before=before, revision_after=after)
+
+        deployed = last_deployed_revision()
+        if deployed == after:
+            for name in STEPS[1:]:
+                self.skip(name, f'already deployed at {after[:12]}')
+            return
+        changed = self.changed_files(deployed, after)
+
+        if changed is None or REQUIREMENTS in changed:
+            with self.step('install'):
+                requirements = os.path.join(repo_dir(), REQUIREMENTS)
+                self.command([python_executable(), '-m', 'pip', 'install', '-r', requirements])
+        else:
+            self.skip('install', f'{REQUIREMENTS} unchanged')
+
+        if changed is None or any('/migrations/' in path and path.endswith('.py') for path in changed):
+            with self.step('migrate'):
+                manage = os.path.join(settings.BASE_DIR, 'manage.py')
+                self.command([python_executable(), manage, 'migrate', '--noinput'])
+        else:
+            self.skip('migrate', 'no migrations changed')
+
+        if PA_API_TOKEN:
+            with self.step('reload') as entry:
+                entry['detail'] = self.reload()
+        else:
+            self.skip('reload', 'PA_API_TOKEN not set')
+
+    # Steps
+
+    @contextlib.contextmanager
+    def step(self, name):
+        entry = {'name': name, 'status': RUNNING, 'seconds': None, 'detail': ''}
+        self.steps.append(entry)
+        self.save_steps()
+        self.write(f'--- {name} ---\n')
+        started = time.perf_counter()
+        try:
+            yield entry
+        except Exception as exc:
+            entry.update(status=FAILED, detail=str(exc))
+            raise
+        else:
+            entry['status'] = DONE
+        finally:
+            entry['seconds'] = round(time.perf_counter() - started, 2)
+            self.flush()
+            self.save_steps()
+
+    def skip(self, name, reason):
+        self.steps.append({'name': name, 'status': SKIPPED, 'seconds': 0, 'detail': reason})
+        self.write(f'--- {name}: skipped, {reason} ---\n')
+        self.save_steps()
+
+    def save_steps(self):
+        Deployment.objects.filter(pk=self.deployment_id).update(steps=self.steps)
+
+    # Output
+
+    def write(self, text):
+        self.pending.append(text)
+        if time.monotonic() - self.flushed_at >= FLUSH_SECONDS:
+            self.flush()
+
+    def flush(self):
+        if self.pending:
+            text, self.pending = ''.join(self.pending), []
+            Deployment.objects.filter(pk=self.deployment_id).update(log=Concat('log', Value(text)))
+        self.flushed_at = time.monotonic()
+
+    # Commands
+
+    def command(self, args):
+        """Run ``args`` in the repository, streaming its output into the log."""
+        self.write(f"$ {' '.join(args)}\n")
+        process = subprocess.Popen(
+            args, cwd=repo_dir(), stdout=subprocess.PIPE, stderr=subprocess.STDOUT, text=True, bufsize=1,
+        )
+        timed_out = threading.Event()
+
+        def kill():
+            timed_out.set()
+            process.kill()
+
+        timer = threading.Timer(step_timeout(), kill)
+        timer.start()
+        try:
+            for line in process.stdout:
+                self.write(line)
+            returncode = process.wait()
+        finally:
+            timer.cancel()
+        if timed_out.is_set():
+            raise StepFailed(f"{args[0]} timed out after {step_timeout()}s")
+        if returncode:
+            raise StepFailed(f"{' '.join(args[:2])} exited with status {returncode}")
+
+    def changed_files(self, deployed, after):
+        """Paths changed since the ``deployed`` revision, or None when there is nothing to compare with."""
+        if not deployed:
+            self.write('No earlier successful deployment: running every step\n')
+            return None
+        try:
+            return self.capture(['git', 'diff', '--name-only', deployed, after]).splitlines()
+        except StepFailed:
+            # History rewritten since, say by a force push
+            self.write(f'Cannot compare with {deployed[:12]}: running every step\n')
+            return None
+
+    def capture(self, args):
+        """Run a short git query and return its output."""
+        result = subprocess.run(args, cwd=repo_dir(), capture_output=True, text=True, timeout=60)
+        if result.returncode:
+            self.write(result.stderr)
+            raise StepFailed(f"{' '.join(args[:2])} exited with status {result.returncode}")
+        return result.stdout.strip()
+
+    def reload(self):
+        reload_url = f"https://www.pythonanywhere.com/api/v0/user/{PA_USERNAME}/webapps/{PA_WEBAPP_DOMAIN}/reload/"
+        self.write(f'POST {reload_url}\n')
+        try:
+            response = requests.post(reload_url, headers={'Authorization': f'Token {PA_API_TOKEN}'}, timeout=30)
+        except requests.exceptions.RequestException as exc:
+            # The code is deployed either way; the old processes keep serving until a manual reload
+            logger.warning('PythonAnywhere reload failed: %s', exc)
+            return f'reload request failed: {exc}'
+        self.write(f'{response.status_code} {response.text[:500]}\n')
+        if response.status_code != 200:
+            logger.warning('PythonAnywhere reload returned %s', response.status_code)
+            return f'reload API returned {response.status_code}'
+        return ''
+
+
+# Status
+
+def describe(deployment, offset=0):
+    """JSON-ready state of a deployment, with its log from character ``offset`` on."""
+    finished_or_now = deployment.finished_at or timezone.now()
+    return {
+        'id': deployment.pk,
+        'status': deployment.status,
+        'revision_before': deployment.revision_before,
+        'revision_after': deployment.revision_after,
+        'created_at': deployment.created_at,
+        'started_at': deployment.started_at,
+        'finished_at': deployment.finished_at,
+        'seconds': round((finished_or_now - deployment.started_at).total_seconds(), 2) if deployment.started_at else None,
+        'steps': deployment.steps,
+        'log': deployment.log[offset:],
+        'log_offset': len(deployment.log),
+    }
+
@@ -0,0 +1,245 @@
+"""
+Read-only serializers that build response dicts straight from ``.values()`` rows.
+
+They skip DRF's per-field machinery (model instances, nested serializer
+instances, field binding) but must produce exactly the JSON the regular
+serializers do; ``bench_serializers`` checks that byte for byte. When a
+field is added to ProductSerializer, OrderSerializer or CartSerializer, add
+it here too.
+"""
+import decimal
+from collections import defaultdict
+from operator import itemgetter
+
+from django.conf import settings
+from django.http import Http404
+from django.utils import timezone
+from rest_framework.response import Response
+
+from .images import image_set
+from .metrics import serializer_timer
+from .models import Cart, CartItem, OrderItem
+
+
+def decimal_string(decimal_places, max_digits):
+    """Same output as a DRF DecimalField with COERCE_DECIMAL_TO_STRING."""
+    quantum = decimal.Decimal('.1') ** decimal_places
+    context = decimal.Context(prec=max_digits)
+
+    def convert(value):
+        if value is None:
+            return ''
+        return '{:f}'.format(value.quantize(quantum, context=context))
+    return convert
+
+
+def iso_datetime(value):
+    """Same output as a DRF DateTimeField in ISO 8601 mode."""
+    if not value:
+        return None
+    if settings.USE_TZ:
+        value = value.astimezone(timezone.get_current_timezone())
+    value = value.isoformat()
+    if value.endswith('+00:00'):
+        value = value[:-6] + 'Z'
+    return value
+
+
+price_string = decimal_string(decimal_places=2, max_digits=10)
+
+
+class RowSerializer:
+    """
+    Maps ``.values()`` rows to output dicts.
+
+    ``fields`` lists (output key, values() lookup, converter or None) in output
+    order; the accessors are compiled once per class.
+    """
+    fields = ()
+
+    def __init_subclass__(cls, **kwargs):
+        super().__init_subclass__(**kwargs)
+        cls.lookups = tuple(lookup for _, lookup, _ in cls.fields)
+        cls.accessors = tuple(
+            (key, itemgetter(lookup) if convert is None else _converted(itemgetter(lookup), convert))
+            for key, lookup, convert in cls.fields
+        )
+
+    @classmethod
+    def values(cls, queryset):
+        return queryset.prefetch_related(None).values(*cls.lookups)
+
+    @classmethod
+    def serialize(cls, row):
+        return {key: get(row) for key, get in cls.accessors}
+
+    @classmethod
+    def serialize_many(cls, rows):
+        serialize = cls.serialize
+        return [serialize(row) for row in rows]
+
+
+def _converted(get, convert):
+    return lambda row: convert(get(row))
+
+
+class FastProductSerializer(RowSerializer):
+    fields = (
+        ('id', 'id', None),
+        ('name', 'name', None),
+        ('description', 'description', None),
+        ('price', 'price', price_string),
+        ('stock', 'stock', None),
+        ('category', 'category_id', None),
+        ('image_url', 'image_url', None),
+        # Replaced with the image set built from the original and its variants
+        ('images', 'image', None),
+        ('created_at', 'created_at', iso_datetime),
+    )
+
+    @classmethod
+    def values(cls, queryset):
+        return queryset.prefetch_related(None).values(*cls.lookups, 'category__name', 'image_variants')
+
+    @classmethod
+    def serialize(cls, row):
+        data = {key: get(row) for key, get in cls.accessors}
+        if data['category'] is not None:
+            data['category'] = {'id': data['category'], 'name': row['category__name']}
+        data['images'] = image_set(data['images'], row['image_variants'])
+        return data
+
+
+class PrefixedProductSerializer(RowSerializer):
+    """Product fields read from a related row, e.g. ``product__name`` on an order item."""
+    fields = tuple(
+        (key, f'product__{lookup}', convert) for key, lookup, convert in FastProductSerializer.fields
+    )
+
+    @classmethod
+    def serialize(cls, row):
+        data = {key: get(row) for key, get in cls.accessors}
+        if data['category'] is not None:
+            data['category'] = {'id': data['category'], 'name': row['product__category__name']}
+        data['images'] = image_set(data['images'], row['product__image_variants'])
+        return data
+
+
+PRODUCT_LOOKUPS = PrefixedProductSerializer.lookups + ('product__category__name', 'product__image_variants')
+
+
+class FastOrderSerializer(RowSerializer):
+    # 'user' and 'items' are replaced with nested data below; they are listed here to keep the key order
+    fields = (
+        ('id', 'id', None),
+        ('user', 'user_id', None),
+        ('full_name', 'full_name', None),
+        ('email', 'email', None),
+        ('address', 'address', None),
+        ('phone_number', 'phone_number', None),
+        ('status', 'status', None),
+        ('total_amount', 'total_amount', price_string),
+        ('items', 'id', None),
+        ('created_at', 'created_at', iso_datetime),
+    )
+    user_lookups = ('user__username', 'user__email', 'user__first_name', 'user__last_name')
+
+    @classmethod
+    def values(cls, queryset):
+        return queryset.prefetch_related(None).values(*cls.lookups, *cls.user_lookups)
+
+    @classmethod
+    def serialize_many(cls, rows):
+        """Serialize a page of order rows, loading all of their items in one query."""
+        rows = list(rows)
+        items = defaultdict(list)
+        item_rows = (
+            OrderItem.objects.filter(order_id__in=[row['id'] for row in rows])
+            .order_by('id')
+            .values('id', 'order_id', 'quantity', 'price', *PRODUCT_LOOKUPS)
+        )
+        for item in item_rows:
+            items[item['order_id']].append({
+                'id': item['id'],
+                'product': PrefixedProductSerializer.serialize(item),
+                'quantity': item['quantity'],
+                'price': price_string(item['price']),
+            })
+
+        data = []
+        for row in rows:
+            order = {key: get(row) for key, get in cls.accessors}
+            order['user'] = {
+                'id': row['user_id'],
+                'username': row['user__username'],
+                'email': row['user__email'],
+                'first_name': row['user__first_name'],
+                'last_name': row['user__last_name'],
+            }
+            order['items'] = items[row['id']]
+            data.append(order)
+        return data
+
+    @classmethod
+    def serialize(cls, row):
+        return cls.serialize_many([row])[0]
+
+
+class FastCartSerializer:
+    @staticmethod
+    def load(cart_id):
+        """The serialized cart, read with one query for the cart row and one for its lines."""
+        cart = Cart.objects.filter(pk=cart_id).values('id', 'subtotal', 'item_count').get()
+        lines = (
+            CartItem.objects.filter(cart_id=cart_id)
+            .order_by('id')
+            .values('id', 'quantity', *PRODUCT_LOOKUPS)
+        )
+        with serializer_timer():
+            return {
+                'id': cart['id'],
+                'items': [
+                    {'id': line['id'], 'product': PrefixedProductSerializer.serialize(line), 'quantity': line['quantity']}
+                    for line in lines
+                ],
+                # SerializerMethodField passes the Decimal through; the JSON encoder renders it
+                'total': cart['subtotal'],
+                'item_count': cart['item_count'],
+            }
+
+
+def fast_serializers_enabled():
+    return getattr(settings, 'FAST_READ_SERIALIZERS', True)
+
+
+class FastReadMixin:
+    """
+    Serve GET list/retrieve through ``fast_serializer_class`` instead of the
+    view's DRF serializer, which still handles every write.
+    """
+    fast_serializer_class = None
+
+    def list(self, request, *args, **kwargs):
+        if not fast_serializers_enabled():
+            return super().list(request, *args, **kwargs)
+        serializer = self.fast_serializer_class
+        rows = serializer.values(self.filter_queryset(self.get_queryset()))
+        page = self.paginate_queryset(rows)
+        with serializer_timer():
+            data = serializer.serialize_many(rows if page is None else page)
+        if page is not None:
+            return self.get_paginated_response(data)
+        return Response(data)
+
+    def retrieve(self, request, *args, **kwargs):
+        if not fast_serializers_enabled():
+            return super().retrieve(request, *args, **kwargs)
+        lookup_url_kwarg = self.lookup_url_kwarg or self.lookup_field
+        queryset = self.filter_queryset(self.get_queryset()).filter(
+            **{self.lookup_field: self.kwargs[lookup_url_kwarg]}
+        )
+        row = self.fast_serializer_class.values(queryset).first()
+        if row is None:
+            raise Http404(f'No {queryset.model._meta.object_name} matches the given query.')
+        with serializer_timer():
+            return Response(self.fast_serializer_class.serialize(row))
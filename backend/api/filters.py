@@ -0,0 +1,30 @@
+from .search import get_search_backend
+
+
+def filter_products(queryset, params):
+    """Apply the catalog's category, search and price range query parameters."""
+    # Filter by category (ID or name)
+    category_param = params.get('category', None)
+    if category_param is not None:
+        # Check if the parameter is numeric (an ID) or a string (slug)
+        if category_param.isdigit():
+            queryset = queryset.filter(category__id=category_param)
+        else:
+            # Filter by category name (case-insensitive) since there's no slug field
+            queryset = queryset.filter(category__name__iexact=category_param)
+
+    # Search functionality
+    search = params.get('search')
+    if search:
+        queryset = get_search_backend().search(queryset, search)
+
+    # Price range filtering
+    min_price = params.get('min_price')
+    max_price = params.get('max_price')
+
+    if min_price:
+        queryset = queryset.filter(price__gte=min_price)
+    if max_price:
+        queryset = queryset.filter(price__lte=max_price)
+
+    return queryset
@@ -0,0 +1,102 @@
+"""
+Bulk order status transitions for warehouse waves.
+
+Orders move pending -> processing -> shipped -> delivered, and can be
+cancelled until they ship. ``transition_orders`` moves a batch of orders to
+one status:
+- the current statuses of the whole batch are read (and locked) with one
+  query and checked against TRANSITIONS
+- the allowed orders change with a single ``UPDATE ... WHERE status IN``,
+  which also sets updated_at so the analytics rollups pick the change up
+- cancelled orders' items go back into stock, summed per product and
+  written in batches (see inventory.restock)
+
+Every requested id gets an outcome, so a wave can be retried with just the
+orders that failed.
+"""
+from django.db import transaction
+from django.db.models import Sum
+from django.db.models.functions import Now
+
+from .inventory import restock
+from .jobs import enqueue
+from .models import Order, OrderItem
+
+PENDING, PROCESSING, SHIPPED, DELIVERED, CANCELLED = 'pending', 'processing', 'shipped', 'delivered', 'cancelled'
+
+TRANSITIONS = {
+    PENDING: {PROCESSING, CANCELLED},
+    PROCESSING: {SHIPPED, CANCELLED},
+    SHIPPED: {DELIVERED},
+    DELIVERED: set(),
+    CANCELLED: set(),
+}
+
+# Outcomes
+UPDATED = 'updated'
+UNCHANGED = 'unchanged'
+INVALID = 'invalid_transition'
+NOT_FOUND = 'not_found'
+
+# Orders per transaction: keeps the IN lists and row locks of a huge wave bounded
+BATCH_SIZE = 1000
+
+
+def sources(target):
+    """The statuses an order can move to ``target`` from."""
+    return sorted(status for status, targets in TRANSITIONS.items() if target in targets)
+
+
+def transition_orders(order_ids, target, batch_size=BATCH_SIZE):
+    """
+    Move ``order_ids`` to status ``target``. Returns ``(results, restocked)``:
+    an outcome per distinct id, in request order, and the number of units
+    put back into stock by cancellations.
+    """
+    if target not in TRANSITIONS:
+        raise ValueError(f"Unknown order status {target!r}")
+    order_ids = list(dict.fromkeys(order_ids))
+    results = {}
+    restocked = 0
+    for start in range(0, len(order_ids), batch_size):
+        batch_results, batch_restocked = _transition_batch(order_ids[start:start + batch_size], target)
+        results.update(batch_results)
+        restocked += batch_restocked
+    if any(result['outcome'] == UPDATED for result in results.values()):
+        enqueue('analytics.refresh', unique=True)
+    return [results[order_id] for order_id in order_ids], restocked
+
+
+@transaction.atomic
+def _transition_batch(order_ids, target):
+    allowed = sources(target)
+    current = dict(Order.objects.select_for_update().filter(pk__in=order_ids).values_list('pk', 'status'))
+
+    results = {}
+    eligible = []
+    for order_id in order_ids:
+        previous = current.get(order_id)
+        if previous is None:
+            outcome = NOT_FOUND
+        elif previous == target:
+            outcome = UNCHANGED
+        elif previous in allowed:
+            outcome = UPDATED
+            eligible.append(order_id)
+        else:
+            outcome = INVALID
+        results[order_id] = {'id': order_id, 'outcome': outcome, 'from': previous, 'to': target}
+    if not eligible:
+        return results, 0
+
+    # The status guard keeps this correct where select_for_update is a no-op (SQLite)
+    Order.objects.filter(pk__in=eligible, status__in=allowed).update(status=target, updated_at=Now())
+    if target != CANCELLED:
+        return results, 0
+    quantities = dict(
+        OrderItem.objects.filter(order__in=eligible)
+        .values('product').order_by()
+        .annotate(units=Sum('quantity'))
+        .values_list('product', 'units')
+    )
+    return results, restock(quantities)
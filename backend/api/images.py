@@ -0,0 +1,151 @@
+"""
+Product images: an uploaded original plus resized variants for the catalog.
+
+Uploads are stored under MEDIA_ROOT as ``products/originals/<sha256>.<ext>``.
+Saving a product with a new image queues an ``images.render`` job (see
+api.tasks), which writes a WebP and a JPEG of every size in VARIANTS to
+``products/variants/<sha256 of the output>.<ext>`` and records their names
+in ``Product.image_variants``. Nothing is resized per request.
+
+Variant names change whenever their bytes do, so the web server can serve
+``MEDIA_URL + 'products/variants/'`` with ``Cache-Control: public,
+max-age=31536000, immutable``.
+
+Uploads are opened with Pillow before they are accepted, so only files it
+can read as one of ALLOWED_FORMATS get stored.
+"""
+import hashlib
+import io
+import logging
+import os
+
+from django.core.exceptions import ValidationError
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.db.models.functions import Now
+from PIL import Image, ImageOps, UnidentifiedImageError
+
+from .cache import bump_generation
+
+logger = logging.getLogger(__name__)
+
+# (name, width in pixels); originals narrower than a variant aren't upscaled
+VARIANTS = (
+    ('thumbnail', 160),
+    ('card', 480),
+    ('detail', 1200),
+)
+FORMATS = (
+    # (key, Pillow format, extension, save options)
+    ('webp', 'WEBP', 'webp', {'quality': 80, 'method': 4}),
+    ('jpeg', 'JPEG', 'jpg', {'quality': 82, 'optimize': True, 'progressive': True}),
+)
+ALLOWED_EXTENSIONS = ('jpg', 'jpeg', 'png', 'webp', 'gif')
+# What Pillow must identify the upload as, whatever its extension says
+ALLOWED_FORMATS = ('JPEG', 'PNG', 'WEBP', 'GIF')
+MAX_UPLOAD_BYTES = 10 * 1024 * 1024
+
+
+def content_hash(file):
+    digest = hashlib.sha256()
+    for chunk in file.chunks():
+        digest.update(chunk)
+    file.seek(0)
+    return digest.hexdigest()
+
+
+def original_path(instance, filename):
+    """``upload_to`` for Product.image: the original's content hash, keeping its extension."""
+    extension = os.path.splitext(filename)[1].lower()
+    return f'products/originals/{content_hash(instance.image.file)}{extension}'
+
+
+def validate_image_file(file):
+    extension = os.path.splitext(file.name)[1].lower().lstrip('.')
+    if extension not in ALLOWED_EXTENSIONS:
+        raise ValidationError(f"Unsupported image type; use one of {', '.join(ALLOWED_EXTENSIONS)}.")
+    if file.size > MAX_UPLOAD_BYTES:
+        raise ValidationError(f"Images can be at most {MAX_UPLOAD_BYTES // (1024 * 1024)} MB.")
+    try:
+        with Image.open(file) as image:
+            image_format = image.format
+            image.verify()
+    except (UnidentifiedImageError, Image.DecompressionBombError, OSError, SyntaxError, ValueError):
+        raise ValidationError('Upload a valid image; the file is not one or is corrupted.')
+    finally:
+        file.seek(0)
+    if image_format not in ALLOWED_FORMATS:
+        raise ValidationError(f"Unsupported image type; use one of {', '.join(ALLOWED_EXTENSIONS)}.")
+
+
+def image_set(original, variants):
+    """
+    The ``images`` payload of a product: URLs of the original and of each
+    rendered variant, plus a ``srcset`` string per format. None without an
+    image.
+    """
+    if not original:
+        return None
+    data = {'original': default_storage.url(original)}
+    srcset = {key: [] for key, *_ in FORMATS}
+    for name, _ in VARIANTS:
+        variant = (variants or {}).get(name)
+        if variant is None:
+            continue
+        data[name] = {'width': variant['width']}
+        for key, *_ in FORMATS:
+            url = default_storage.url(variant[key])
+            data[name][key] = url
+            srcset[key].append(f"{url} {variant['width']}w")
+    data['srcset'] = {key: ', '.join(entries) for key, entries in srcset.items() if entries}
+    return data
+
+
+def _encode(image, pillow_format, options):
+    buffer = io.BytesIO()
+    image.save(buffer, pillow_format, **options)
+    return buffer.getvalue()
+
+
+def _store(data, extension):
+    name = f'products/variants/{hashlib.sha256(data).hexdigest()}.{extension}'
+    # Same bytes, same name: a re-render or a shared image reuses the stored file
+    if not default_storage.exists(name):
+        default_storage.save(name, ContentFile(data))
+    return name
+
+
+def render_variants(source):
+    """Resize the stored original ``source`` into every variant; {name: {'width', 'webp', 'jpeg'}}."""
+    with default_storage.open(source, 'rb') as file:
+        with Image.open(file) as opened:
+            image = ImageOps.exif_transpose(opened)
+            image.load()
+    if image.mode not in ('RGB', 'RGBA'):
+        image = image.convert('RGBA' if 'transparency' in image.info or image.mode in ('LA', 'PA') else 'RGB')
+
+    variants = {}
+    for name, width in VARIANTS:
+        resized = image
+        if image.width > width:
+            resized = image.resize((width, round(image.height * width / image.width)), Image.Resampling.LANCZOS)
+        variants[name] = {'width': resized.width}
+        for key, pillow_format, extension, options in FORMATS:
+            # JPEG has no alpha channel: flatten onto white
+            output = resized
+            if pillow_format == 'JPEG' and resized.mode == 'RGBA':
+                output = Image.new('RGB', resized.size, 'white')
+                output.paste(resized, mask=resized.getchannel('A'))
+            variants[name][key] = _store(_encode(output, pillow_format, options), extension)
+    return variants
+
+
+def render_product_images(product_id, source):
+    """Render ``source`` for a product, unless its image has been replaced since."""
+    from .models import Product
+
+    if not Product.objects.filter(pk=product_id, image=source).exists():
+        return
+    variants = render_variants(source)
+    if Product.objects.filter(pk=product_id, image=source).update(image_variants=variants, updated_at=Now()):
+        bump_generation('product')
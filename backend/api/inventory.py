@@ -0,0 +1,225 @@
+import datetime
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Case, F, IntegerField, OuterRef, Q, Subquery, Sum, Value, When
+from django.db.models.functions import Coalesce, Now
+from django.utils import timezone
+
+from .cache import bump_generation
+from .models import Product, StockReservation, StockShard
+
+
+class OutOfStock(Exception):
+    """Raised when a stock decrement can't be satisfied for some products."""
+
+    def __init__(self, product_ids):
+        self.product_ids = set(product_ids)
+        super().__init__(f"Insufficient stock for products {sorted(self.product_ids)}")
+
+
+class _Shortfall(Exception):
+    pass
+
+
+def decrement_stock(quantities, sharded=None):
+    """
+    Take stock for a {product_id: quantity} mapping in a single UPDATE.
+
+    Each row is only touched if it still has enough stock, so the check and the
+    decrement are atomic even without a row lock. If any product falls short
+    nothing is decremented and OutOfStock is raised.
+
+    Products in ``sharded`` (looked up when not given) are taken from their
+    StockShard rows instead, see take_from_shards.
+    """
+    quantities = {pid: qty for pid, qty in quantities.items() if qty}
+    if not quantities:
+        return
+    if sharded is None:
+        sharded = set(Product.objects.filter(pk__in=quantities, stock_shards__gt=0).values_list('pk', flat=True))
+    sharded = {pid: quantities.pop(pid) for pid in set(sharded) & set(quantities)}
+    if sharded:
+        with transaction.atomic():
+            short = {pid for pid, quantity in sharded.items() if not take_from_shards(pid, quantity)}
+            if not short and quantities:
+                decrement_stock(quantities, sharded=())
+            elif short:
+                # Raising rolls the shards back; report the plain products that would also have failed
+                if quantities:
+                    short |= _short_products(quantities)
+                raise OutOfStock(short)
+        return
+
+    has_stock = Q()
+    for product_id, quantity in quantities.items():
+        has_stock |= Q(pk=product_id, stock__gte=quantity)
+
+    taken = Case(
+        *[When(pk=product_id, then=Value(quantity)) for product_id, quantity in quantities.items()],
+        default=Value(0),
+        output_field=IntegerField(),
+    )
+    try:
+        with transaction.atomic():
+            updated = Product.objects.filter(has_stock).update(stock=F('stock') - taken, updated_at=Now())
+            if updated != len(quantities):
+                raise _Shortfall
+    except _Shortfall:
+        # The savepoint rolled the partial update back, so this sees the original stock
+        raise OutOfStock(_short_products(quantities))
+
+    # Stock is part of every product payload, so cached catalog pages are now stale
+    bump_generation('product')
+
+
+def restock(quantities, batch_size=500):
+    """
+    Put units back for a {product_id: quantity} mapping, e.g. from cancelled
+    orders: one UPDATE per ``batch_size`` products, with sharded products'
+    units spread over their shards. Returns the number of units restocked.
+    """
+    quantities = {pid: qty for pid, qty in quantities.items() if qty}
+    if not quantities:
+        return 0
+    sharded = set(Product.objects.filter(pk__in=quantities, stock_shards__gt=0).values_list('pk', flat=True))
+    plain = sorted(pid for pid in quantities if pid not in sharded)
+    with transaction.atomic():
+        for start in range(0, len(plain), batch_size):
+            batch = plain[start:start + batch_size]
+            added = Case(
+                *[When(pk=product_id, then=Value(quantities[product_id])) for product_id in batch],
+                default=Value(0),
+                output_field=IntegerField(),
+            )
+            Product.objects.filter(pk__in=batch).update(stock=F('stock') + added, updated_at=Now())
+        for product_id in sorted(sharded):
+            set_sharding(product_id, delta=quantities[product_id])
+    bump_generation('product')
+    return sum(quantities.values())
+
+
+def _short_products(quantities):
+    has_stock = Q()
+    for product_id, quantity in quantities.items():
+        has_stock |= Q(pk=product_id, stock__gte=quantity)
+    return set(quantities) - set(Product.objects.filter(has_stock).values_list('pk', flat=True))
+
+
+# Sharded stock: a hot product's stock is split over StockShard rows. A checkout
+# takes its units from one randomly chosen shard, skipping shards another
+# transaction has locked, so concurrent buyers rarely wait on each other.
+# Product.stock becomes a copy of the shard total, refreshed by
+# sync_sharded_stock, so catalog reads stay single-row.
+
+def take_from_shards(product_id, quantity):
+    """Take ``quantity`` units from a sharded product's shards; False if it doesn't have them."""
+    shards = StockShard.objects.filter(product_id=product_id)
+    # Fast path: one unlocked shard that covers the whole quantity
+    shard = (
+        shards.filter(stock__gte=quantity)
+        .select_for_update(skip_locked=True)
+        .order_by('?')
+        .values_list('pk', flat=True)
+        .first()
+    )
+    if shard is not None and StockShard.objects.filter(pk=shard, stock__gte=quantity).update(
+        stock=F('stock') - quantity
+    ):
+        return True
+
+    # Slow path: the units are spread over several shards, or the suitable ones are busy.
+    # Lock them all in a fixed order and drain the fullest first.
+    locked = list(shards.select_for_update().order_by('shard').values_list('pk', 'stock'))
+    if sum(stock for _, stock in locked) < quantity:
+        return False
+    for pk, stock in sorted(locked, key=lambda row: -row[1]):
+        taken = min(stock, quantity)
+        if taken:
+            StockShard.objects.filter(pk=pk).update(stock=F('stock') - taken)
+            quantity -= taken
+        if not quantity:
+            break
+    return True
+
+
+@transaction.atomic
+def set_sharding(product_id, shards=None, delta=0, stock=None):
+    """
+    Spread a product's stock evenly over ``shards`` StockShard rows, or fold it
+    back into Product.stock when ``shards`` is 0 (None keeps the current count).
+    ``stock`` replaces the current total, and ``delta`` units are added to (or
+    removed from) it on the way.
+    """
+    product = Product.objects.select_for_update().get(pk=product_id)
+    locked = list(StockShard.objects.select_for_update().filter(product_id=product_id).values_list('stock', flat=True))
+    if stock is None:
+        stock = sum(locked) if product.stock_shards else product.stock
+    total = max(stock + delta, 0)
+    if shards is None:
+        shards = product.stock_shards
+    StockShard.objects.filter(product_id=product_id).delete()
+    if shards:
+        StockShard.objects.bulk_create([
+            StockShard(product_id=product_id, shard=index, stock=total // shards + (index < total % shards))
+            for index in range(shards)
+        ])
+    Product.objects.filter(pk=product_id).update(stock=total, stock_shards=shards, updated_at=Now())
+    bump_generation('product')
+
+
+def sync_sharded_stock():
+    """Copy each sharded product's shard total into Product.stock; returns how many changed."""
+    totals = (
+        StockShard.objects.filter(product=OuterRef('pk'))
+        .order_by().values('product').annotate(total=Sum('stock')).values('total')
+    )
+    updated = (
+        Product.objects.filter(stock_shards__gt=0)
+        .annotate(shard_stock=Coalesce(Subquery(totals), 0))
+        .exclude(stock=F('shard_stock'))
+        .update(stock=Coalesce(Subquery(totals), 0), updated_at=Now())
+    )
+    if updated:
+        bump_generation('product')
+    return updated
+
+
+# Reservations: adding a product to the cart holds the line's quantity for
+# STOCK_RESERVATION_TTL seconds. Holds don't move stock; they lower what other
+# carts see as available (stock minus active holds) until they expire or the
+# line is checked out or removed.
+
+def reservation_ttl():
+    return datetime.timedelta(seconds=getattr(settings, 'STOCK_RESERVATION_TTL', 15 * 60))
+
+
+def available_stock(product_ids, exclude_cart=None):
+    """{product_id: units available}, not counting ``exclude_cart``'s own holds."""
+    return dict(
+        Product.objects.filter(pk__in=product_ids)
+        .with_availability(exclude_cart=exclude_cart)
+        .values_list('pk', 'available')
+    )
+
+
+def hold_stock(lines):
+    """Create or renew the holds for (cart_item_id, product_id, quantity) lines."""
+    expires_at = timezone.now() + reservation_ttl()
+    StockReservation.objects.bulk_create(
+        [
+            StockReservation(cart_item_id=item_id, product_id=product_id, quantity=quantity, expires_at=expires_at)
+            for item_id, product_id, quantity in lines
+        ],
+        update_conflicts=True,
+        unique_fields=['cart_item'],
+        update_fields=['quantity', 'expires_at'],
+    )
+
+
+def release_expired_holds(batch_size=1000):
+    """Delete expired holds in batches (they already stopped counting); returns how many."""
+    released = 0
+    while batch := list(StockReservation.objects.expired().values_list('pk', flat=True)[:batch_size]):
+        released += StockReservation.objects.filter(pk__in=batch).delete()[0]
+    return released
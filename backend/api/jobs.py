@@ -0,0 +1,144 @@
+"""
+Database-backed job queue (a transactional outbox).
+
+``enqueue`` inserts a Job row in the caller's transaction, so a job exists if
+and only if the change that asked for it committed. The ``run_jobs`` worker
+claims due jobs, runs the registered handler and retries failures with
+exponential backoff. It needs nothing but the database: on Postgres workers
+claim with SELECT ... FOR UPDATE SKIP LOCKED, on SQLite the write lock
+serialises claims.
+
+Handlers are plain functions taking the job's payload as keyword arguments,
+registered with ``@handler('name')`` (see api.tasks). They must be safe to
+run more than once: a worker that dies mid-job leaves it to be retried after
+JOB_LOCK_TIMEOUT. While a handler runs its worker refreshes the job's
+``locked_at`` every quarter of that timeout, so long jobs are never mistaken
+for stuck ones.
+"""
+import contextlib
+import datetime
+import logging
+import threading
+import traceback
+
+from django.conf import settings
+from django.db import connection, transaction
+from django.db.models import F
+from django.utils import timezone
+
+from .models import Job
+
+logger = logging.getLogger(__name__)
+
+HANDLERS = {}
+
+
+def handler(name):
+    """Register the decorated function as the handler of ``name`` jobs."""
+    def register(func):
+        HANDLERS[name] = func
+        return func
+    return register
+
+
+def enqueue(name, payload=None, delay=None, max_attempts=5, unique=False):
+    """
+    Queue a ``name`` job. With ``unique``, nothing is queued if an identical job
+    is already pending, which coalesces work like "refresh the rollups".
+    """
+    if name not in HANDLERS:
+        raise KeyError(f'No job handler registered for {name!r}')
+    payload = payload or {}
+    if unique and Job.objects.filter(name=name, payload=payload, status=Job.PENDING).exists():
+        return None
+    run_after = timezone.now() + delay if delay else timezone.now()
+    return Job.objects.create(name=name, payload=payload, run_after=run_after, max_attempts=max_attempts)
+
+
+def lock_timeout():
+    return datetime.timedelta(seconds=getattr(settings, 'JOB_LOCK_TIMEOUT', 10 * 60))
+
+
+def retry_delay(attempts):
+    """Backoff before attempt ``attempts + 1``: 10s, 20s, 40s, ... capped at an hour."""
+    return datetime.timedelta(seconds=min(10 * 2 ** (attempts - 1), 3600))
+
+
+def requeue_stuck_jobs():
+    """Put running jobs whose worker stopped sending heartbeats back in the queue; returns how many."""
+    return Job.objects.filter(status=Job.RUNNING, locked_at__lt=timezone.now() - lock_timeout()).update(
+        status=Job.PENDING, locked_by='', locked_at=None, updated_at=timezone.now()
+    )
+
+
+def claim(worker, limit=1):
+    """Mark up to ``limit`` due jobs as running for ``worker`` and return them."""
+    now = timezone.now()
+    with transaction.atomic():
+        ids = list(
+            Job.objects.filter(status=Job.PENDING, run_after__lte=now)
+            .select_for_update(skip_locked=True)
+            .order_by('run_after', 'id')
+            .values_list('pk', flat=True)[:limit]
+        )
+        if not ids:
+            return []
+        Job.objects.filter(pk__in=ids, status=Job.PENDING).update(
+            status=Job.RUNNING, locked_by=worker, locked_at=now, attempts=F('attempts') + 1, updated_at=now
+        )
+        return list(Job.objects.filter(pk__in=ids, locked_by=worker, status=Job.RUNNING).order_by('run_after', 'id'))
+
+
+@contextlib.contextmanager
+def heartbeat(job):
+    """Keep refreshing the claimed job's ``locked_at`` from a background thread until the block exits."""
+    done = threading.Event()
+    interval = lock_timeout().total_seconds() / 4
+
+    def beat():
+        try:
+            while not done.wait(interval):
+                Job.objects.filter(pk=job.pk, status=Job.RUNNING, locked_by=job.locked_by).update(
+                    locked_at=timezone.now()
+                )
+        finally:
+            connection.close()
+
+    thread = threading.Thread(target=beat, name=f'heartbeat-{job.pk}', daemon=True)
+    thread.start()
+    try:
+        yield
+    finally:
+        done.set()
+        thread.join()
+
+
+def run(job):
+    """Run a claimed job and record the outcome; returns True on success."""
+    try:
+        func = HANDLERS[job.name]
+        with heartbeat(job):
+            func(**job.payload)
+    except Exception:
+        error = traceback.format_exc()
+        if job.attempts < job.max_attempts:
+            logger.warning('Job %s #%s failed (attempt %s), retrying', job.name, job.pk, job.attempts)
+            status, run_after = Job.PENDING, timezone.now() + retry_delay(job.attempts)
+        else:
+            logger.error('Job %s #%s failed permanently after %s attempts', job.name, job.pk, job.attempts)
+            status, run_after = Job.FAILED, job.run_after
+        Job.objects.filter(pk=job.pk).update(
+            status=status, run_after=run_after, last_error=error, locked_by='', locked_at=None,
+            updated_at=timezone.now(),
+        )
+        return False
+
+    Job.objects.filter(pk=job.pk).update(
+        status=Job.DONE, last_error='', locked_by='', locked_at=None, updated_at=timezone.now()
+    )
+    return True
+
+
+def purge_finished(older_than):
+    """Delete done jobs last updated before ``older_than`` ago; returns how many."""
+    return Job.objects.filter(status=Job.DONE, updated_at__lt=timezone.now() - older_than).delete()[0]
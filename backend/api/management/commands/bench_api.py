@@ -0,0 +1,86 @@
+import logging
+import random
+
+from django.core.management.base import BaseCommand, CommandError
+
+from api.benchmarks import baseline
+from api.benchmarks.factories import SCALES, seed
+from api.benchmarks.scenarios import SCENARIOS, Users, run_scenario
+from api.benchmarks.utils import Stopwatch, scratch_database
+
+
+class Command(BaseCommand):
+    help = (
+        'Seed a synthetic shop and drive the real endpoints (browse, search, cart, checkout, order history), '
+        'reporting throughput, latency percentiles and queries per request. --save writes a JSON baseline; '
+        '--baseline compares against one and fails on regressions.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--scale', choices=sorted(SCALES), default='small', help='Dataset size preset.')
+        parser.add_argument('--categories', type=int, help='Override the preset.')
+        parser.add_argument('--products', type=int, help='Override the preset.')
+        parser.add_argument('--users', type=int, help='Override the preset.')
+        parser.add_argument('--orders-per-user', type=int, help='Override the preset.')
+        parser.add_argument('--requests', type=int, default=200, help='Timed requests per scenario.')
+        parser.add_argument('--warmup', type=int, default=20, help='Untimed requests before read-only scenarios.')
+        parser.add_argument(
+            '--scenario', action='append', choices=list(SCENARIOS),
+            help='Scenario to run, repeatable (default: all, in order).',
+        )
+        parser.add_argument('--seed', type=int, default=42)
+        parser.add_argument('--save', metavar='PATH', help='Write the results as a JSON baseline.')
+        parser.add_argument('--baseline', metavar='PATH', help='Compare against a saved baseline.')
+        parser.add_argument(
+            '--threshold', type=float, default=0.2,
+            help='Tolerated latency/throughput change against the baseline (0.2 = 20%%).',
+        )
+
+    def handle(self, *args, **options):
+        scale = dict(SCALES[options['scale']])
+        for name in scale:
+            if options[name] is not None:
+                scale[name] = options[name]
+        previous = baseline.load(options['baseline']) if options['baseline'] else None
+        if previous and (previous['scale'], previous['seed']) != (scale, options['seed']):
+            self.stderr.write(self.style.WARNING(
+                f"The baseline was recorded with scale {previous['scale']} and seed {previous['seed']}; "
+                'figures may not be comparable.'
+            ))
+
+        # Failed and over-budget requests show up in the report; don't log a warning for each one
+        logging.getLogger('django.request').setLevel(logging.ERROR)
+        logging.getLogger('api.metrics').setLevel(logging.ERROR)
+        results = {}
+        with scratch_database() as connection:
+            self.stdout.write(f'Seeding ({connection.vendor}):')
+            with Stopwatch() as timer:
+                dataset = seed(**scale, seed=options['seed'], progress=lambda message: self.stdout.write(f'  {message}'))
+            self.stdout.write(f'Seeded in {timer.elapsed:.1f}s')
+
+            rng = random.Random(options['seed'])
+            users = Users()
+            self.stdout.write(
+                f"{'scenario':<15} {'requests':>8} {'req/s':>8} {'p50 ms':>8} {'p95 ms':>8} {'p99 ms':>8} "
+                f"{'queries':>8} {'max q':>6} {'errors':>7}"
+            )
+            for name in options['scenario'] or SCENARIOS:
+                scenario = SCENARIOS[name](dataset, rng, options['requests'])
+                figures = results[name] = run_scenario(scenario, warmup=options['warmup'], users=users)
+                self.stdout.write(
+                    f"{name:<15} {figures['count']:>8} {figures['throughput']:>8.1f} {figures['p50_ms']:>8.1f} "
+                    f"{figures['p95_ms']:>8.1f} {figures['p99_ms']:>8.1f} {figures['queries_p50']:>8} "
+                    f"{figures['queries_max']:>6} {figures['errors']:>7}"
+                )
+
+        report = baseline.build_report(scale, options['seed'], results)
+        if options['save']:
+            baseline.save(report, options['save'])
+            self.stdout.write(f"Saved results to {options['save']}")
+        if previous:
+            regressions = baseline.compare(previous, report, options['threshold'])
+            if regressions:
+                for regression in regressions:
+                    self.stderr.write(self.style.ERROR(f'Regression: {regression}'))
+                raise CommandError(f'{len(regressions)} regression(s) against {options["baseline"]}.')
+            self.stdout.write(self.style.SUCCESS(f"No regressions against {options['baseline']}."))
@@ -0,0 +1,83 @@
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from decimal import Decimal
+
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand
+from django.db import connections
+from rest_framework.test import APIClient
+
+from api.benchmarks.utils import Stopwatch, scratch_database, summarize
+from api.models import Cart, CartItem, Category, Product
+
+
+class Command(BaseCommand):
+    help = 'Fire parallel checkouts at a single SKU and check that stock is never oversold.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--buyers', type=int, default=100, help='Number of buyers checking out.')
+        parser.add_argument('--stock', type=int, default=50, help='Initial stock of the contended product.')
+        parser.add_argument('--quantity', type=int, default=1, help='Units each buyer has in their cart.')
+        parser.add_argument('--threads', type=int, default=16, help='Concurrent checkout workers.')
+
+    def handle(self, *args, **options):
+        # Rejected checkouts are expected here; don't log a warning for each one
+        logging.getLogger('django.request').setLevel(logging.ERROR)
+        with scratch_database():
+            product = self.seed(options['buyers'], options['stock'], options['quantity'])
+            results = self.run_checkouts(options['buyers'], options['threads'])
+            product.refresh_from_db()
+            self.report(results, product, options)
+
+    def seed(self, buyers, stock, quantity):
+        category = Category.objects.create(name='Bench')
+        product = Product.objects.create(
+            name='Contended SKU', description='bench', price=Decimal('9.99'), stock=stock, category=category
+        )
+        users = User.objects.bulk_create([User(username=f'buyer{i}') for i in range(buyers)])
+        carts = Cart.objects.bulk_create([Cart(user=user) for user in users])
+        CartItem.objects.bulk_create([CartItem(cart=cart, product=product, quantity=quantity) for cart in carts])
+        return product
+
+    def run_checkouts(self, buyers, threads):
+        users = list(User.objects.filter(username__startswith='buyer'))
+        results = []
+        lock = threading.Lock()
+
+        def checkout(user):
+            client = APIClient()
+            client.force_authenticate(user)
+            with Stopwatch() as timer:
+                response = client.post('/api/orders/', {
+                    'full_name': user.username, 'email': f'{user.username}@example.com',
+                    'address': 'Bench street 1', 'phone_number': '000',
+                }, format='json')
+            connections.close_all()
+            with lock:
+                results.append((response.status_code, timer.elapsed))
+
+        with Stopwatch() as wall:
+            with ThreadPoolExecutor(max_workers=threads) as pool:
+                list(pool.map(checkout, users))
+        return results, wall.elapsed
+
+    def report(self, results, product, options):
+        results, elapsed = results
+        placed = sum(1 for code, _ in results if code == 201)
+        rejected = sum(1 for code, _ in results if code == 400)
+        failed = len(results) - placed - rejected
+        sold = placed * options['quantity']
+        stats = summarize([latency for _, latency in results], elapsed)
+
+        self.stdout.write(
+            f"{len(results)} checkouts in {elapsed:.2f}s ({stats['throughput']:.1f}/s), "
+            f"p50 {stats['p50_ms']:.1f}ms p95 {stats['p95_ms']:.1f}ms p99 {stats['p99_ms']:.1f}ms"
+        )
+        self.stdout.write(f"placed {placed}, rejected (out of stock) {rejected}, errors {failed}")
+        self.stdout.write(f"stock {options['stock']} -> {product.stock}, sold {sold}")
+
+        if product.stock != options['stock'] - sold or product.stock < 0:
+            self.stderr.write(self.style.ERROR('Stock and placed orders disagree: oversold or lost updates.'))
+        else:
+            self.stdout.write(self.style.SUCCESS('Stock is consistent with placed orders.'))
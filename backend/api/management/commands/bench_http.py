@@ -0,0 +1,97 @@
+import asyncio
+import time
+from urllib.parse import urlsplit
+
+from django.core.management.base import BaseCommand, CommandError
+
+from api.benchmarks.utils import summarize
+
+
+async def fetch(reader, writer, host, path):
+    """One keep-alive GET; returns the status code."""
+    writer.write(f'GET {path} HTTP/1.1\r\nHost: {host}\r\nAccept: application/json\r\n\r\n'.encode())
+    await writer.drain()
+    status_line = await reader.readline()
+    if not status_line:
+        raise ConnectionError('server closed the connection')
+    headers = {}
+    while (line := await reader.readline()) not in (b'\r\n', b''):
+        name, _, value = line.decode('latin-1').partition(':')
+        headers[name.strip().lower()] = value.strip()
+
+    if headers.get('transfer-encoding', '').lower() == 'chunked':
+        while True:
+            size = int((await reader.readline()).split(b';')[0], 16)
+            await reader.readexactly(size + 2)
+            if size == 0:
+                break
+    else:
+        await reader.readexactly(int(headers.get('content-length', 0)))
+    if headers.get('connection', '').lower() == 'close':
+        raise ConnectionResetError('server asked to close')
+    return int(status_line.split()[1])
+
+
+async def client(url, deadline, latencies, errors):
+    parts = urlsplit(url)
+    path = parts.path + (f'?{parts.query}' if parts.query else '')
+    writer = None
+    while time.perf_counter() < deadline:
+        try:
+            if writer is None:
+                reader, writer = await asyncio.open_connection(parts.hostname, parts.port or 80)
+            start = time.perf_counter()
+            status = await fetch(reader, writer, parts.netloc, path)
+            latencies.append(time.perf_counter() - start)
+            if status >= 400:
+                errors.append(status)
+        except (OSError, ConnectionError, asyncio.IncompleteReadError, ValueError):
+            errors.append('connection')
+            if writer is not None:
+                writer.close()
+            writer = None
+    if writer is not None:
+        writer.close()
+
+
+async def run_level(url, concurrency, duration):
+    latencies, errors = [], []
+    start = time.perf_counter()
+    deadline = start + duration
+    await asyncio.gather(*(client(url, deadline, latencies, errors) for _ in range(concurrency)))
+    return summarize(latencies, time.perf_counter() - start), len(errors)
+
+
+class Command(BaseCommand):
+    help = (
+        'Load-test running servers at several concurrency levels, e.g. WSGI vs ASGI:\n'
+        '  gunicorn ecommerce.wsgi -w 4 -b 127.0.0.1:8000\n'
+        '  uvicorn ecommerce.asgi:application --workers 4 --port 8001\n'
+        '  manage.py bench_http --target wsgi=http://127.0.0.1:8000/api/products/ '
+        '--target asgi=http://127.0.0.1:8001/api/async/products/'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--target', action='append', required=True, metavar='LABEL=URL',
+            help='Endpoint to load, repeatable. Compare e.g. a WSGI and an ASGI deployment.',
+        )
+        parser.add_argument('--concurrency', type=int, nargs='+', default=[50, 100, 250, 500])
+        parser.add_argument('--duration', type=float, default=10, help='Seconds per concurrency level.')
+
+    def handle(self, *args, **options):
+        targets = []
+        for target in options['target']:
+            label, sep, url = target.partition('=')
+            if not sep or not url.startswith('http://'):
+                raise CommandError(f'Expected LABEL=http://host:port/path, got {target!r}')
+            targets.append((label, url))
+
+        self.stdout.write(f"{'target':<10} {'conns':>6} {'req/s':>9} {'p50 ms':>8} {'p95 ms':>8} {'p99 ms':>8} {'errors':>7}")
+        for concurrency in options['concurrency']:
+            for label, url in targets:
+                stats, errors = asyncio.run(run_level(url, concurrency, options['duration']))
+                self.stdout.write(
+                    f"{label:<10} {concurrency:>6} {stats['throughput']:>9.1f} {stats['p50_ms']:>8.1f} "
+                    f"{stats['p95_ms']:>8.1f} {stats['p99_ms']:>8.1f} {errors:>7}"
+                )
@@ -0,0 +1,100 @@
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from decimal import Decimal
+
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand
+from django.db import connections
+from rest_framework.test import APIClient
+
+from api.benchmarks.utils import Stopwatch, scratch_database, summarize
+from api.inventory import set_sharding, sync_sharded_stock
+from api.models import Cart, Category, Order, OrderItem, Product, StockReservation
+
+
+class Command(BaseCommand):
+    help = (
+        'Have many concurrent buyers add one product to their carts (placing stock holds) and check out, '
+        'with the stock in a single row and in sharded counters, then check nothing was oversold.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--buyers', type=int, default=100, help='Concurrent buyers, one thread each.')
+        parser.add_argument('--stock', type=int, default=500, help='Initial stock of the contended product.')
+        parser.add_argument('--quantity', type=int, default=2, help='Units each buyer adds and checks out.')
+        parser.add_argument('--shards', type=int, nargs='+', default=[0, 8], help='Shard counts to compare (0 = single row).')
+
+    def handle(self, *args, **options):
+        # Rejected holds and checkouts are expected here; don't log a warning for each one
+        logging.getLogger('django.request').setLevel(logging.ERROR)
+        for shards in options['shards']:
+            with scratch_database() as connection:
+                self.stdout.write(f"== {'single row' if not shards else f'{shards} shards'} ({connection.vendor}) ==")
+                product = self.seed(options['buyers'], options['stock'], shards)
+                users = list(User.objects.filter(username__startswith='buyer'))
+                holds = self.run(users, lambda client: client.post(
+                    '/api/cart/items/', {'product_id': product.pk, 'quantity': options['quantity']}, format='json'
+                ))
+                self.report('add to cart', holds, 200)
+                checkouts = self.run(users, lambda client: client.post('/api/orders/', {
+                    'full_name': 'Buyer', 'email': 'buyer@example.com', 'address': 'Bench street 1', 'phone_number': '000',
+                }, format='json'))
+                self.report('checkout', checkouts, 201)
+                sync_sharded_stock()
+                self.verify(product, options['stock'])
+
+    def seed(self, buyers, stock, shards):
+        category = Category.objects.create(name='Bench')
+        product = Product.objects.create(
+            name='Flash sale SKU', description='bench', price=Decimal('9.99'), stock=stock, category=category
+        )
+        if shards:
+            set_sharding(product.pk, shards)
+        users = User.objects.bulk_create([User(username=f'buyer{i}') for i in range(buyers)])
+        Cart.objects.bulk_create([Cart(user=user) for user in users])
+        return product
+
+    def run(self, users, request):
+        """Send one request per user, all at once; returns ([(status, seconds)], wall seconds)."""
+        results = []
+        lock = threading.Lock()
+        start = threading.Barrier(len(users))
+
+        def call(user):
+            client = APIClient()
+            client.force_authenticate(user)
+            start.wait()
+            with Stopwatch() as timer:
+                response = request(client)
+            connections.close_all()
+            with lock:
+                results.append((response.status_code, timer.elapsed))
+
+        with Stopwatch() as wall:
+            with ThreadPoolExecutor(max_workers=len(users)) as pool:
+                list(pool.map(call, users))
+        return results, wall.elapsed
+
+    def report(self, label, run, ok_status):
+        results, elapsed = run
+        stats = summarize([latency for _, latency in results], elapsed)
+        ok = sum(1 for code, _ in results if code == ok_status)
+        rejected = sum(1 for code, _ in results if code == 400)
+        self.stdout.write(
+            f"{label:<12} {len(results)} requests in {elapsed:.2f}s ({stats['throughput']:.1f}/s), "
+            f"p50 {stats['p50_ms']:.1f}ms p95 {stats['p95_ms']:.1f}ms p99 {stats['p99_ms']:.1f}ms; "
+            f"ok {ok}, rejected {rejected}, errors {len(results) - ok - rejected}"
+        )
+
+    def verify(self, product, initial):
+        product.refresh_from_db()
+        sold = sum(OrderItem.objects.filter(product=product).values_list('quantity', flat=True))
+        self.stdout.write(
+            f"orders {Order.objects.count()}, sold {sold}, stock {initial} -> {product.stock}, "
+            f"holds left {StockReservation.objects.count()}"
+        )
+        if product.stock != initial - sold or product.stock < 0:
+            self.stderr.write(self.style.ERROR('Stock and placed orders disagree: oversold or lost updates.'))
+        else:
+            self.stdout.write(self.style.SUCCESS('Stock is consistent with placed orders.'))
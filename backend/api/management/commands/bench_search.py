@@ -0,0 +1,83 @@
+import random
+import statistics
+from decimal import Decimal
+
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from api.benchmarks.utils import Stopwatch, scratch_database
+from api.models import Category, Product
+from api.search import IcontainsSearchBackend, get_search_backend
+
+SYLLABLES = [
+    'ka', 'lo', 'mi', 'ne', 'ru', 'ta', 'vo', 'shi', 'pra', 'den', 'bel', 'zor', 'fin', 'gal',
+    'qua', 'tre', 'ux', 'po', 'len', 'dri',
+]
+
+
+def make_vocabulary(rng, size=20_000):
+    words = set()
+    while len(words) < size:
+        words.add(''.join(rng.choice(SYLLABLES) for _ in range(rng.randint(2, 4))))
+    return sorted(words)
+
+
+class Command(BaseCommand):
+    help = 'Compare full-text search latency against the icontains scan at several catalog sizes.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--sizes', type=int, nargs='+', default=[10_000, 100_000, 1_000_000])
+        parser.add_argument('--queries', type=int, default=20, help='Distinct search strings per size.')
+        parser.add_argument('--repeat', type=int, default=3, help='Timed runs per search string.')
+        parser.add_argument('--seed', type=int, default=42)
+
+    def handle(self, *args, **options):
+        rng = random.Random(options['seed'])
+        vocabulary = make_vocabulary(rng)
+        backends = [('icontains', IcontainsSearchBackend()), ('indexed', get_search_backend())]
+
+        with scratch_database():
+            category = Category.objects.create(name='Bench')
+            seeded = 0
+            for size in sorted(options['sizes']):
+                self.seed(category, vocabulary, rng, seeded, size)
+                seeded = size
+                with transaction.atomic():
+                    backends[1][1].rebuild()
+
+                queries = [self.query(rng, vocabulary) for _ in range(options['queries'])]
+                line = [f'{size:>9} products']
+                for label, backend in backends:
+                    timings = []
+                    for text in queries:
+                        for _ in range(options['repeat']):
+                            with Stopwatch() as timer:
+                                # What a paginated list request runs: a count plus the first page
+                                results = backend.search(Product.objects.filter(is_active=True), text)
+                                results.count()
+                                list(results[:10])
+                            timings.append(timer.elapsed * 1000)
+                    line.append(
+                        f'{label} ({type(backend).__name__}): '
+                        f'median {statistics.median(timings):.2f}ms max {max(timings):.2f}ms'
+                    )
+                self.stdout.write(' | '.join(line))
+
+    def seed(self, category, vocabulary, rng, start, stop, batch_size=5000):
+        self.stdout.write(f'Seeding products {start}..{stop}...')
+        for offset in range(start, stop, batch_size):
+            Product.objects.bulk_create([
+                Product(
+                    name=' '.join(rng.choices(vocabulary, k=3)),
+                    description=' '.join(rng.choices(vocabulary, k=40)),
+                    price=Decimal(rng.randint(100, 100_000)) / 100,
+                    stock=rng.randint(0, 500),
+                    category=category,
+                )
+                for _ in range(min(batch_size, stop - offset))
+            ])
+
+    def query(self, rng, vocabulary):
+        # Mix whole words with the partial words a search-as-you-type box sends
+        word = rng.choice(vocabulary)
+        return word if rng.random() < 0.5 else word[:max(3, len(word) - 2)]
@@ -0,0 +1,134 @@
+import random
+import statistics
+from decimal import Decimal
+
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+from rest_framework.renderers import JSONRenderer
+
+from api.benchmarks.utils import Stopwatch, scratch_database
+from api.fast_serializers import FastCartSerializer, FastOrderSerializer, FastProductSerializer
+from api.images import VARIANTS
+from api.models import Cart, CartItem, Category, Order, OrderItem, Product
+from api.serializers import CartSerializer, OrderSerializer, ProductSerializer
+
+
+class Command(BaseCommand):
+    help = (
+        'Check that the fast read serializers render the same JSON as the DRF serializers, '
+        'then time both on a product page, an order page and a cart.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--products', type=int, default=2000)
+        parser.add_argument('--orders', type=int, default=200)
+        parser.add_argument('--page-size', type=int, default=50)
+        parser.add_argument('--repeat', type=int, default=50, help='Timed runs per case.')
+        parser.add_argument('--seed', type=int, default=42)
+
+    def handle(self, *args, **options):
+        rng = random.Random(options['seed'])
+        page_size = options['page_size']
+
+        with scratch_database():
+            user, cart = self.seed(rng, options['products'], options['orders'])
+            products = Product.objects.filter(is_active=True).order_by('-created_at', '-id')
+            orders = Order.objects.filter(user=user).order_by('-created_at', '-id')
+
+            cases = [
+                (
+                    'product page',
+                    lambda: ProductSerializer(
+                        ProductSerializer.setup_eager_loading(products)[:page_size], many=True
+                    ).data,
+                    lambda: FastProductSerializer.serialize_many(FastProductSerializer.values(products)[:page_size]),
+                ),
+                (
+                    'order page',
+                    lambda: OrderSerializer(
+                        OrderSerializer.setup_eager_loading(orders)[:page_size], many=True
+                    ).data,
+                    lambda: FastOrderSerializer.serialize_many(FastOrderSerializer.values(orders)[:page_size]),
+                ),
+                (
+                    'cart',
+                    lambda: CartSerializer(CartSerializer.setup_eager_loading(Cart.objects.all()).get(pk=cart.pk)).data,
+                    lambda: FastCartSerializer.load(cart.pk),
+                ),
+            ]
+
+            renderer = JSONRenderer()
+            mismatches = []
+            for label, drf, fast in cases:
+                expected, actual = renderer.render(drf()), renderer.render(fast())
+                if expected != actual:
+                    mismatches.append(label)
+                    self.stderr.write(f'{label}: output differs\n  drf:  {expected[:300]!r}\n  fast: {actual[:300]!r}')
+                    continue
+
+                line = [f'{label:<13}']
+                medians = []
+                for name, build in (('drf', drf), ('fast', fast)):
+                    timings = []
+                    for _ in range(options['repeat']):
+                        with Stopwatch() as timer:
+                            renderer.render(build())
+                        timings.append(timer.elapsed * 1000)
+                    medians.append(statistics.median(timings))
+                    line.append(f'{name}: median {medians[-1]:.2f}ms max {max(timings):.2f}ms')
+                line.append(f'speedup {medians[0] / medians[1]:.1f}x')
+                self.stdout.write(' | '.join(line))
+
+        if mismatches:
+            raise CommandError(f'Fast serializer output differs for: {", ".join(mismatches)}')
+        self.stdout.write(self.style.SUCCESS('Fast serializer output matches byte for byte.'))
+
+    def seed(self, rng, product_count, order_count):
+        categories = Category.objects.bulk_create([Category(name=f'Category {i}') for i in range(10)])
+        Product.objects.bulk_create([
+            Product(
+                name=f'Product {i}',
+                description=f'Description of product {i}',
+                price=Decimal(rng.randint(100, 100_000)) / 100,
+                stock=rng.randint(0, 500),
+                # A few uncategorised products exercise the null category branch
+                category=rng.choice(categories) if i % 20 else None,
+                image_url=f'https://example.com/{i}.jpg' if i % 3 else None,
+                # Uploaded images, rendered and not yet rendered, exercise the image set
+                image=f'products/originals/{i:064x}.jpg' if i % 4 == 0 else '',
+                image_variants={
+                    name: {
+                        'width': width,
+                        'webp': f'products/variants/{i}-{name}.webp',
+                        'jpeg': f'products/variants/{i}-{name}.jpg',
+                    }
+                    for name, width in VARIANTS
+                } if i % 8 == 0 else {},
+            )
+            for i in range(product_count)
+        ])
+        products = list(Product.objects.all())
+
+        user = User.objects.create_user('bench', 'bench@example.com', 'bench', first_name='Bench')
+        orders = Order.objects.bulk_create([
+            Order(
+                user=user, full_name='Bench User', email='bench@example.com', address='1 Bench St',
+                phone_number='555-0100', status=rng.choice(Order.STATUS_CHOICES)[0],
+                total_amount=Decimal(rng.randint(100, 100_000)) / 100,
+            )
+            for _ in range(order_count)
+        ])
+        OrderItem.objects.bulk_create([
+            OrderItem(order=order, product=product, quantity=rng.randint(1, 5), price=product.price)
+            for order in orders
+            for product in rng.sample(products, 3)
+        ])
+
+        cart = Cart.objects.create(user=user)
+        lines = [
+            CartItem(cart=cart, product=product, quantity=rng.randint(1, 5))
+            for product in rng.sample(products, 20)
+        ]
+        CartItem.objects.bulk_create(lines)
+        Cart.objects.filter(pk=cart.pk).reconcile_totals()
+        return user, cart
@@ -0,0 +1,73 @@
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.db import connection, connections
+from django.test.utils import CaptureQueriesContext, override_settings
+from rest_framework.test import APIClient
+
+from api.benchmarks.utils import Stopwatch, scratch_database, summarize
+
+
+class Command(BaseCommand):
+    help = 'Measure signups per second through the registration endpoint.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--signups', type=int, default=200, help='Number of accounts to register.')
+        parser.add_argument('--threads', type=int, default=8, help='Concurrent signup workers.')
+        parser.add_argument(
+            '--iterations', type=int, default=None,
+            help='PBKDF2 iterations to hash with (default: PASSWORD_HASH_ITERATIONS, or Django\'s default).',
+        )
+
+    def handle(self, *args, **options):
+        iterations = options['iterations']
+        if iterations is None:
+            iterations = settings.PASSWORD_HASH_ITERATIONS
+        with override_settings(PASSWORD_HASH_ITERATIONS=iterations), scratch_database():
+            queries = self.count_queries()
+            results, elapsed = self.run_signups(options['signups'], options['threads'])
+        self.report(results, elapsed, queries, iterations)
+
+    @staticmethod
+    def register(client, username):
+        return client.post('/api/auth/register/', {
+            'username': username, 'email': f'{username}@example.com',
+            'first_name': 'Bench', 'last_name': 'User',
+            'password': 'correct-horse-battery', 'password2': 'correct-horse-battery',
+        }, format='json')
+
+    def count_queries(self):
+        with CaptureQueriesContext(connection) as captured:
+            response = self.register(APIClient(), 'warmup')
+        if response.status_code != 201:
+            raise RuntimeError(f'Signup failed with {response.status_code}: {response.content[:200]!r}')
+        return len(captured)
+
+    def run_signups(self, signups, threads):
+        results = []
+        lock = threading.Lock()
+
+        def signup(index):
+            with Stopwatch() as timer:
+                response = self.register(APIClient(), f'signup{index}')
+            connections.close_all()
+            with lock:
+                results.append((response.status_code, timer.elapsed))
+
+        with Stopwatch() as wall:
+            with ThreadPoolExecutor(max_workers=threads) as pool:
+                list(pool.map(signup, range(signups)))
+        return results, wall.elapsed
+
+    def report(self, results, elapsed, queries, iterations):
+        created = sum(1 for code, _ in results if code == 201)
+        stats = summarize([latency for code, latency in results if code == 201], elapsed)
+        self.stdout.write(
+            f"{created}/{len(results)} signups in {elapsed:.2f}s ({stats['throughput']:.1f}/s), "
+            f"p50 {stats['p50_ms']:.1f}ms p95 {stats['p95_ms']:.1f}ms p99 {stats['p99_ms']:.1f}ms"
+        )
+        self.stdout.write(f"{queries} queries per signup, PBKDF2 iterations {iterations or 'default'}")
+        if created != len(results):
+            self.stderr.write(self.style.ERROR(f'{len(results) - created} signups failed.'))
@@ -0,0 +1,24 @@
+from django.core.management.base import BaseCommand
+
+from api.cache import bump_generation, cache_stats, reset_stats
+
+
+class Command(BaseCommand):
+    help = 'Show catalog cache hit/miss counters, reset them, or invalidate cached responses.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--reset-stats', action='store_true', help='Zero the hit/miss counters.')
+        parser.add_argument('--invalidate', action='store_true', help='Drop every cached catalog response.')
+
+    def handle(self, *args, **options):
+        stats = cache_stats()
+        self.stdout.write(
+            f"hits {stats['hits']}, misses {stats['misses']}, hit rate {stats['hit_rate']:.1%}"
+        )
+        if options['reset_stats']:
+            reset_stats()
+            self.stdout.write('Counters reset.')
+        if options['invalidate']:
+            bump_generation('product')
+            bump_generation('category')
+            self.stdout.write('Catalog cache invalidated.')
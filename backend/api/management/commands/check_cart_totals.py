@@ -0,0 +1,27 @@
+from django.core.management.base import BaseCommand
+
+from api.models import Cart
+
+
+class Command(BaseCommand):
+    help = "Find carts whose stored subtotal/item count drifted from their lines, and optionally fix them."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--fix', action='store_true', help='Recompute the totals of drifted carts.')
+        parser.add_argument('--all', action='store_true', help='With --fix, recompute every cart in one UPDATE.')
+        parser.add_argument('--show', type=int, default=20, help='How many drifted carts to list.')
+
+    def handle(self, *args, **options):
+        drifted = Cart.objects.drifted()
+        count = drifted.count()
+        for cart in drifted.order_by('pk')[:options['show']]:
+            self.stdout.write(
+                f"cart {cart.pk}: stored {cart.item_count} items / {cart.subtotal}, "
+                f"actual {cart.computed_item_count} items / {cart.computed_subtotal}"
+            )
+        self.stdout.write(f"{count} carts drifted.")
+
+        if options['fix']:
+            carts = Cart.objects.all() if options['all'] else Cart.objects.filter(pk__in=drifted.values('pk'))
+            fixed = carts.reconcile_totals()
+            self.stdout.write(self.style.SUCCESS(f"Recomputed totals for {fixed} carts."))
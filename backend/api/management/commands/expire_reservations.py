@@ -0,0 +1,27 @@
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import close_old_connections
+
+from api.inventory import release_expired_holds, sync_sharded_stock
+
+
+class Command(BaseCommand):
+    help = (
+        'Delete expired cart stock holds and copy sharded stock totals into Product.stock. '
+        'Run it from cron, or keep it running with --interval.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--interval', type=float, help='Repeat every N seconds instead of running once.')
+
+    def handle(self, *args, **options):
+        while True:
+            released = release_expired_holds()
+            synced = sync_sharded_stock()
+            if released or synced or options['verbosity'] > 1:
+                self.stdout.write(f'Released {released} expired holds, synced stock of {synced} sharded products.')
+            if not options['interval']:
+                break
+            close_old_connections()
+            time.sleep(options['interval'])
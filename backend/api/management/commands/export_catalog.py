@@ -0,0 +1,30 @@
+import sys
+
+from django.core.management.base import BaseCommand
+
+from api.catalog_io import DEFAULT_CHUNK_SIZE, EXPORT_FORMATS, RENDERERS, export_rows
+from api.models import Product
+
+
+class Command(BaseCommand):
+    help = 'Stream every product to NDJSON or CSV, reading the table in chunks.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('output', nargs='?', default='-', help='Output file, or - for stdout.')
+        parser.add_argument('--format', choices=EXPORT_FORMATS, help='Defaults to the output file extension, else ndjson.')
+        parser.add_argument('--chunk-size', type=int, default=DEFAULT_CHUNK_SIZE)
+        parser.add_argument('--active-only', action='store_true')
+
+    def handle(self, *args, **options):
+        output = options['output']
+        export_format = options['format'] or ('csv' if output.endswith('.csv') else 'ndjson')
+        queryset = Product.objects.filter(is_active=True) if options['active_only'] else Product.objects.all()
+        lines = RENDERERS[export_format](export_rows(queryset, chunk_size=options['chunk_size']))
+
+        if output == '-':
+            sys.stdout.writelines(lines)
+            return
+        # newline='' so the csv module's \r\n row endings are written unchanged
+        with open(output, 'w', encoding='utf-8', newline='') as f:
+            f.writelines(lines)
+        self.stderr.write(self.style.SUCCESS(f'Wrote {output}'))
@@ -0,0 +1,35 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from api.catalog_io import DEFAULT_CHUNK_SIZE, EXPORT_FORMATS, READERS, CatalogImporter
+
+
+class Command(BaseCommand):
+    help = 'Upsert products by sku from an NDJSON or CSV file, streamed in chunks.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('path')
+        parser.add_argument('--format', choices=EXPORT_FORMATS, help='Defaults to the file extension, else ndjson.')
+        parser.add_argument('--chunk-size', type=int, default=DEFAULT_CHUNK_SIZE)
+
+    def handle(self, *args, **options):
+        path = options['path']
+        import_format = options['format'] or ('csv' if path.endswith('.csv') else 'ndjson')
+        importer = CatalogImporter(chunk_size=options['chunk_size'])
+
+        def progress(result):
+            self.stdout.write(f'{result.rows} rows read, {result.upserted} upserted, {result.error_count} errors')
+
+        try:
+            with open(path, encoding='utf-8-sig', newline='') as f:
+                result = importer.run(READERS[import_format](f), progress=progress if options['verbosity'] > 1 else None)
+        except OSError as exc:
+            raise CommandError(exc)
+
+        for error in result.errors:
+            self.stderr.write(f"line {error['line']}: {error['error']}")
+        if result.error_count > len(result.errors):
+            self.stderr.write(f'... and {result.error_count - len(result.errors)} more errors')
+        self.stdout.write(self.style.SUCCESS(
+            f'{result.rows} rows read: {result.upserted} products upserted, '
+            f'{result.categories_created} categories created, {result.error_count} rows rejected.'
+        ))
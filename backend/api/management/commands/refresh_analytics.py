@@ -0,0 +1,49 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.utils.dateparse import parse_date
+
+from api import analytics, rankings
+
+
+class Command(BaseCommand):
+    help = (
+        'Bring the daily sales rollups up to date with orders changed since the last run, '
+        'snapshot today\'s stock and recompute the product rankings. Run it from cron (at least '
+        'daily, as the ranking windows move); --rebuild recomputes from scratch.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--rebuild', action='store_true', help='Recompute every day instead of changed days only.')
+        parser.add_argument('--start', help='With --rebuild, first day to backfill (YYYY-MM-DD).')
+        parser.add_argument('--end', help='With --rebuild, last day to backfill (YYYY-MM-DD).')
+        parser.add_argument('--skip-snapshot', action='store_true', help="Don't snapshot stock levels.")
+        parser.add_argument('--skip-rankings', action='store_true', help="Don't recompute the product rankings.")
+
+    def handle(self, *args, **options):
+        start, end = self.parse_day(options['start']), self.parse_day(options['end'])
+        if (start or end) and not options['rebuild']:
+            raise CommandError('--start and --end only apply with --rebuild.')
+
+        if options['rebuild']:
+            days = analytics.rebuild_rollups(start, end)
+        else:
+            days = analytics.refresh_rollups()
+        self.stdout.write(f'Recomputed sales rollups for {len(days)} days.')
+
+        if not options['skip_snapshot']:
+            count = analytics.take_stock_snapshot()
+            self.stdout.write(f'Snapshot stock for {count} products.')
+
+        if not options['skip_rankings']:
+            count = rankings.refresh_rankings()
+            self.stdout.write(f'Recomputed {count} product rankings.')
+
+    def parse_day(self, value):
+        if value is None:
+            return None
+        try:
+            day = parse_date(value)
+        except ValueError:
+            day = None
+        if day is None:
+            raise CommandError(f'Invalid date: {value}')
+        return day
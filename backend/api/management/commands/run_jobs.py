@@ -0,0 +1,71 @@
+import datetime
+import os
+import socket
+import threading
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import close_old_connections, connections
+
+from api import jobs
+
+
+class Command(BaseCommand):
+    help = 'Run queued background jobs (order emails, analytics refreshes, ...) with N worker threads.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--concurrency', type=int, default=4, help='Worker threads.')
+        parser.add_argument('--poll', type=float, default=1.0, help='Seconds to wait when the queue is empty.')
+        parser.add_argument('--burst', action='store_true', help='Exit once no jobs are due instead of polling.')
+        parser.add_argument('--keep-days', type=int, default=7, help='Delete finished jobs after this many days.')
+
+    def handle(self, *args, **options):
+        self.options = options
+        self.stop = threading.Event()
+        self.name = f'{socket.gethostname()}:{os.getpid()}'
+        self.housekeeping()
+
+        threads = [
+            threading.Thread(target=self.work, args=(f'{self.name}:{index}',), daemon=True)
+            for index in range(options['concurrency'])
+        ]
+        for thread in threads:
+            thread.start()
+        try:
+            while any(thread.is_alive() for thread in threads):
+                for thread in threads:
+                    thread.join(timeout=60)
+                if not options['burst']:
+                    self.housekeeping()
+        except KeyboardInterrupt:
+            self.stdout.write('Stopping after the jobs in progress...')
+            self.stop.set()
+            for thread in threads:
+                thread.join()
+
+    def work(self, worker):
+        try:
+            while not self.stop.is_set():
+                claimed = jobs.claim(worker)
+                if not claimed:
+                    if self.options['burst']:
+                        return
+                    close_old_connections()
+                    self.stop.wait(self.options['poll'])
+                    continue
+                for job in claimed:
+                    started = time.perf_counter()
+                    ok = jobs.run(job)
+                    self.stdout.write(
+                        f"{worker} {job.name} #{job.pk} {'done' if ok else 'failed'} "
+                        f"in {(time.perf_counter() - started) * 1000:.0f}ms"
+                    )
+        finally:
+            connections.close_all()
+
+    def housekeeping(self):
+        requeued = jobs.requeue_stuck_jobs()
+        purged = jobs.purge_finished(datetime.timedelta(days=self.options['keep_days']))
+        if requeued or purged:
+            self.stdout.write(f'Requeued {requeued} stuck jobs, purged {purged} finished jobs.')
+        close_old_connections()
@@ -0,0 +1,26 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from api.inventory import set_sharding
+from api.models import Product
+
+
+class Command(BaseCommand):
+    help = (
+        "Split a hot product's stock over several counter rows so concurrent checkouts don't "
+        'queue on one row lock, or fold it back with --shards 0.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('product_ids', nargs='+', type=int)
+        parser.add_argument('--shards', type=int, default=8, help='Number of shards (0 to unshard).')
+
+    def handle(self, *args, **options):
+        if not 0 <= options['shards'] <= 256:
+            raise CommandError('--shards must be between 0 and 256.')
+        for product_id in options['product_ids']:
+            try:
+                set_sharding(product_id, options['shards'])
+            except Product.DoesNotExist:
+                raise CommandError(f'Product {product_id} does not exist.')
+            stock = Product.objects.values_list('stock', flat=True).get(pk=product_id)
+            self.stdout.write(f"Product {product_id}: {stock} units over {options['shards']} shards.")
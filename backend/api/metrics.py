@@ -0,0 +1,279 @@
+"""
+Per-view request metrics, exported in the Prometheus text format on /metrics.
+
+MetricsMiddleware times each request and, through a database execute wrapper
+and a hook on DRF's ``Serializer.data``, how much of that went to SQL and to
+serialization. Everything is aggregated in memory per (URL name, method), so
+recording a request is a few additions under a lock. Each server process
+keeps its own figures: with several workers, Prometheus sees whichever
+process answers the scrape, so scrape each worker or run one per container.
+
+Requests over METRICS_QUERY_BUDGET queries or METRICS_LATENCY_BUDGET_MS are
+logged to the ``api.metrics`` logger.
+"""
+import contextlib
+import contextvars
+import logging
+import threading
+import time
+from bisect import bisect_left
+from collections import Counter
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.core.exceptions import MiddlewareNotUsed
+
+logger = logging.getLogger(__name__)
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+QUERY_BUCKETS = (0, 1, 2, 3, 5, 10, 20, 50, 100)
+SIZE_BUCKETS = (256, 1024, 4096, 16384, 65536, 262144, 1048576)
+
+_current = contextvars.ContextVar('request_metrics', default=None)
+
+
+class RequestStats:
+    """What the request in progress has spent so far."""
+    __slots__ = ('queries', 'db_time', 'serializer_time', 'serializing')
+
+    def __init__(self):
+        self.queries = 0
+        self.db_time = 0.0
+        self.serializer_time = 0.0
+        self.serializing = False
+
+
+class Histogram:
+    __slots__ = ('buckets', 'counts', 'sum', 'count')
+
+    def __init__(self, buckets):
+        self.buckets = buckets
+        # One slot per bucket plus +Inf; made cumulative when exported
+        self.counts = [0] * (len(buckets) + 1)
+        self.sum = 0
+        self.count = 0
+
+    def observe(self, value):
+        self.counts[bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+
+class ViewMetrics:
+    __slots__ = ('latency', 'queries', 'response_size', 'db_seconds', 'serializer_seconds', 'statuses')
+
+    def __init__(self):
+        self.latency = Histogram(LATENCY_BUCKETS)
+        self.queries = Histogram(QUERY_BUCKETS)
+        self.response_size = Histogram(SIZE_BUCKETS)
+        self.db_seconds = 0.0
+        self.serializer_seconds = 0.0
+        self.statuses = Counter()
+
+
+_lock = threading.Lock()
+_views = {}
+
+
+def record(view, method, status, elapsed, stats, size):
+    with _lock:
+        metrics = _views.get((view, method))
+        if metrics is None:
+            metrics = _views[(view, method)] = ViewMetrics()
+        metrics.latency.observe(elapsed)
+        metrics.queries.observe(stats.queries)
+        if size is not None:
+            metrics.response_size.observe(size)
+        metrics.db_seconds += stats.db_time
+        metrics.serializer_seconds += stats.serializer_time
+        metrics.statuses[status] += 1
+
+
+def reset():
+    with _lock:
+        _views.clear()
+
+
+# Hooks
+
+
+def db_execute_wrapper(execute, sql, params, many, context):
+    stats = _current.get()
+    if stats is None:
+        return execute(sql, params, many, context)
+    start = time.perf_counter()
+    try:
+        return execute(sql, params, many, context)
+    finally:
+        stats.queries += 1
+        stats.db_time += time.perf_counter() - start
+
+
+def install_db_wrapper(sender, connection, **kwargs):
+    """connection_created receiver: time every query run on the connection."""
+    if db_execute_wrapper not in connection.execute_wrappers:
+        connection.execute_wrappers.append(db_execute_wrapper)
+
+
+@contextlib.contextmanager
+def serializer_timer():
+    """Count the block as serialization time; nested blocks are only counted once."""
+    stats = _current.get()
+    if stats is None or stats.serializing:
+        yield
+        return
+    stats.serializing = True
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        stats.serializing = False
+        stats.serializer_time += time.perf_counter() - start
+
+
+def install_serializer_hook():
+    """Time DRF's ``serializer.data``, which every DRF view response goes through."""
+    from rest_framework.serializers import BaseSerializer
+
+    data = BaseSerializer.data
+    if getattr(data.fget, 'timed', False):
+        return
+
+    def timed_data(self):
+        with serializer_timer():
+            return data.fget(self)
+    timed_data.timed = True
+    BaseSerializer.data = property(timed_data)
+
+
+def install():
+    from django.db.backends.signals import connection_created
+    from django.db import connections
+
+    connection_created.connect(install_db_wrapper, dispatch_uid='api.metrics')
+    for connection in connections.all(initialized_only=True):
+        install_db_wrapper(None, connection)
+    install_serializer_hook()
+
+
+def enabled():
+    return getattr(settings, 'METRICS_ENABLED', False)
+
+
+class MetricsMiddleware:
+    """Record latency, queries, DB time, serializer time and size per URL name. Put it first."""
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        if not enabled():
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+        self.query_budget = getattr(settings, 'METRICS_QUERY_BUDGET', None)
+        self.latency_budget = getattr(settings, 'METRICS_LATENCY_BUDGET_MS', None)
+        self.async_mode = iscoroutinefunction(get_response)
+        if self.async_mode:
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if self.async_mode:
+            return self.__acall__(request)
+        stats = RequestStats()
+        token = _current.set(stats)
+        start = time.perf_counter()
+        try:
+            response = self.get_response(request)
+        finally:
+            _current.reset(token)
+        self.finish(request, response, stats, time.perf_counter() - start)
+        return response
+
+    async def __acall__(self, request):
+        stats = RequestStats()
+        token = _current.set(stats)
+        start = time.perf_counter()
+        try:
+            response = await self.get_response(request)
+        finally:
+            _current.reset(token)
+        self.finish(request, response, stats, time.perf_counter() - start)
+        return response
+
+    def finish(self, request, response, stats, elapsed):
+        match = request.resolver_match
+        view = match.view_name if match else 'unmatched'
+        size = None if response.streaming else len(response.content)
+        record(view, request.method, response.status_code, elapsed, stats, size)
+
+        over_queries = self.query_budget is not None and stats.queries > self.query_budget
+        over_latency = self.latency_budget is not None and elapsed * 1000 > self.latency_budget
+        if over_queries or over_latency:
+            logger.warning(
+                'Request over budget: %s %s (%s) took %.0fms, %d queries (%.0fms in the database), '
+                '%.0fms serializing',
+                request.method, request.get_full_path(), view, elapsed * 1000,
+                stats.queries, stats.db_time * 1000, stats.serializer_time * 1000,
+            )
+
+
+# Prometheus text format
+
+
+def _labels(view, method, **extra):
+    labels = {'view': view, 'method': method, **extra}
+    return ','.join(
+        '{}="{}"'.format(key, str(value).replace('\\', r'\\').replace('"', r'\"').replace('\n', r'\n'))
+        for key, value in labels.items()
+    )
+
+
+def snapshot():
+    """Copies of the per-view metrics, sorted by (view, method)."""
+    with _lock:
+        return [(key, _copy(metrics)) for key, metrics in sorted(_views.items())]
+
+
+def _copy(metrics):
+    copy = ViewMetrics()
+    for name in ('latency', 'queries', 'response_size'):
+        source, target = getattr(metrics, name), getattr(copy, name)
+        target.counts, target.sum, target.count = list(source.counts), source.sum, source.count
+    copy.db_seconds = metrics.db_seconds
+    copy.serializer_seconds = metrics.serializer_seconds
+    copy.statuses = Counter(metrics.statuses)
+    return copy
+
+
+def render_prometheus():
+    views = snapshot()
+    lines = [
+        '# HELP http_requests_total Requests handled, by URL name, method and status.',
+        '# TYPE http_requests_total counter',
+    ]
+    for (view, method), metrics in views:
+        for status, count in sorted(metrics.statuses.items()):
+            lines.append(f'http_requests_total{{{_labels(view, method, status=status)}}} {count}')
+
+    for name, attr, help_text in (
+        ('http_request_duration_seconds', 'latency', 'Time from the first middleware in to the response out.'),
+        ('http_request_db_queries', 'queries', 'SQL queries run per request.'),
+        ('http_response_size_bytes', 'response_size', 'Response body size (streaming responses are not counted).'),
+    ):
+        lines += [f'# HELP {name} {help_text}', f'# TYPE {name} histogram']
+        for (view, method), metrics in views:
+            histogram = getattr(metrics, attr)
+            labels = _labels(view, method)
+            cumulative = 0
+            for bound, count in zip((*histogram.buckets, '+Inf'), histogram.counts):
+                cumulative += count
+                lines.append(f'{name}_bucket{{{labels},le="{bound}"}} {cumulative}')
+            lines.append(f'{name}_sum{{{labels}}} {histogram.sum}')
+            lines.append(f'{name}_count{{{labels}}} {histogram.count}')
+
+    for name, attr, help_text in (
+        ('http_request_db_seconds_total', 'db_seconds', 'Time spent executing SQL.'),
+        ('http_request_serializer_seconds_total', 'serializer_seconds', 'Time spent building serializer output.'),
+    ):
+        lines += [f'# HELP {name} {help_text}', f'# TYPE {name} counter']
+        lines += [f'{name}{{{_labels(view, method)}}} {getattr(metrics, attr)}' for (view, method), metrics in views]
+    return '\n'.join(lines) + '\n'
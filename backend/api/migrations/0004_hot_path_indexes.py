@@ -0,0 +1,42 @@
+# Generated by Django 5.1.7 on 2026-10-18 11:31
+
+from django.db import migrations, models
+from django.db.models import Count, Min, Sum
+
+
+def merge_duplicate_cart_items(apps, schema_editor):
+    # Fold repeated (cart, product) lines into the oldest one before the unique constraint
+    CartItem = apps.get_model('api', 'CartItem')
+    duplicates = (
+        CartItem.objects.values('cart_id', 'product_id')
+        .annotate(lines=Count('id'), keep=Min('id'), quantity=Sum('quantity'))
+        .filter(lines__gt=1)
+    )
+    for line in duplicates:
+        CartItem.objects.filter(pk=line['keep']).update(quantity=line['quantity'])
+        CartItem.objects.filter(
+            cart_id=line['cart_id'], product_id=line['product_id']
+        ).exclude(pk=line['keep']).delete()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0003_pagination_indexes'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='product',
+            index=models.Index(condition=models.Q(('is_active', True)), fields=['category', 'price'], name='product_active_cat_price_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='product',
+            index=models.Index(condition=models.Q(('is_active', True)), fields=['category', '-created_at'], name='product_active_cat_created_idx'),
+        ),
+        migrations.RunPython(merge_duplicate_cart_items, migrations.RunPython.noop),
+        migrations.AddConstraint(
+            model_name='cartitem',
+            constraint=models.UniqueConstraint(fields=('cart', 'product'), name='cartitem_unique_product'),
+        ),
+    ]
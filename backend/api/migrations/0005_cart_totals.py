@@ -0,0 +1,42 @@
+# Generated by Django 5.1.7 on 2026-10-18 11:33
+
+from decimal import Decimal
+
+from django.db import migrations, models
+from django.db.models import F, OuterRef, Subquery, Sum, Value
+from django.db.models.functions import Coalesce
+
+
+def backfill_cart_totals(apps, schema_editor):
+    Cart = apps.get_model('api', 'Cart')
+    CartItem = apps.get_model('api', 'CartItem')
+    lines = CartItem.objects.filter(cart=OuterRef('pk')).order_by().values('cart')
+    subtotal = lines.annotate(
+        total=Sum(F('quantity') * F('product__price'), output_field=models.DecimalField(max_digits=12, decimal_places=2))
+    ).values('total')
+    item_count = lines.annotate(count=Sum('quantity')).values('count')
+    Cart.objects.update(
+        subtotal=Coalesce(Subquery(subtotal), Value(Decimal('0'))),
+        item_count=Coalesce(Subquery(item_count), Value(0)),
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0004_hot_path_indexes'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='cart',
+            name='item_count',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='cart',
+            name='subtotal',
+            field=models.DecimalField(decimal_places=2, default=0, max_digits=12),
+        ),
+        migrations.RunPython(backfill_cart_totals, migrations.RunPython.noop),
+    ]
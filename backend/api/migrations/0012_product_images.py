@@ -0,0 +1,24 @@
+# Generated by Django 5.1.7 on 2026-10-18 12:09
+
+import api.images
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0011_admin_search_indexes'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='product',
+            name='image',
+            field=models.FileField(blank=True, upload_to=api.images.original_path, validators=[api.images.validate_image_file]),
+        ),
+        migrations.AddField(
+            model_name='product',
+            name='image_variants',
+            field=models.JSONField(blank=True, default=dict, editable=False),
+        ),
+    ]
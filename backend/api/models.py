@@ -1,7 +1,13 @@
+from decimal import Decimal
+
 from django.db import models
+from django.db.models import Case, F, OuterRef, Subquery, Sum, Value, When
+from django.db.models.functions import Coalesce, Round
 from django.contrib.auth.models import User
 from django.utils import timezone
 
+from .images import original_path, validate_image_file
+
 
 class Category(models.Model):
     name = models.CharField(max_length=100)
@@ -16,20 +22,83 @@ class Category(models.Model):
         return self.name
 
 
+class ProductQuerySet(models.QuerySet):
+    def with_availability(self, exclude_cart=None):
+        """
+        Annotate ``on_hand`` (the shard total for sharded products), ``held`` (units in
+        unexpired reservations, other than ``exclude_cart``'s) and ``available``.
+        """
+        held = StockReservation.objects.active().filter(product=OuterRef('pk'))
+        if exclude_cart is not None:
+            held = held.exclude(cart_item__cart=exclude_cart)
+        held = held.order_by().values('product').annotate(total=Sum('quantity')).values('total')
+        shards = (
+            StockShard.objects.filter(product=OuterRef('pk'))
+            .order_by().values('product').annotate(total=Sum('stock')).values('total')
+        )
+        return self.annotate(
+            on_hand=Case(When(stock_shards__gt=0, then=Coalesce(Subquery(shards), 0)), default=F('stock')),
+            held=Coalesce(Subquery(held), 0),
+        ).annotate(available=F('on_hand') - F('held'))
+
+
 class Product(models.Model):
     name = models.CharField(max_length=255)
+    # Natural key for bulk import/export; optional for products created through the admin or API
+    sku = models.CharField(max_length=64, unique=True, null=True, blank=True)
     description = models.TextField()
     price = models.DecimalField(max_digits=10, decimal_places=2)
     stock = models.PositiveIntegerField(default=0)
     is_active = models.BooleanField(default=True)
     category = models.ForeignKey(Category, on_delete=models.SET_NULL, null=True, related_name='products')
     image_url = models.URLField(blank=True, null=True)
+    # Uploaded original; resized copies are rendered in the background, see api.images
+    image = models.FileField(upload_to=original_path, validators=[validate_image_file], blank=True)
+    image_variants = models.JSONField(default=dict, blank=True, editable=False)
+    # Hot SKUs keep their stock in this many StockShard rows instead (0 = not sharded); see api.inventory
+    stock_shards = models.PositiveSmallIntegerField(default=0)
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
 
+    objects = ProductQuerySet.as_manager()
+
+    # Columns whose previous values the save signals need
+    TRACKED_FIELDS = ('price', 'stock', 'category_id', 'image')
+
+    class Meta:
+        indexes = [
+            # Keyset pagination seeks on (ordering field, id) within active products. These are
+            # partial indexes because SQLite filters booleans as a bare "WHERE is_active", which
+            # can't use an is_active key column but does match an index condition.
+            models.Index(
+                fields=['created_at', 'id'], condition=models.Q(is_active=True), name='product_active_created_idx'
+            ),
+            models.Index(fields=['price', 'id'], condition=models.Q(is_active=True), name='product_active_price_idx'),
+            models.Index(fields=['name', 'id'], condition=models.Q(is_active=True), name='product_active_name_idx'),
+            # Category pages: price range filters and newest-first listings over active products only
+            models.Index(
+                fields=['category', 'price'], condition=models.Q(is_active=True), name='product_active_cat_price_idx'
+            ),
+            models.Index(
+                fields=['category', '-created_at'], condition=models.Q(is_active=True),
+                name='product_active_cat_created_idx',
+            ),
+            # Admin prefix search covers inactive products too
+            models.Index(fields=['name'], name='product_name_idx'),
+        ]
+
     def __str__(self):
         return self.name
 
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        # The columns the save signals compare against, as loaded, so saving needs no extra read (see api.signals)
+        instance._loaded = {
+            name: value for name, value in zip(field_names, values) if name in cls.TRACKED_FIELDS
+        }
+        return instance
+
 
 class Profile(models.Model):
     user = models.OneToOneField(User, on_delete=models.CASCADE, related_name='profile')
@@ -42,14 +111,55 @@ class Profile(models.Model):
         return f"Profile for {self.user.username}"
 
 
+def cart_line_totals():
+    """Subquery expressions for a cart's subtotal and item count, computed from its lines."""
+    lines = CartItem.objects.filter(cart=OuterRef('pk')).order_by().values('cart')
+    subtotal = lines.annotate(
+        total=Sum(F('quantity') * F('product__price'), output_field=models.DecimalField(max_digits=12, decimal_places=2))
+    ).values('total')
+    item_count = lines.annotate(count=Sum('quantity')).values('count')
+    return (
+        Round(Coalesce(Subquery(subtotal), Value(Decimal('0'))), 2, output_field=models.DecimalField(max_digits=12, decimal_places=2)),
+        Coalesce(Subquery(item_count), Value(0)),
+    )
+
+
+class CartQuerySet(models.QuerySet):
+    def with_computed_totals(self):
+        subtotal, item_count = cart_line_totals()
+        return self.annotate(computed_subtotal=subtotal, computed_item_count=item_count)
+
+    def drifted(self):
+        """Carts whose stored totals disagree with their lines."""
+        return self.with_computed_totals().exclude(
+            subtotal=F('computed_subtotal'), item_count=F('computed_item_count')
+        )
+
+    def reconcile_totals(self):
+        """Recompute the stored totals of every cart in the queryset with one UPDATE."""
+        subtotal, item_count = cart_line_totals()
+        return self.update(subtotal=subtotal, item_count=item_count)
+
+
 class Cart(models.Model):
     user = models.OneToOneField(User, on_delete=models.CASCADE, related_name='cart')
+    # Maintained alongside every CartItem change so headers and badges don't need the lines
+    subtotal = models.DecimalField(max_digits=12, decimal_places=2, default=0)
+    item_count = models.PositiveIntegerField(default=0)
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
 
+    objects = CartQuerySet.as_manager()
+
     def __str__(self):
         return f"Cart for {self.user.username}"
 
+    def adjust_totals(self, quantity, amount):
+        """Apply a line change of ``quantity`` units worth ``amount`` in place."""
+        Cart.objects.filter(pk=self.pk).update(
+            subtotal=F('subtotal') + amount, item_count=F('item_count') + quantity
+        )
+
 
 class CartItem(models.Model):
     cart = models.ForeignKey(Cart, on_delete=models.CASCADE, related_name='items')
@@ -58,10 +168,59 @@ class CartItem(models.Model):
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
 
+    class Meta:
+        constraints = [
+            # One line per product; adding again bumps the quantity (see CartItemView.post)
+            models.UniqueConstraint(fields=['cart', 'product'], name='cartitem_unique_product'),
+        ]
+
     def __str__(self):
         return f"{self.quantity} x {self.product.name} in {self.cart}"
 
 
+class StockReservationQuerySet(models.QuerySet):
+    def active(self):
+        return self.filter(expires_at__gt=timezone.now())
+
+    def expired(self):
+        return self.filter(expires_at__lte=timezone.now())
+
+
+class StockReservation(models.Model):
+    """Stock held for a cart line until ``expires_at``; it goes away with the line (e.g. at checkout)."""
+    cart_item = models.OneToOneField(CartItem, on_delete=models.CASCADE, primary_key=True, related_name='reservation')
+    # Copied from the line so holds can be summed per product without a join
+    product = models.ForeignKey(Product, on_delete=models.CASCADE, related_name='reservations')
+    quantity = models.PositiveIntegerField()
+    expires_at = models.DateTimeField()
+
+    objects = StockReservationQuerySet.as_manager()
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['product', 'expires_at'], name='reservation_product_idx'),
+            models.Index(fields=['expires_at'], name='reservation_expires_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.quantity} x {self.product_id} held until {self.expires_at}"
+
+
+class StockShard(models.Model):
+    """One slice of a hot product's stock, so concurrent checkouts lock different rows."""
+    product = models.ForeignKey(Product, on_delete=models.CASCADE, related_name='stock_shard_set')
+    shard = models.PositiveSmallIntegerField()
+    stock = models.PositiveIntegerField(default=0)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['product', 'shard'], name='stockshard_unique_shard'),
+        ]
+
+    def __str__(self):
+        return f"{self.product_id}#{self.shard}: {self.stock}"
+
+
 class Order(models.Model):
     STATUS_CHOICES = (
         ('pending', 'Pending'),
@@ -81,6 +240,17 @@ class Order(models.Model):
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
 
+    class Meta:
+        indexes = [
+            models.Index(fields=['user', 'created_at', 'id'], name='order_user_created_idx'),
+            # Analytics refreshes find changed orders by updated_at and recompute whole created_at days
+            models.Index(fields=['updated_at'], name='order_updated_idx'),
+            models.Index(fields=['created_at'], name='order_created_idx'),
+            # Admin prefix search
+            models.Index(fields=['email'], name='order_email_idx'),
+            models.Index(fields=['full_name'], name='order_full_name_idx'),
+        ]
+
     def __str__(self):
         return f"Order {self.id} - {self.user.username}"
 
@@ -94,3 +264,176 @@ class OrderItem(models.Model):
 
     def __str__(self):
         return f"{self.quantity} x {self.product.name} in Order {self.order.id}"
+
+
+# Analytics rollups, maintained by api.analytics.refresh_rollups (see the refresh_analytics command).
+# Days are calendar days of Order.created_at in TIME_ZONE; cancelled orders are left out.
+
+class DailySales(models.Model):
+    date = models.DateField(unique=True)
+    orders = models.PositiveIntegerField(default=0)
+    units = models.PositiveIntegerField(default=0)
+    revenue = models.DecimalField(max_digits=14, decimal_places=2, default=0)
+
+    class Meta:
+        verbose_name_plural = 'Daily sales'
+
+    def __str__(self):
+        return f"Sales on {self.date}"
+
+
+class DailyCategorySales(models.Model):
+    date = models.DateField()
+    category = models.ForeignKey(Category, on_delete=models.CASCADE, related_name='daily_sales')
+    orders = models.PositiveIntegerField(default=0)
+    units = models.PositiveIntegerField(default=0)
+    revenue = models.DecimalField(max_digits=14, decimal_places=2, default=0)
+
+    class Meta:
+        verbose_name_plural = 'Daily category sales'
+        constraints = [
+            models.UniqueConstraint(fields=['date', 'category'], name='dailycategorysales_unique_day'),
+        ]
+
+    def __str__(self):
+        return f"{self.category} sales on {self.date}"
+
+
+class DailyProductSales(models.Model):
+    date = models.DateField()
+    product = models.ForeignKey(Product, on_delete=models.CASCADE, related_name='daily_sales')
+    orders = models.PositiveIntegerField(default=0)
+    units = models.PositiveIntegerField(default=0)
+    revenue = models.DecimalField(max_digits=14, decimal_places=2, default=0)
+
+    class Meta:
+        verbose_name_plural = 'Daily product sales'
+        constraints = [
+            models.UniqueConstraint(fields=['date', 'product'], name='dailyproductsales_unique_day'),
+        ]
+        indexes = [
+            # Per-product history (the unique constraint already serves date range scans)
+            models.Index(fields=['product', 'date'], name='dailyproductsales_product_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.product} sales on {self.date}"
+
+
+class StockSnapshot(models.Model):
+    date = models.DateField()
+    product = models.ForeignKey(Product, on_delete=models.CASCADE, related_name='stock_snapshots')
+    stock = models.PositiveIntegerField()
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['product', 'date'], name='stocksnapshot_unique_day'),
+        ]
+
+    def __str__(self):
+        return f"{self.product} stock on {self.date}"
+
+
+class RollupWatermark(models.Model):
+    """How far an incremental rollup has read its source table."""
+    name = models.CharField(max_length=50, unique=True)
+    value = models.DateTimeField()
+
+    def __str__(self):
+        return f"{self.name} @ {self.value}"
+
+
+class ProductRanking(models.Model):
+    """A precomputed top-N product list (see api.rankings); category is null for the whole catalog."""
+    name = models.CharField(max_length=30)
+    category = models.ForeignKey(Category, on_delete=models.CASCADE, null=True, blank=True, related_name='rankings')
+    # Product ids, best first
+    product_ids = models.JSONField(default=list)
+    computed_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(
+                fields=['name', 'category'], condition=models.Q(category__isnull=False), name='ranking_unique_category'
+            ),
+            models.UniqueConstraint(
+                fields=['name'], condition=models.Q(category__isnull=True), name='ranking_unique_catalog'
+            ),
+        ]
+
+    def __str__(self):
+        return f"{self.name} ({self.category or 'all categories'})"
+
+
+class Job(models.Model):
+    """A unit of background work, written in the same transaction as the change that needs it (see api.jobs)."""
+    PENDING = 'pending'
+    RUNNING = 'running'
+    DONE = 'done'
+    FAILED = 'failed'
+    STATUS_CHOICES = (
+        (PENDING, 'Pending'),
+        (RUNNING, 'Running'),
+        (DONE, 'Done'),
+        (FAILED, 'Failed'),
+    )
+
+    name = models.CharField(max_length=100)
+    payload = models.JSONField(default=dict, blank=True)
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default=PENDING)
+    attempts = models.PositiveSmallIntegerField(default=0)
+    max_attempts = models.PositiveSmallIntegerField(default=5)
+    run_after = models.DateTimeField(default=timezone.now)
+    locked_by = models.CharField(max_length=100, blank=True)
+    locked_at = models.DateTimeField(null=True, blank=True)
+    last_error = models.TextField(blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        indexes = [
+            # Workers poll for due pending jobs; only the pending (and stuck running) rows are indexed
+            models.Index(
+                fields=['run_after', 'id'], condition=models.Q(status='pending'), name='job_pending_idx'
+            ),
+            models.Index(fields=['locked_at'], condition=models.Q(status='running'), name='job_running_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.name} #{self.pk} ({self.status})"
+
+
+class Deployment(models.Model):
+    """One run of the deploy webhook: pull, install, migrate, reload (see api.deploy)."""
+    QUEUED = 'queued'
+    RUNNING = 'running'
+    SUCCEEDED = 'succeeded'
+    FAILED = 'failed'
+    STATUS_CHOICES = (
+        (QUEUED, 'Queued'),
+        (RUNNING, 'Running'),
+        (SUCCEEDED, 'Succeeded'),
+        (FAILED, 'Failed'),
+    )
+
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default=QUEUED)
+    revision_before = models.CharField(max_length=40, blank=True)
+    revision_after = models.CharField(max_length=40, blank=True)
+    # [{"name", "status", "seconds", "detail"}] in run order
+    steps = models.JSONField(default=list, blank=True)
+    log = models.TextField(blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    started_at = models.DateTimeField(null=True, blank=True)
+    finished_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        constraints = [
+            # The deploy lock: at most one deployment runs at a time
+            models.UniqueConstraint(
+                fields=['status'], condition=models.Q(status='running'), name='deployment_single_running'
+            ),
+        ]
+
+    def __str__(self):
+        return f"Deployment #{self.pk} ({self.status})"
+
@@ -0,0 +1,160 @@
+import json
+from base64 import urlsafe_b64decode, urlsafe_b64encode
+
+from django.db.models import Q
+from rest_framework.exceptions import NotFound
+from rest_framework.pagination import BasePagination, PageNumberPagination
+from rest_framework.response import Response
+from rest_framework.settings import api_settings
+from rest_framework.utils.urls import replace_query_param
+
+
+class KeysetPagination(BasePagination):
+    """
+    Cursor pagination that seeks on (ordering field, id) instead of using OFFSET.
+
+    Each page is a range read on a composite index, so page 500 costs the same as
+    page 1 and no COUNT(*) is run. Clients pick one of ``orderings`` with
+    ``?ordering=``; ids break ties so rows with equal values are never skipped or
+    repeated. Requests that send ``?page=`` (or ``?pagination=page``) get the old
+    page-number responses, count included.
+    """
+    page_size = api_settings.PAGE_SIZE
+    page_size_query_param = 'page_size'
+    max_page_size = 100
+    cursor_query_param = 'cursor'
+    ordering_query_param = 'ordering'
+    orderings = ('-created_at',)
+    invalid_cursor_message = 'Invalid cursor'
+
+    def use_page_numbers(self, request):
+        return (
+            'page' in request.query_params
+            or request.query_params.get('pagination') == 'page'
+        )
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.request = request
+        self.legacy = None
+        if self.use_page_numbers(request):
+            self.legacy = PageNumberPagination()
+            self.legacy.page_size = self.get_page_size(request)
+            return self.legacy.paginate_queryset(self.order_for_page_numbers(queryset, request), request, view)
+        return self.page_from(list(self.seek(queryset, request)))
+
+    def order_for_page_numbers(self, queryset, request):
+        if self.ordering_query_param in request.query_params or not queryset.ordered:
+            ordering = self.get_ordering(request)
+            prefix = '-' if ordering.startswith('-') else ''
+            queryset = queryset.order_by(ordering, f'{prefix}pk')
+        return queryset
+
+    def seek(self, queryset, request):
+        """
+        The lazy queryset for the requested page, plus one extra row to tell whether
+        another page follows. Evaluate it (sync or async) and pass the rows to page_from().
+        """
+        self.base_url = request.build_absolute_uri()
+        self.page_size = self.get_page_size(request)
+        self.ordering = self.get_ordering(request)
+        field_name = self.ordering.lstrip('-')
+        self.field = queryset.model._meta.get_field(field_name)
+        descending = self.ordering.startswith('-')
+
+        value, pk, self.backwards = self.decode_cursor(request)
+        self.has_cursor = value is not None
+        # Walking backwards is the same seek with the sort direction flipped
+        seek_descending = descending != self.backwards
+        if value is not None:
+            op = 'lt' if seek_descending else 'gt'
+            queryset = queryset.filter(
+                Q(**{f'{field_name}__{op}e': value})
+                & (Q(**{f'{field_name}__{op}': value}) | Q(**{f'pk__{op}': pk}))
+            )
+        prefix = '-' if seek_descending else ''
+        return queryset.order_by(f'{prefix}{field_name}', f'{prefix}pk')[:self.page_size + 1]
+
+    def page_from(self, results):
+        has_more = len(results) > self.page_size
+        results = results[:self.page_size]
+        if self.backwards:
+            results.reverse()
+
+        self.next_item = results[-1] if results and (has_more or self.backwards) else None
+        self.previous_item = (
+            results[0] if results and (has_more if self.backwards else self.has_cursor) else None
+        )
+        return results
+
+    def get_page_size(self, request):
+        try:
+            size = int(request.query_params[self.page_size_query_param])
+        except (KeyError, ValueError):
+            return self.page_size
+        return min(size, self.max_page_size) if size > 0 else self.page_size
+
+    def get_ordering(self, request):
+        ordering = request.query_params.get(self.ordering_query_param)
+        return ordering if ordering in self.orderings else self.orderings[0]
+
+    def decode_cursor(self, request):
+        encoded = request.query_params.get(self.cursor_query_param)
+        if not encoded:
+            return None, None, False
+        try:
+            cursor = json.loads(urlsafe_b64decode(encoded.encode('ascii')))
+            return self.field.to_python(cursor['v']), int(cursor['id']), bool(cursor.get('r'))
+        except Exception:
+            raise NotFound(self.invalid_cursor_message)
+
+    def encode_cursor(self, item, backwards=False):
+        field_name = self.field.name
+        value = item[field_name] if isinstance(item, dict) else getattr(item, field_name)
+        pk = item['id'] if isinstance(item, dict) else item.pk
+        cursor = {'v': value.isoformat() if hasattr(value, 'isoformat') else str(value), 'id': pk}
+        if backwards:
+            cursor['r'] = 1
+        encoded = urlsafe_b64encode(json.dumps(cursor, separators=(',', ':')).encode()).decode('ascii')
+        return replace_query_param(self.base_url, self.cursor_query_param, encoded)
+
+    def get_next_link(self):
+        if self.next_item is None:
+            return None
+        return self.encode_cursor(self.next_item)
+
+    def get_previous_link(self):
+        if self.previous_item is None:
+            return None
+        return self.encode_cursor(self.previous_item, backwards=True)
+
+    def get_paginated_response(self, data):
+        if self.legacy is not None:
+            return self.legacy.get_paginated_response(data)
+        return Response({
+            'next': self.get_next_link(),
+            'previous': self.get_previous_link(),
+            'results': data,
+        })
+
+
+class ProductPagination(KeysetPagination):
+    orderings = ('-created_at', 'created_at', 'price', '-price', 'name', '-name')
+
+    def use_page_numbers(self, request):
+        # Search results are ranked by relevance, which has no index to seek on
+        ranked_search = (
+            'search' in request.query_params
+            and self.ordering_query_param not in request.query_params
+        )
+        return ranked_search or super().use_page_numbers(request)
+
+
+class OrderPagination(KeysetPagination):
+    orderings = ('-created_at',)
+
+    def use_page_numbers(self, request):
+        # Order history pages by number and shows the count; seeking is opt-in
+        return not (
+            self.cursor_query_param in request.query_params
+            or request.query_params.get('pagination') == 'cursor'
+        )
@@ -0,0 +1,192 @@
+"""
+Precomputed top-N product lists ("rails"): newest, bestselling over 7 and 30
+days, and trending, per category and for the whole catalog.
+
+Each list is one ProductRanking row holding the product ids in rank order.
+Sales lists are ranked from the daily product rollups (api.analytics), never
+from OrderItem. Lists are refreshed in the background:
+- after the rollups catch up with new orders, the sales lists of the
+  categories that sold
+- when a product changes, every list of its category
+- from the nightly ``refresh_analytics`` run, everything, as the day windows
+  move
+
+Reads keep the id lists in process memory for RANKING_MEMO_SECONDS, or
+until a refresh bumps the 'ranking' cache generation. A list that was never
+computed is ranked live with a single query.
+"""
+import datetime
+import heapq
+import time
+from collections import defaultdict
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Case, F, IntegerField, Q, Sum, Value, When, Window
+from django.db.models.functions import RowNumber
+from django.utils import timezone
+
+from .cache import bump_generation, get_generations
+from .models import Category, DailyProductSales, Product, ProductRanking
+
+NEWEST = 'newest'
+BESTSELLING_7D = 'bestselling_7d'
+BESTSELLING_30D = 'bestselling_30d'
+TRENDING = 'trending'
+SALES_LISTS = (BESTSELLING_7D, BESTSELLING_30D, TRENDING)
+LISTS = (NEWEST, *SALES_LISTS)
+BESTSELLING_DAYS = {BESTSELLING_7D: 7, BESTSELLING_30D: 30}
+# Trending compares the daily rate of the last few days with that of the last month
+TRENDING_RECENT_DAYS = 3
+TRENDING_BASELINE_DAYS = 30
+
+
+def ranking_size():
+    return getattr(settings, 'RANKING_SIZE', 20)
+
+
+def _since(days):
+    return timezone.localdate() - datetime.timedelta(days=days - 1)
+
+
+def _sales_scores(name, categories=None):
+    """(product id, category id, score) for every active product that sold in the list's window."""
+    sales = DailyProductSales.objects.filter(product__is_active=True)
+    if categories is not None:
+        sales = sales.filter(product__category__in=categories)
+    sales = sales.values('product', 'product__category').order_by()
+    if name == TRENDING:
+        rows = sales.filter(date__gte=_since(TRENDING_BASELINE_DAYS)).annotate(
+            recent=Sum('units', filter=Q(date__gte=_since(TRENDING_RECENT_DAYS))), total=Sum('units'),
+        ).filter(recent__gt=0)
+        for row in rows.iterator():
+            score = row['recent'] / TRENDING_RECENT_DAYS - row['total'] / TRENDING_BASELINE_DAYS
+            if score > 0:
+                yield row['product'], row['product__category'], score
+    else:
+        rows = sales.filter(date__gte=_since(BESTSELLING_DAYS[name])).annotate(units=Sum('units'))
+        for row in rows.iterator():
+            yield row['product'], row['product__category'], row['units']
+
+
+def _rank_sales(name, categories, size):
+    by_category = defaultdict(list)
+    overall = []
+    for product_id, category_id, score in _sales_scores(name, categories):
+        # Ties go to the lower id so refreshes are stable
+        by_category[category_id].append((score, -product_id))
+        overall.append((score, -product_id))
+    ranked = {
+        category_id: [-negated for _, negated in heapq.nlargest(size, entries)]
+        for category_id, entries in by_category.items()
+    }
+    return ranked, [-negated for _, negated in heapq.nlargest(size, overall)]
+
+
+def _rank_newest(categories, size):
+    active = Product.objects.filter(is_active=True)
+    per_category = active.filter(category__isnull=False)
+    if categories is not None:
+        per_category = per_category.filter(category__in=categories)
+    rows = per_category.annotate(
+        position=Window(RowNumber(), partition_by=F('category'), order_by=[F('created_at').desc(), F('id').desc()])
+    ).filter(position__lte=size).order_by('category', 'position').values_list('category', 'id')
+    ranked = defaultdict(list)
+    for category_id, product_id in rows:
+        ranked[category_id].append(product_id)
+    return ranked, list(active.order_by('-created_at', '-id').values_list('id', flat=True)[:size])
+
+
+def refresh_rankings(names=LISTS, categories=None):
+    """
+    Recompute lists ``names`` for ``categories`` (ids; None for every
+    category) and for the whole catalog.
+    """
+    size = ranking_size()
+    if categories is None:
+        category_ids = list(Category.objects.values_list('id', flat=True))
+    else:
+        category_ids = list(Category.objects.filter(pk__in=categories).values_list('id', flat=True))
+
+    rows = []
+    for name in names:
+        ranked, overall = _rank_newest(categories, size) if name == NEWEST else _rank_sales(name, categories, size)
+        rows.append(ProductRanking(name=name, category_id=None, product_ids=overall))
+        rows.extend(
+            ProductRanking(name=name, category_id=category_id, product_ids=ranked.get(category_id, []))
+            for category_id in category_ids
+        )
+    with transaction.atomic():
+        stale = ProductRanking.objects.filter(name__in=names)
+        if categories is not None:
+            stale = stale.filter(Q(category__in=category_ids) | Q(category__isnull=True))
+        stale.delete()
+        ProductRanking.objects.bulk_create(rows)
+        bump_generation('ranking')
+    return len(rows)
+
+
+# Reads
+
+_memory = {}
+_memory_generation = None
+_memory_loaded_at = 0.0
+
+
+def memo_seconds():
+    return getattr(settings, 'RANKING_MEMO_SECONDS', 30)
+
+
+def ranked_ids(name, category_id=None):
+    """The stored ids of a list, best first, or None if it hasn't been computed."""
+    global _memory_generation, _memory_loaded_at
+    generation = get_generations(['ranking'])[0]
+    # With a per-process cache a refresh run by the worker or cron doesn't bump this process's
+    # generation, so the memo also expires on its own
+    if generation != _memory_generation or time.monotonic() - _memory_loaded_at > memo_seconds():
+        _memory.clear()
+        _memory_generation = generation
+        _memory_loaded_at = time.monotonic()
+    key = (name, category_id)
+    if key not in _memory:
+        _memory[key] = (
+            ProductRanking.objects.filter(name=name, category_id=category_id)
+            .values_list('product_ids', flat=True).first()
+        )
+    return _memory[key]
+
+
+def _live(name, queryset, limit):
+    """Rank ``queryset`` in the database: the one-query fallback for a list that was never stored."""
+    if name == NEWEST:
+        return queryset.order_by('-created_at', '-id')[:limit]
+    if name == TRENDING:
+        recent = Sum('daily_sales__units', filter=Q(daily_sales__date__gte=_since(TRENDING_RECENT_DAYS)))
+        total = Sum('daily_sales__units', filter=Q(daily_sales__date__gte=_since(TRENDING_BASELINE_DAYS)))
+        queryset = queryset.annotate(
+            score=recent * TRENDING_BASELINE_DAYS - total * TRENDING_RECENT_DAYS
+        ).filter(score__gt=0)
+    else:
+        queryset = queryset.annotate(
+            score=Sum('daily_sales__units', filter=Q(daily_sales__date__gte=_since(BESTSELLING_DAYS[name])))
+        ).filter(score__gt=0)
+    return queryset.order_by('-score', 'id')[:limit]
+
+
+def ranked_products(name, category_id=None, limit=None, queryset=None):
+    """Active products of a list in rank order, as a queryset."""
+    limit = min(limit or ranking_size(), ranking_size())
+    if queryset is None:
+        queryset = Product.objects.all()
+    queryset = queryset.filter(is_active=True)
+    if category_id is not None:
+        queryset = queryset.filter(category_id=category_id)
+
+    ids = ranked_ids(name, category_id)
+    if ids is None:
+        return _live(name, queryset, limit)
+    if not ids:
+        return queryset.none()
+    # Products deactivated since the refresh drop out, so take the first ``limit`` that remain
+    position = Case(*(When(pk=pk, then=Value(i)) for i, pk in enumerate(ids)), output_field=IntegerField())
+    return queryset.filter(pk__in=ids).order_by(position)[:limit]
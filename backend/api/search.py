@@ -0,0 +1,133 @@
+import re
+
+from django.conf import settings
+from django.db import connection
+from django.db.models import BooleanField, FloatField, Q
+from django.db.models.expressions import RawSQL
+from django.utils.module_loading import import_string
+
+from .models import Product
+
+# Cap the number of terms so a pasted paragraph can't build a huge query
+MAX_TERMS = 8
+TERM_RE = re.compile(r'\w+')
+
+
+def search_terms(text):
+    """Split user input into lower-cased word terms, dropping any query syntax."""
+    return TERM_RE.findall(text.lower())[:MAX_TERMS]
+
+
+class SearchBackend:
+    """
+    Interface for product search backends.
+
+    ``search`` narrows a product queryset to matches for the user's text and
+    orders it best match first; the index hooks are called from the Product
+    save/delete signals and by the ``rebuild_search_index`` command.
+    """
+
+    def search(self, queryset, text):
+        raise NotImplementedError
+
+    def index(self, products):
+        """Add or refresh the given products in the index."""
+
+    def remove(self, product_ids):
+        """Drop the given product ids from the index."""
+
+    def rebuild(self):
+        """Re-index every product from scratch."""
+
+
+class IcontainsSearchBackend(SearchBackend):
+    """Unindexed substring match, used when the database has no full-text support."""
+
+    def search(self, queryset, text):
+        return queryset.filter(Q(name__icontains=text) | Q(description__icontains=text))
+
+
+class SQLiteFTSSearchBackend(SearchBackend):
+    """SQLite FTS5 table keyed by product id, ranked with bm25()."""
+
+    table = 'api_product_fts'
+
+    def search(self, queryset, text):
+        terms = search_terms(text)
+        if not terms:
+            return queryset.none()
+        # Prefix-match every term so results show up while the user is still typing
+        match = ' '.join(f'"{term}"*' for term in terms)
+        # Join the FTS table directly so bm25() is computed once per match
+        table = connection.ops.quote_name(self.table)
+        product_table = connection.ops.quote_name(Product._meta.db_table)
+        return queryset.extra(
+            select={'search_rank': f'bm25({table})'},
+            tables=[self.table],
+            where=[f'{table}.rowid = {product_table}."id"', f'{table} MATCH %s'],
+            params=[match],
+            order_by=['search_rank', 'id'],
+        )
+
+    def index(self, products):
+        rows = [(p.pk, p.name, p.description) for p in products]
+        with connection.cursor() as cursor:
+            cursor.executemany(f'DELETE FROM {self.table} WHERE rowid = %s', [(row[0],) for row in rows])
+            cursor.executemany(f'INSERT INTO {self.table} (rowid, name, description) VALUES (%s, %s, %s)', rows)
+
+    def remove(self, product_ids):
+        with connection.cursor() as cursor:
+            cursor.executemany(f'DELETE FROM {self.table} WHERE rowid = %s', [(pk,) for pk in product_ids])
+
+    def rebuild(self):
+        with connection.cursor() as cursor:
+            cursor.execute(f'DELETE FROM {self.table}')
+            cursor.execute(
+                f'INSERT INTO {self.table} (rowid, name, description) '
+                f'SELECT id, name, description FROM {Product._meta.db_table}'
+            )
+            cursor.execute(f"INSERT INTO {self.table} ({self.table}) VALUES ('optimize')")
+
+
+class PostgresSearchBackend(SearchBackend):
+    """
+    tsvector match backed by the GIN expression index from migration 0002.
+
+    Postgres keeps an expression index up to date by itself, so the index hooks
+    have nothing to do.
+    """
+
+    config = 'english'
+
+    def document(self):
+        table = connection.ops.quote_name(Product._meta.db_table)
+        return (
+            f"to_tsvector('{self.config}', coalesce({table}.\"name\", '') || ' ' || "
+            f"coalesce({table}.\"description\", ''))"
+        )
+
+    def search(self, queryset, text):
+        terms = search_terms(text)
+        if not terms:
+            return queryset.none()
+        tsquery = ' & '.join(f'{term}:*' for term in terms)
+        query = f"to_tsquery('{self.config}', %s)"
+        return queryset.filter(
+            RawSQL(f'{self.document()} @@ {query}', (tsquery,), output_field=BooleanField())
+        ).annotate(
+            search_rank=RawSQL(f'ts_rank({self.document()}, {query})', (tsquery,), output_field=FloatField())
+        ).order_by('-search_rank', 'id')
+
+
+BACKENDS_BY_VENDOR = {
+    'sqlite': SQLiteFTSSearchBackend,
+    'postgresql': PostgresSearchBackend,
+}
+
+
+def get_search_backend():
+    """The backend named by settings.PRODUCT_SEARCH_BACKEND, or the best one for the database."""
+    backend_path = getattr(settings, 'PRODUCT_SEARCH_BACKEND', None)
+    if backend_path:
+        return import_string(backend_path)()
+    return BACKENDS_BY_VENDOR.get(connection.vendor, IcontainsSearchBackend)()
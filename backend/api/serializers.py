@@ -1,7 +1,18 @@
+import datetime
+from collections import defaultdict
+
 from rest_framework import serializers
 from django.contrib.auth.models import User
+from django.db import transaction
+from django.db.models import Prefetch
+from django.utils import timezone
 from django.contrib.auth.password_validation import validate_password
-from .models import Category, Product, Profile, Cart, CartItem, Order, OrderItem
+from django.core.exceptions import ValidationError as DjangoValidationError
+from .models import (
+    Category, Product, Profile, Cart, CartItem, Order, OrderItem, DailySales, StockReservation, StockSnapshot
+)
+from .images import image_set, validate_image_file
+from .inventory import OutOfStock, available_stock, decrement_stock
 
 
 class UserSerializer(serializers.ModelSerializer):
@@ -11,7 +22,7 @@ class UserSerializer(serializers.ModelSerializer):
 
 
 class RegisterSerializer(serializers.ModelSerializer):
-    password = serializers.CharField(write_only=True, required=True, validators=[validate_password])
+    password = serializers.CharField(write_only=True, required=True)
     password2 = serializers.CharField(write_only=True, required=True)
 
     class Meta:
@@ -26,23 +37,21 @@ class RegisterSerializer(serializers.ModelSerializer):
     def validate(self, attrs):
         if attrs['password'] != attrs['password2']:
             raise serializers.ValidationError({"password": "Password fields didn't match."})
+        # Validated against the new user's details so the similarity check sees them
+        user = User(**{field: attrs.get(field, '') for field in ('username', 'email', 'first_name', 'last_name')})
+        try:
+            validate_password(attrs['password'], user)
+        except DjangoValidationError as exc:
+            raise serializers.ValidationError({"password": list(exc.messages)})
         return attrs
 
     def create(self, validated_data):
         validated_data.pop('password2')
-        user = User.objects.create(
-            username=validated_data['username'],
-            email=validated_data['email'],
-            first_name=validated_data['first_name'],
-            last_name=validated_data['last_name']
-        )
-        user.set_password(validated_data['password'])
+        password = validated_data.pop('password')
+        # One hash and one INSERT: the profile and cart are created on first use
+        user = User(**validated_data)
+        user.set_password(password)
         user.save()
-        
-        # Create profile and cart for new user
-        Profile.objects.create(user=user)
-        Cart.objects.create(user=user)
-        
         return user
 
 
@@ -62,12 +71,25 @@ class CategorySerializer(serializers.ModelSerializer):
 
 class ProductSerializer(serializers.ModelSerializer):
     category = CategorySerializer(read_only=True)
+    images = serializers.SerializerMethodField()
     
     class Meta:
         model = Product
-        fields = ('id', 'name', 'description', 'price', 'stock', 'category', 'image_url', 'created_at')
+        fields = ('id', 'name', 'description', 'price', 'stock', 'category', 'image_url', 'images', 'created_at')
         # Exclude 'is_active' and 'updated_at' for now unless needed by the frontend list view
 
+    def get_images(self, obj):
+        return image_set(obj.image.name, obj.image_variants)
+
+    @staticmethod
+    def setup_eager_loading(queryset):
+        """Load the nested category in the same query as the products"""
+        return queryset.select_related('category')
+
+
+class ProductImageSerializer(serializers.Serializer):
+    image = serializers.FileField(validators=[validate_image_file])
+
 
 class CartItemSerializer(serializers.ModelSerializer):
     product = ProductSerializer(read_only=True)
@@ -78,19 +100,48 @@ class CartItemSerializer(serializers.ModelSerializer):
         fields = ['id', 'product', 'product_id', 'quantity']
 
 
+class CartItemQuantitySerializer(serializers.Serializer):
+    """New quantity of an existing cart line."""
+    quantity = serializers.IntegerField(min_value=1, default=1)
+
+
+class CartBatchOperationSerializer(serializers.Serializer):
+    """One step of a batch cart sync: add to, set, or remove a product's line."""
+    OPERATIONS = ('add', 'update', 'remove')
+
+    op = serializers.ChoiceField(choices=OPERATIONS)
+    product_id = serializers.IntegerField()
+    quantity = serializers.IntegerField(min_value=0, required=False)
+
+    def validate(self, attrs):
+        if attrs['op'] == 'add' and not attrs.get('quantity'):
+            raise serializers.ValidationError({"quantity": "A positive quantity is required to add an item."})
+        if attrs['op'] == 'update' and 'quantity' not in attrs:
+            raise serializers.ValidationError({"quantity": "This field is required."})
+        return attrs
+
+
 class CartSerializer(serializers.ModelSerializer):
     items = CartItemSerializer(many=True, read_only=True)
     total = serializers.SerializerMethodField()
     
     class Meta:
         model = Cart
-        fields = ['id', 'items', 'total']
+        fields = ['id', 'items', 'total', 'item_count']
         
+    @staticmethod
+    def eager_prefetches():
+        return [
+            Prefetch('items', queryset=CartItem.objects.select_related('product__category').order_by('id')),
+        ]
+
+    @classmethod
+    def setup_eager_loading(cls, queryset):
+        """Load items, their products and categories in one extra query"""
+        return queryset.prefetch_related(*cls.eager_prefetches())
+
     def get_total(self, obj):
-        total = 0
-        for item in obj.items.all():
-            total += item.product.price * item.quantity
-        return total
+        return obj.subtotal
 
 
 class OrderItemSerializer(serializers.ModelSerializer):
@@ -111,24 +162,42 @@ class OrderSerializer(serializers.ModelSerializer):
                   'status', 'total_amount', 'items', 'created_at']
         read_only_fields = ['user', 'total_amount']
 
+    @staticmethod
+    def eager_prefetches():
+        return [
+            Prefetch('items', queryset=OrderItem.objects.select_related('product__category').order_by('id')),
+        ]
+
+    @classmethod
+    def setup_eager_loading(cls, queryset):
+        """Load the user with the orders and all items in one extra query per page"""
+        return queryset.select_related('user').prefetch_related(*cls.eager_prefetches())
+
 
 class OrderCreateSerializer(serializers.ModelSerializer):
     class Meta:
         model = Order
         fields = ['full_name', 'email', 'address', 'phone_number']
     
+    @transaction.atomic
     def create(self, validated_data):
         user = self.context['request'].user
-        cart = user.cart
+        cart = self.context['cart']
         
-        # Calculate total amount
-        total_amount = 0
-        for item in cart.items.all():
-            total_amount += item.product.price * item.quantity
+        # Lock the cart lines so a concurrent checkout of the same cart waits for us
+        cart_items = list(
+            CartItem.objects.select_for_update(of=('self',))
+            .filter(cart=cart)
+            .select_related('product')
+            .order_by('id')
+        )
+        if not cart_items:
+            raise serializers.ValidationError({"detail": "Your cart is empty."})
+        
+        total_amount = sum(item.product.price * item.quantity for item in cart_items)
         
-        # Create order
         order = Order.objects.create(
-            user=user,
+            user_id=user.id,
             full_name=validated_data['full_name'],
             email=validated_data['email'],
             address=validated_data['address'],
@@ -136,21 +205,97 @@ class OrderCreateSerializer(serializers.ModelSerializer):
             total_amount=total_amount
         )
         
-        # Create order items from cart items
-        for cart_item in cart.items.all():
-            OrderItem.objects.create(
+        OrderItem.objects.bulk_create([
+            OrderItem(
                 order=order,
-                product=cart_item.product,
-                quantity=cart_item.quantity,
-                price=cart_item.product.price
+                product=item.product,
+                quantity=item.quantity,
+                price=item.product.price
             )
-            
-            # Update product stock
-            product = cart_item.product
-            product.stock -= cart_item.quantity
-            product.save()
+            for item in cart_items
+        ])
         
-        # Clear cart
-        cart.items.all().delete()
+        # Take the stock in one conditional UPDATE; any shortage rolls the whole order back
+        quantities = defaultdict(int)
+        for item in cart_items:
+            quantities[item.product_id] += item.quantity
+        try:
+            # Lines whose hold lapsed may only take what other carts aren't holding
+            held = dict(
+                StockReservation.objects.active()
+                .filter(cart_item__in=cart_items)
+                .values_list('cart_item_id', 'quantity')
+            )
+            unheld = {item.product_id for item in cart_items if held.get(item.pk, 0) < item.quantity}
+            if unheld:
+                available = available_stock(unheld, exclude_cart=cart)
+                short = {pid for pid in unheld if available[pid] < quantities[pid]}
+                if short:
+                    raise OutOfStock(short)
+            decrement_stock(quantities, sharded={item.product_id for item in cart_items if item.product.stock_shards})
+        except OutOfStock as e:
+            names = sorted(item.product.name for item in cart_items if item.product_id in e.product_ids)
+            raise serializers.ValidationError(
+                {"detail": f"Not enough items in stock: {', '.join(names)}."}
+            )
+        
+        # Clear cart (the lines' holds go with them)
+        CartItem.objects.filter(pk__in=[item.pk for item in cart_items]).delete()
+        cart.adjust_totals(-sum(item.quantity for item in cart_items), -total_amount)
         
         return order
+
+
+class OrderStatusBatchSerializer(serializers.Serializer):
+    """A fulfillment wave: move the listed orders to one status."""
+    MAX_ORDERS = 10_000
+
+    ids = serializers.ListField(child=serializers.IntegerField(min_value=1), allow_empty=False, max_length=MAX_ORDERS)
+    status = serializers.ChoiceField(choices=Order.STATUS_CHOICES)
+
+
+class AnalyticsQuerySerializer(serializers.Serializer):
+    """Date range (inclusive) for the analytics endpoints; defaults to the last 30 days."""
+    MAX_DAYS = 366
+
+    start = serializers.DateField(required=False)
+    end = serializers.DateField(required=False)
+    limit = serializers.IntegerField(min_value=1, max_value=100, default=10)
+    by = serializers.ChoiceField(choices=('revenue', 'units', 'orders'), default='revenue')
+
+    def validate(self, attrs):
+        end = attrs.setdefault('end', timezone.localdate())
+        start = attrs.setdefault('start', end - datetime.timedelta(days=29))
+        if start > end:
+            raise serializers.ValidationError({"start": "Must not be after end."})
+        if (end - start).days >= self.MAX_DAYS:
+            raise serializers.ValidationError({"start": f"The range can span at most {self.MAX_DAYS} days."})
+        return attrs
+
+
+class SalesFiguresSerializer(serializers.Serializer):
+    orders = serializers.IntegerField()
+    units = serializers.IntegerField()
+    revenue = serializers.DecimalField(max_digits=14, decimal_places=2)
+
+
+class DailySalesSerializer(serializers.ModelSerializer):
+    class Meta:
+        model = DailySales
+        fields = ['date', 'orders', 'units', 'revenue']
+
+
+class CategorySalesSerializer(SalesFiguresSerializer):
+    category = serializers.IntegerField()
+    name = serializers.CharField()
+
+
+class ProductSalesSerializer(SalesFiguresSerializer):
+    product = serializers.IntegerField()
+    name = serializers.CharField()
+
+
+class StockSnapshotSerializer(serializers.ModelSerializer):
+    class Meta:
+        model = StockSnapshot
+        fields = ['date', 'stock']
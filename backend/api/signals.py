@@ -0,0 +1,135 @@
+from django.contrib.auth.models import User
+from django.db.models.signals import post_delete, post_save, pre_delete, pre_save
+from django.dispatch import receiver
+
+from .authentication import is_login_rehash, revoke_tokens
+from .cache import bump_generation
+from .jobs import enqueue
+from .inventory import set_sharding
+from .models import Cart, Category, Product
+from .search import get_search_backend
+
+
+@receiver(post_save, sender=Product)
+def index_product(sender, instance, raw=False, **kwargs):
+    # Runs inside the saving transaction so the index rolls back with the row
+    if not raw:
+        get_search_backend().index([instance])
+
+
+@receiver(post_delete, sender=Product)
+def unindex_product(sender, instance, **kwargs):
+    get_search_backend().remove([instance.pk])
+
+
+@receiver([post_save, post_delete], sender=Product)
+def invalidate_product_cache(sender, raw=False, **kwargs):
+    if not raw:
+        bump_generation('product')
+
+
+@receiver([post_save, post_delete], sender=Category)
+def invalidate_category_cache(sender, raw=False, **kwargs):
+    if not raw:
+        bump_generation('category')
+
+
+@receiver(pre_save, sender=Product)
+def remember_previous(sender, instance, raw=False, **kwargs):
+    previous = {}
+    if not raw and instance.pk:
+        previous = getattr(instance, '_loaded', {})
+        if len(previous) < len(Product.TRACKED_FIELDS):
+            # Not loaded from the database, or loaded with deferred fields: read the row
+            previous = sender.objects.filter(pk=instance.pk).values(*Product.TRACKED_FIELDS).first() or {}
+    instance._previous_price = previous.get('price')
+    instance._previous_stock = previous.get('stock')
+    instance._previous_category = previous.get('category_id')
+    # A freshly uploaded file isn't committed to storage until the field saves it
+    instance._image_changed = not raw and (
+        not instance.image._committed or (instance.image.name or '') != (previous.get('image') or '')
+    )
+    if instance._image_changed:
+        # The old variants show a different picture; the original is served until the new ones exist
+        instance.image_variants = {}
+
+
+@receiver(post_save, sender=Product)
+def remember_saved(sender, instance, raw=False, **kwargs):
+    # The next save of this instance compares against what this one wrote
+    instance._loaded = {
+        'price': instance.price, 'stock': instance.stock,
+        'category_id': instance.category_id, 'image': instance.image.name or '',
+    }
+
+
+@receiver(post_save, sender=Product)
+def render_images(sender, instance, raw=False, **kwargs):
+    if not raw and getattr(instance, '_image_changed', False) and instance.image:
+        enqueue('images.render', {'product_id': instance.pk, 'source': instance.image.name}, unique=True)
+
+
+@receiver(post_save, sender=Product)
+def reprice_carts(sender, instance, created, raw=False, **kwargs):
+    # Carts total at current prices: the worker brings the ones holding a repriced product up to date
+    if raw or created or getattr(instance, '_previous_price', instance.price) == instance.price:
+        return
+    enqueue('carts.reprice', {'product_ids': [instance.pk]}, unique=True)
+
+
+@receiver(post_save, sender=Product)
+def restock_shards(sender, instance, created, raw=False, **kwargs):
+    # Sharded stock lives in StockShard rows: apply an edit of Product.stock to them as a delta,
+    # so a form saved with a slightly stale stock figure doesn't undo concurrent sales
+    if raw or created or not instance.stock_shards:
+        return
+    previous = getattr(instance, '_previous_stock', None)
+    if previous is not None and previous != instance.stock:
+        set_sharding(instance.pk, delta=instance.stock - previous)
+
+
+@receiver([post_save, post_delete], sender=Product)
+def rerank_categories(sender, instance, raw=False, **kwargs):
+    # A new, edited, moved or deleted product can change every list of its categories
+    if raw:
+        return
+    categories = {instance.category_id, getattr(instance, '_previous_category', None)} - {None}
+    enqueue('rankings.refresh', {'categories': sorted(categories)}, unique=True)
+
+
+@receiver(pre_delete, sender=Product)
+def remember_carts(sender, instance, **kwargs):
+    instance._cart_ids = list(Cart.objects.filter(items__product=instance).values_list('pk', flat=True))
+
+
+@receiver(post_delete, sender=Product)
+def reconcile_carts(sender, instance, **kwargs):
+    # The product's cart lines were cascade-deleted without going through the cart views
+    if getattr(instance, '_cart_ids', None):
+        Cart.objects.filter(pk__in=instance._cart_ids).reconcile_totals()
+
+
+@receiver(pre_save, sender=User)
+def remember_credentials(sender, instance, raw=False, **kwargs):
+    if not raw and instance.pk:
+        instance._previous_credentials = (
+            sender.objects.filter(pk=instance.pk).values_list('is_active', 'is_staff', 'password').first()
+        )
+
+
+@receiver(post_save, sender=User)
+def revoke_stale_tokens(sender, instance, created, raw=False, update_fields=None, **kwargs):
+    # Tokens carry is_staff and are trusted without a lookup: deactivating a user, changing
+    # their staff flag or their password must invalidate the ones already issued
+    previous = getattr(instance, '_previous_credentials', None)
+    if raw or created or previous is None:
+        return
+    if previous != (instance.is_active, instance.is_staff, instance.password) or not instance.is_active:
+        # A login re-encoding the hash it just verified leaves the password as it was
+        if not (instance.is_active and is_login_rehash(update_fields)):
+            revoke_tokens(instance.pk)
+
+
+@receiver(post_delete, sender=User)
+def revoke_deleted_user_tokens(sender, instance, **kwargs):
+    revoke_tokens(instance.pk)
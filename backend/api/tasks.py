@@ -0,0 +1,69 @@
+"""Background job handlers (run by the run_jobs worker, see api.jobs)."""
+from django.core.mail import send_mail
+from django.template.loader import render_to_string
+
+from . import analytics, deploy, rankings
+from .images import render_product_images
+from .inventory import release_expired_holds, sync_sharded_stock
+from .jobs import enqueue, handler
+from .models import Cart, DailyProductSales, Order
+
+
+def queue_order_followups(order):
+    """Queue everything that happens after checkout; call inside the order's transaction."""
+    enqueue('orders.send_confirmation', {'order_id': order.pk})
+    # Shared work: one pending job covers every order placed before a worker picks it up
+    enqueue('analytics.refresh', unique=True)
+    enqueue('inventory.sync', unique=True)
+
+
+@handler('orders.send_confirmation')
+def send_order_confirmation(order_id):
+    order = Order.objects.prefetch_related('items__product').filter(pk=order_id).first()
+    if order is None:
+        return
+    send_mail(
+        subject=f'Order #{order.pk} confirmed',
+        message=render_to_string('api/email/order_confirmation.txt', {'order': order}),
+        from_email=None,
+        recipient_list=[order.email],
+    )
+
+
+@handler('analytics.refresh')
+def refresh_analytics():
+    days = analytics.refresh_rollups()
+    if days:
+        # Only the categories that sold on the recomputed days can have moved in the sales rankings
+        categories = set(
+            DailyProductSales.objects.filter(date__in=days, product__category__isnull=False)
+            .values_list('product__category', flat=True).distinct()
+        )
+        rankings.refresh_rankings(rankings.SALES_LISTS, categories=categories)
+
+
+@handler('rankings.refresh')
+def refresh_rankings(categories=None):
+    rankings.refresh_rankings(categories=categories)
+
+
+@handler('inventory.sync')
+def sync_inventory():
+    sync_sharded_stock()
+    release_expired_holds()
+
+
+@handler('carts.reprice')
+def reprice_carts(product_ids):
+    # Carts total at current prices: bring the ones holding the products up to date in bulk
+    Cart.objects.filter(items__product__in=product_ids).reconcile_totals()
+
+
+@handler('images.render')
+def render_images(product_id, source):
+    render_product_images(product_id, source)
+
+
+@handler('deploy.run')
+def run_deployment(deployment_id):
+    deploy.run_deployment(deployment_id)
@@ -0,0 +1,642 @@
+import contextlib
+import io
+import os
+import shutil
+import subprocess
+import tempfile
+import time
+import unittest
+from decimal import Decimal
+
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.db import connection, connections
+from django.test import TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from PIL import Image
+from rest_framework.renderers import JSONRenderer
+from rest_framework.test import APIClient, APITestCase
+
+from . import deploy, images, inventory, jobs, rankings
+from .cache import GENERATION_KEY, GENERATION_TIME_KEY, bump_generation, get_cache, get_generations
+from .catalog_io import CatalogImporter, read_csv, read_ndjson
+from .fast_serializers import FastCartSerializer, FastOrderSerializer, FastProductSerializer
+from .images import VARIANTS
+from .models import Cart, CartItem, Category, Deployment, Job, Order, OrderItem, Product, ProductRanking, StockShard
+from .serializers import CartSerializer, OrderSerializer, ProductSerializer
+
+
+class TokenRevocationTests(APITestCase):
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user('shopper', 'shopper@example.com', 'pw-Strong-123')
+        Cart.objects.create(user=self.user)
+
+    def login(self):
+        response = self.client.post('/api/auth/token/', {'username': 'shopper', 'password': 'pw-Strong-123'})
+        self.assertEqual(response.status_code, 200)
+        return response.data['access']
+
+    def test_login_that_rehashes_the_password_keeps_earlier_tokens(self):
+        earlier = self.login()
+        # The stored hash uses the default work factor, so this login re-encodes it
+        with override_settings(PASSWORD_HASH_ITERATIONS=1000):
+            access = self.login()
+        self.user.refresh_from_db()
+        self.assertIn('$1000$', self.user.password)
+        for token in (earlier, access):
+            self.client.credentials(HTTP_AUTHORIZATION=f'Bearer {token}')
+            self.assertEqual(self.client.get('/api/cart/').status_code, 200)
+
+    def test_password_change_revokes_earlier_tokens(self):
+        access = self.login()
+        self.user.set_password('another-Strong-456')
+        self.user.save()
+        self.client.credentials(HTTP_AUTHORIZATION=f'Bearer {access}')
+        self.assertEqual(self.client.get('/api/cart/').status_code, 401)
+
+    def test_logout_revokes_only_earlier_tokens(self):
+        access = self.login()
+        self.client.credentials(HTTP_AUTHORIZATION=f'Bearer {access}')
+        self.assertEqual(self.client.post('/api/auth/logout/').status_code, 204)
+        self.assertEqual(self.client.get('/api/cart/').status_code, 401)
+        # Issued in the same second as the revocation
+        self.client.credentials(HTTP_AUTHORIZATION=f'Bearer {self.login()}')
+        self.assertEqual(self.client.get('/api/cart/').status_code, 200)
+
+
+class CartBatchTests(APITestCase):
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user('shopper', 'shopper@example.com', 'pw-Strong-123')
+        self.cart = Cart.objects.create(user=self.user)
+        self.product = Product.objects.create(name='Widget', description='w', price=Decimal('2.50'), stock=10)
+        self.client.force_authenticate(self.user)
+
+    def patch(self, *operations):
+        return self.client.patch('/api/cart/items/batch/', {'operations': list(operations)}, format='json')
+
+    def test_removing_an_unknown_product_is_reported(self):
+        response = self.patch(
+            {'op': 'add', 'product_id': self.product.pk, 'quantity': 2},
+            {'op': 'remove', 'product_id': 99999},
+        )
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data['errors'], [{'index': 1, 'errors': {'product_id': 'Product not found.'}}])
+        self.cart.refresh_from_db()
+        self.assertEqual((self.cart.item_count, self.cart.subtotal), (2, Decimal('5.00')))
+
+    def test_add_increments_an_existing_line(self):
+        CartItem.objects.create(cart=self.cart, product=self.product, quantity=3)
+        Cart.objects.filter(pk=self.cart.pk).reconcile_totals()
+        response = self.patch({'op': 'add', 'product_id': self.product.pk, 'quantity': 2})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(CartItem.objects.get(cart=self.cart).quantity, 5)
+
+    def test_quantity_update_is_validated(self):
+        line = CartItem.objects.create(cart=self.cart, product=self.product, quantity=1)
+        for quantity in ('many', 0, None):
+            with self.subTest(quantity=quantity):
+                response = self.client.put(f'/api/cart/items/{line.pk}/', {'quantity': quantity}, format='json')
+                self.assertEqual(response.status_code, 400)
+        self.assertEqual(CartItem.objects.get(pk=line.pk).quantity, 1)
+
+    def test_repricing_queues_one_reconcile_job(self):
+        CartItem.objects.create(cart=self.cart, product=self.product, quantity=2)
+        Cart.objects.filter(pk=self.cart.pk).reconcile_totals()
+        product = Product.objects.get(pk=self.product.pk)
+        for price in ('3.00', '4.00'):
+            product.price = Decimal(price)
+            with CaptureQueriesContext(connection) as queries:
+                product.save(update_fields=['price'])
+            # The previous values were recorded on load: saving doesn't read the row first
+            self.assertFalse([q for q in queries if q['sql'].startswith('SELECT') and 'api_product' in q['sql']])
+        [job] = Job.objects.filter(name='carts.reprice')
+        self.assertEqual(job.payload, {'product_ids': [product.pk]})
+        self.cart.refresh_from_db()
+        self.assertEqual(self.cart.subtotal, Decimal('5.00'))
+
+        jobs.HANDLERS[job.name](**job.payload)
+        self.cart.refresh_from_db()
+        self.assertEqual(self.cart.subtotal, Decimal('8.00'))
+
+    def test_rejected_add_leaves_no_empty_line(self):
+        response = self.patch({'op': 'add', 'product_id': self.product.pk, 'quantity': 50})
+        self.assertEqual(len(response.data['errors']), 1)
+        self.assertFalse(CartItem.objects.filter(cart=self.cart).exists())
+
+
+class RankingMemoTests(APITestCase):
+    def test_lists_refreshed_elsewhere_are_picked_up(self):
+        rankings.refresh_rankings([rankings.NEWEST])
+        self.assertEqual(rankings.ranked_ids(rankings.NEWEST), [])
+        product = Product.objects.create(name='New', description='n', price=Decimal('1.00'), stock=1)
+        # A refresh by another process: this one's generation doesn't move
+        ProductRanking.objects.filter(name=rankings.NEWEST, category=None).update(product_ids=[product.pk])
+        self.assertEqual(rankings.ranked_ids(rankings.NEWEST), [])
+        with override_settings(RANKING_MEMO_SECONDS=0):
+            self.assertEqual(rankings.ranked_ids(rankings.NEWEST), [product.pk])
+
+
+class ConditionalGetTests(APITestCase):
+    def setUp(self):
+        cache.clear()
+        self.product = Product.objects.create(name='Widget', description='w', price=Decimal('2.50'), stock=10)
+
+    def test_revalidation_runs_no_query(self):
+        etag = self.client.get('/api/products/')['ETag']
+        with self.assertNumQueries(0):
+            response = self.client.get('/api/products/', HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+        self.assertEqual(response['ETag'], etag)
+
+    def test_if_modified_since(self):
+        for model in ('product', 'category'):
+            get_cache().set(GENERATION_TIME_KEY.format(model), time.time() - 60, timeout=None)
+        modified = self.client.get('/api/products/')['Last-Modified']
+        response = self.client.get('/api/products/', HTTP_IF_MODIFIED_SINCE=modified)
+        self.assertEqual((response.status_code, response['Last-Modified']), (304, modified))
+        with self.captureOnCommitCallbacks(execute=True):
+            self.product.save()
+        # Changed within the current second: no date to compare against until it's over
+        response = self.client.get('/api/products/', HTTP_IF_MODIFIED_SINCE=modified)
+        self.assertEqual(response.status_code, 200)
+        self.assertNotIn('Last-Modified', response)
+
+    def test_saving_a_product_changes_the_etag(self):
+        etag = self.client.get(f'/api/products/{self.product.pk}/')['ETag']
+        with self.captureOnCommitCallbacks(execute=True):
+            self.product.stock = 9
+            self.product.save()
+        response = self.client.get(f'/api/products/{self.product.pk}/', HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response['ETag'], etag)
+
+
+class GenerationTests(APITestCase):
+    def test_bump_after_eviction_moves_past_the_old_generation(self):
+        [before] = get_generations(['product'])
+        get_cache().delete(GENERATION_KEY.format('product'))
+        with self.captureOnCommitCallbacks(execute=True):
+            bump_generation('product')
+        [after] = get_generations(['product'])
+        self.assertGreater(after, before)
+
+
+class AsyncFeaturedProductTests(APITestCase):
+    def test_follows_the_stored_ranking(self):
+        cache.clear()
+        older, newer = (
+            Product.objects.create(name=name, description='p', price=Decimal('1.00'), stock=1)
+            for name in ('Older', 'Newer')
+        )
+        rankings.refresh_rankings([rankings.NEWEST])
+        # A refresh by another process puts the older product first
+        ProductRanking.objects.filter(name=rankings.NEWEST, category=None).update(product_ids=[older.pk, newer.pk])
+        with override_settings(RANKING_MEMO_SECONDS=0):
+            sync = self.client.get('/api/featured-products/').json()
+            response = self.client.get('/api/async/featured-products/').json()
+        self.assertEqual([product['id'] for product in response['results']], [older.pk, newer.pk])
+        self.assertEqual(response, sync)
+
+
+class SecretHeaderTests(APITestCase):
+    @override_settings(METRICS_TOKEN='metrics-token')
+    def test_non_ascii_metrics_token_is_refused(self):
+        self.assertEqual(self.client.get('/metrics', HTTP_AUTHORIZATION='Bearer métrics').status_code, 403)
+
+    def test_non_ascii_deploy_secret_is_refused(self):
+        response = self.client.post(reverse('deploy-webhook'), HTTP_X_DEPLOY_SECRET='sécret')
+        self.assertEqual(response.status_code, 403)
+
+
+class CatalogImportTests(APITestCase):
+    def setUp(self):
+        self.category = Category.objects.create(name='Tools')
+        self.product = Product.objects.create(
+            sku='W-1', name='Widget', description='w', price=Decimal('2.50'), stock=7,
+            category=self.category, image_url='https://example.com/w.jpg',
+        )
+
+    def test_partial_rows_only_write_their_columns(self):
+        result = CatalogImporter().run(read_csv(['sku,price\n', 'W-1,3.00\n']))
+        self.assertEqual((result.upserted, result.errors), (1, []))
+        self.product.refresh_from_db()
+        self.assertEqual(
+            (self.product.price, self.product.stock, self.product.image_url, self.product.category_id),
+            (Decimal('3.00'), 7, 'https://example.com/w.jpg', self.category.pk),
+        )
+
+    def test_new_products_need_the_columns_without_defaults(self):
+        result = CatalogImporter().run(read_ndjson([
+            '{"sku": "N-1", "name": "New", "description": "n", "price": "1.00"}',
+            '{"sku": "N-2", "name": "No price", "description": "n"}',
+        ]))
+        self.assertEqual((result.upserted, [error['line'] for error in result.errors]), (1, [2]))
+        self.assertEqual(Product.objects.get(sku='N-1').stock, 0)
+
+    def test_stock_of_sharded_products_goes_to_the_shards(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            inventory.set_sharding(self.product.pk, shards=2)
+        CatalogImporter().run(read_ndjson(['{"sku": "W-1", "stock": 11}']))
+        self.assertEqual(sorted(StockShard.objects.filter(product=self.product).values_list('stock', flat=True)), [5, 6])
+        self.assertEqual(Product.objects.get(pk=self.product.pk).stock, 11)
+
+
+FAKE_PYTHON = """#!/bin/sh
+echo "$@" >> "$(dirname "$0")/calls"
+[ "$2" = pip ] && [ -e "$(dirname "$0")/fail" ] && exit 1
+exit 0
+"""
+
+
+@unittest.skipUnless(shutil.which('git'), 'git is not installed')
+class DeploymentTests(APITestCase):
+    def setUp(self):
+        self.root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.root)
+        self.origin = os.path.join(self.root, 'origin')
+        os.makedirs(os.path.join(self.origin, 'backend'))
+        self.git(self.origin, 'init', '-q', '-b', 'main')
+        self.commit('requirements.txt', 'django\n')
+        self.git(self.root, 'clone', '-q', self.origin, 'work')
+        python = os.path.join(self.root, 'python')
+        with open(python, 'w') as f:
+            f.write(FAKE_PYTHON)
+        os.chmod(python, 0o755)
+        overrides = override_settings(
+            BASE_DIR=os.path.join(self.root, 'work', 'backend'), DEPLOY_PYTHON=python, DEPLOY_BRANCH='main',
+        )
+        overrides.enable()
+        self.addCleanup(overrides.disable)
+
+    def git(self, cwd, *args):
+        subprocess.run(
+            ['git', '-c', 'user.name=Test', '-c', 'user.email=test@example.com', *args],
+            cwd=cwd, check=True, capture_output=True,
+        )
+
+    def commit(self, path, content):
+        with open(os.path.join(self.origin, path), 'w') as f:
+            f.write(content)
+        self.git(self.origin, 'add', '.')
+        self.git(self.origin, 'commit', '-qm', path)
+
+    def deploy(self):
+        deployment, _ = deploy.request_deployment()
+        deploy.run_deployment(deployment.pk)
+        deployment.refresh_from_db()
+        return deployment.status, [step['status'] for step in deployment.steps]
+
+    def test_first_deployment_runs_every_step(self):
+        self.assertEqual(self.deploy(), (Deployment.SUCCEEDED, ['done', 'done', 'done', 'skipped']))
+        self.assertEqual(self.deploy(), (Deployment.SUCCEEDED, ['done', 'skipped', 'skipped', 'skipped']))
+
+    def test_redeploying_after_a_failure_finishes_its_steps(self):
+        self.deploy()
+        os.makedirs(os.path.join(self.origin, 'backend', 'migrations'))
+        self.commit('backend/migrations/0002_new.py', '')
+        self.commit('requirements.txt', 'django\nrequests\n')
+        open(os.path.join(self.root, 'fail'), 'w').close()
+        self.assertEqual(self.deploy(), (Deployment.FAILED, ['done', 'failed']))
+
+        os.remove(os.path.join(self.root, 'fail'))
+        # Nothing new to pull, but the failed deployment's changes were never installed or migrated
+        self.assertEqual(self.deploy(), (Deployment.SUCCEEDED, ['done', 'done', 'done', 'skipped']))
+
+
+class QueryPlanTests(APITestCase):
+    """EXPLAIN the hot catalog, cart and order queries and check each one uses its index"""
+
+    @classmethod
+    def setUpTestData(cls):
+        categories = Category.objects.bulk_create([Category(name=f'Category {i}') for i in range(20)])
+        Product.objects.bulk_create([
+            Product(
+                name=f'Product {i}', description='', price=Decimal(i % 500), stock=10,
+                is_active=i % 10 != 0, category=categories[i % len(categories)],
+            )
+            for i in range(2000)
+        ])
+        users = User.objects.bulk_create([User(username=f'user{i}') for i in range(50)])
+        carts = Cart.objects.bulk_create([Cart(user=user) for user in users])
+        products = list(Product.objects.all()[:20])
+        CartItem.objects.bulk_create([CartItem(cart=cart, product=product) for cart in carts for product in products])
+        Order.objects.bulk_create([
+            Order(user=user, full_name='x', email='x@example.com', address='x', phone_number='0', total_amount=0)
+            for user in users for _ in range(20)
+        ])
+
+    def hot_queries(self):
+        """(description, queryset, index names that may serve it) for each indexed access pattern."""
+        return [
+            (
+                'category page with price range',
+                Product.objects.filter(is_active=True, category_id=1, price__gte=10, price__lte=50),
+                ['product_active_cat_price_idx'],
+            ),
+            (
+                'category page, newest first',
+                Product.objects.filter(is_active=True, category_id=1).order_by('-created_at')[:10],
+                ['product_active_cat_created_idx'],
+            ),
+            (
+                'catalog / featured, newest first',
+                Product.objects.filter(is_active=True).order_by('-created_at', '-id')[:10],
+                ['product_active_created_idx'],
+            ),
+            (
+                'catalog sorted by price',
+                Product.objects.filter(is_active=True).order_by('price', 'id')[:10],
+                ['product_active_price_idx'],
+            ),
+            (
+                'catalog sorted by name',
+                Product.objects.filter(is_active=True).order_by('name', 'id')[:10],
+                ['product_active_name_idx'],
+            ),
+            (
+                'cart line upsert lookup',
+                CartItem.objects.filter(cart_id=1, product_id=1),
+                # SQLite names the index backing an inline UNIQUE constraint itself
+                ['cartitem_unique_product', 'sqlite_autoindex_api_cartitem'],
+            ),
+            (
+                'order history, newest first',
+                Order.objects.filter(user_id=1).order_by('-created_at', '-id')[:10],
+                ['order_user_created_idx'],
+            ),
+        ]
+
+    def test_hot_queries_use_their_index(self):
+        if connection.vendor == 'postgresql':
+            # Small tables make a sequential scan look cheap; we only want to know the index qualifies
+            with connection.cursor() as cursor:
+                cursor.execute('SET LOCAL enable_seqscan = off')
+        for description, queryset, indexes in self.hot_queries():
+            with self.subTest(description):
+                plan = queryset.explain()
+                self.assertTrue(any(name in plan for name in indexes), f'{description} skips its index:\n{plan}')
+
+
+class FastSerializerParityTests(APITestCase):
+    """The fast read serializers render the same JSON as the DRF serializers, byte for byte"""
+
+    @classmethod
+    def setUpTestData(cls):
+        categories = Category.objects.bulk_create([Category(name=f'Category {i}') for i in range(3)])
+        Product.objects.bulk_create([
+            Product(
+                name=f'Product {i}', description=f'Description of product {i}',
+                price=Decimal(100 + 37 * i) / 100, stock=i,
+                # Uncategorised products, missing image URLs and uploads rendered or not yet rendered
+                category=categories[i % 3] if i % 5 else None,
+                image_url=f'https://example.com/{i}.jpg' if i % 3 else None,
+                image=f'products/originals/{i:064x}.jpg' if i % 4 == 0 else '',
+                image_variants={
+                    name: {
+                        'width': width,
+                        'webp': f'products/variants/{i}-{name}.webp',
+                        'jpeg': f'products/variants/{i}-{name}.jpg',
+                    }
+                    for name, width in VARIANTS
+                } if i % 8 == 0 else {},
+            )
+            for i in range(24)
+        ])
+        products = list(Product.objects.order_by('pk'))
+        cls.user = User.objects.create_user('shopper', 'shopper@example.com', 'pw', first_name='Shop')
+        for index, status in enumerate(('pending', 'shipped', 'cancelled')):
+            order = Order.objects.create(
+                user=cls.user, full_name='Shopper', email='shopper@example.com', address='1 Main St',
+                phone_number='555', status=status, total_amount=Decimal('12.34'),
+            )
+            OrderItem.objects.bulk_create([
+                OrderItem(order=order, product=product, quantity=2, price=product.price)
+                for product in products[index * 3:index * 3 + 3]
+            ])
+        cls.cart = Cart.objects.create(user=cls.user)
+        CartItem.objects.bulk_create([CartItem(cart=cls.cart, product=product, quantity=3) for product in products[5:15]])
+        Cart.objects.filter(pk=cls.cart.pk).reconcile_totals()
+
+    def assertSameJSON(self, drf, fast):
+        renderer = JSONRenderer()
+        self.assertEqual(renderer.render(fast).decode(), renderer.render(drf).decode())
+
+    def test_products(self):
+        products = Product.objects.order_by('-created_at', '-id')
+        self.assertSameJSON(
+            ProductSerializer(ProductSerializer.setup_eager_loading(products), many=True).data,
+            FastProductSerializer.serialize_many(FastProductSerializer.values(products)),
+        )
+
+    def test_orders(self):
+        orders = Order.objects.filter(user=self.user).order_by('-created_at', '-id')
+        self.assertSameJSON(
+            OrderSerializer(OrderSerializer.setup_eager_loading(orders), many=True).data,
+            FastOrderSerializer.serialize_many(FastOrderSerializer.values(orders)),
+        )
+
+    def test_cart(self):
+        self.assertSameJSON(
+            CartSerializer(CartSerializer.setup_eager_loading(Cart.objects.all()).get(pk=self.cart.pk)).data,
+            FastCartSerializer.load(self.cart.pk),
+        )
+
+
+class ProductImageTests(APITestCase):
+    def setUp(self):
+        media = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, media)
+        overrides = override_settings(MEDIA_ROOT=media)
+        overrides.enable()
+        self.addCleanup(overrides.disable)
+        self.product = Product.objects.create(name='Widget', description='w', price=Decimal('2.50'), stock=10)
+        self.client.force_authenticate(User.objects.create_user('admin', is_staff=True))
+
+    def upload(self, name, content):
+        with self.captureOnCommitCallbacks(execute=True):
+            return self.client.post(
+                f'/api/products/{self.product.pk}/image/', {'image': SimpleUploadedFile(name, content)},
+                format='multipart',
+            )
+
+    def test_upload_is_rendered_into_variants(self):
+        buffer = io.BytesIO()
+        Image.new('RGB', (1600, 800), 'red').save(buffer, 'PNG')
+        self.assertEqual(self.upload('widget.png', buffer.getvalue()).status_code, 200)
+        job = Job.objects.get(name='images.render')
+        images.render_product_images(**job.payload)
+        self.product.refresh_from_db()
+        self.assertEqual(
+            [(name, variant['width']) for name, variant in self.product.image_variants.items()],
+            [('thumbnail', 160), ('card', 480), ('detail', 1200)],
+        )
+        self.assertIn('480w', images.image_set(self.product.image.name, self.product.image_variants)['srcset']['webp'])
+
+    def test_files_that_are_not_images_are_refused(self):
+        response = self.upload('widget.png', b'not an image')
+        self.assertEqual(response.status_code, 400)
+        self.assertFalse(Product.objects.get(pk=self.product.pk).image)
+
+
+class QueryCountTests(APITestCase):
+    """Listings run a fixed number of queries however many rows a page holds"""
+
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user('shopper', 'shopper@example.com', 'pw-Strong-123')
+        self.cart = Cart.objects.create(user=self.user)
+        categories = [Category.objects.create(name=f'Category {index}') for index in range(3)]
+        self.products = [
+            Product.objects.create(
+                name=f'Product {index}', description='p', price=Decimal('1.50'), stock=100,
+                category=categories[index % 3],
+            )
+            for index in range(30)
+        ]
+        # Authenticated requests skip the catalog cache, so every request below hits the database
+        self.client.force_authenticate(self.user)
+
+    def fill_cart(self, count):
+        for product in self.products[self.cart.items.count():count]:
+            CartItem.objects.create(cart=self.cart, product=product, quantity=2)
+        Cart.objects.filter(pk=self.cart.pk).reconcile_totals()
+
+    def place_orders(self, count):
+        for index in range(count):
+            order = Order.objects.create(
+                user=self.user, full_name='Shopper', email='shopper@example.com',
+                address='1 Main St', phone_number='555', total_amount=Decimal('3.00'),
+            )
+            for product in self.products[index:index + 3]:
+                OrderItem.objects.create(order=order, product=product, quantity=1, price=product.price)
+
+    def test_product_list(self):
+        for page_size in (5, 30):
+            with self.assertNumQueries(1):
+                response = self.client.get(f'/api/products/?page_size={page_size}')
+            self.assertEqual(len(response.data['results']), page_size)
+
+    def test_cart(self):
+        for count in (1, 10):
+            self.fill_cart(count)
+            with self.assertNumQueries(3):
+                response = self.client.get('/api/cart/')
+            self.assertEqual(response.status_code, 200)
+
+    def test_order_history(self):
+        for count in (1, 10):
+            self.place_orders(count)
+            with self.assertNumQueries(3):
+                response = self.client.get('/api/orders/')
+            self.assertEqual(response.status_code, 200)
+
+
+class OrderPaginationTests(APITestCase):
+    def setUp(self):
+        self.user = User.objects.create_user('shopper', 'shopper@example.com', 'pw-Strong-123')
+        for _ in range(12):
+            Order.objects.create(
+                user=self.user, full_name='Shopper', email='shopper@example.com',
+                address='1 Main St', phone_number='555', total_amount=Decimal('3.00'),
+            )
+        self.client.force_authenticate(self.user)
+
+    def test_order_history_pages_by_number_by_default(self):
+        response = self.client.get('/api/orders/')
+        self.assertEqual((response.data['count'], len(response.data['results'])), (12, 10))
+
+    def test_cursor_pages_are_opt_in(self):
+        response = self.client.get('/api/orders/?pagination=cursor')
+        self.assertNotIn('count', response.data)
+        second = self.client.get(response.data['next'])
+        self.assertEqual(len(response.data['results']) + len(second.data['results']), 12)
+        self.assertIsNone(second.data['next'])
+
+
+@override_settings(FAST_READ_SERIALIZERS=False)
+class ModelSerializerQueryCountTests(QueryCountTests):
+    """The same budgets with the DRF serializers instead of the fast read path"""
+
+
+
+requeued_while_running = []
+
+
+@jobs.handler('tests.slow')
+def slow_job(seconds):
+    time.sleep(seconds)
+    # Another worker's housekeeping, once the job has outlived its lock timeout
+    requeued_while_running.append(jobs.requeue_stuck_jobs())
+
+
+class JobHeartbeatTests(TransactionTestCase):
+    @override_settings(JOB_LOCK_TIMEOUT=1)
+    def test_long_running_job_is_not_requeued(self):
+        jobs.enqueue('tests.slow', {'seconds': 1.5})
+        [job] = jobs.claim('worker')
+        self.assertTrue(jobs.run(job))
+        self.assertEqual(requeued_while_running, [0])
+        self.assertEqual(Job.objects.get(pk=job.pk).attempts, 1)
+
+
+@override_settings(DATABASE_REPLICAS=['test_replica1', 'test_replica2'])
+class ReplicaRoutingTests(TransactionTestCase):
+    """The test replicas mirror the test database: which connection ran a query shows the routing"""
+    databases = {'default', 'test_replica1', 'test_replica2'}
+    client_class = APIClient
+
+    def setUp(self):
+        cache.clear()
+        get_cache().clear()
+        self.user = User.objects.create_user('shopper', 'shopper@example.com', 'pw-Strong-123')
+        self.product = Product.objects.create(name='Widget', description='w', price=Decimal('2.50'), stock=10)
+
+    def get(self, path):
+        """GET ``path``; returns the response and the number of queries run on the primary and on the replicas."""
+        with contextlib.ExitStack() as stack:
+            primary, *replicas = [
+                stack.enter_context(CaptureQueriesContext(connections[alias]))
+                for alias in ('default', 'test_replica1', 'test_replica2')
+            ]
+            response = self.client.get(path)
+        self.assertEqual(response.status_code, 200)
+        return response, len(primary), sum(len(replica) for replica in replicas)
+
+    def test_catalog_reads_go_to_a_replica(self):
+        self.client.force_authenticate(self.user)
+        # Authenticated product pages aren't cached
+        response, _, replica = self.get('/api/products/')
+        self.assertEqual(response.data['results'][0]['id'], self.product.pk)
+        self.assertGreater(replica, 0)
+        # The replica may lag the generations the validators stand for
+        self.assertNotIn('ETag', response)
+        self.assertNotIn('Last-Modified', response)
+        # Everything else reads from the primary
+        self.assertEqual(self.get('/api/cart/')[2], 0)
+
+    def test_cached_responses_are_built_from_the_primary(self):
+        response, _, replica = self.get('/api/products/')
+        self.assertEqual(replica, 0)
+        self.assertIn('ETag', response)
+        self.assertEqual(self.get('/api/products/')[1:], (0, 0))
+
+    def test_reads_are_pinned_to_the_primary_after_a_write(self):
+        self.client.force_authenticate(self.user)
+        response = self.client.post('/api/cart/items/', {'product_id': self.product.pk, 'quantity': 1}, format='json')
+        self.assertEqual(response.status_code, 200)
+        _, _, replica = self.get('/api/products/')
+        self.assertEqual(replica, 0)
+        # Another user isn't pinned
+        self.client.force_authenticate(User.objects.create_user('other', 'other@example.com', 'pw-Strong-123'))
+        self.assertGreater(self.get('/api/products/')[2], 0)
+
+    def test_without_replicas_reads_use_the_default_database(self):
+        self.client.force_authenticate(self.user)
+        with override_settings(DATABASE_REPLICAS=[]):
+            response, _, replica = self.get('/api/products/')
+        self.assertEqual((replica, response.data['results'][0]['id']), (0, self.product.pk))
+        self.assertIn('ETag', response)
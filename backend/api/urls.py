@@ -2,10 +2,12 @@ from django.urls import path, include
 from rest_framework.routers import DefaultRouter
 from rest_framework_simplejwt.views import TokenObtainPairView, TokenRefreshView
 
+from . import async_views
 from .views import (
-    RegisterView, ProfileView, CategoryViewSet, ProductViewSet,
-    CartView, CartItemView, OrderViewSet,
-    FeaturedProductListView, trigger_deployment_webhook
+    RegisterView, LogoutView, ProfileView, CategoryViewSet, ProductViewSet,
+    CatalogExportView, SalesAnalyticsView, CategorySalesAnalyticsView, TopProductsAnalyticsView,
+    StockHistoryAnalyticsView, CartView, CartSummaryView, CartItemView, CartBatchView, OrderViewSet,
+    FeaturedProductListView, RankingListView, trigger_deployment_webhook, deployment_status
 )
 
 router = DefaultRouter()
@@ -16,6 +18,23 @@ router.register(r'orders', OrderViewSet, basename='orders')
 urlpatterns = [
     # Featured Products (Moved up)
     path('featured-products/', FeaturedProductListView.as_view(), name='featured-products'),
+    # Precomputed product rails (newest, bestselling_7d, bestselling_30d, trending)
+    path('rankings/<str:name>/', RankingListView.as_view(), name='rankings'),
+
+    # Async catalog reads for ASGI deployments (same responses as the DRF views)
+    path('async/products/', async_views.product_list, name='async-products-list'),
+    path('async/products/<int:pk>/', async_views.product_detail, name='async-products-detail'),
+    path('async/featured-products/', async_views.featured_products, name='async-featured-products'),
+    path('async/categories/', async_views.category_list, name='async-categories-list'),
+
+    # Bulk catalog export (staff only)
+    path('catalog/export.<str:export_format>', CatalogExportView.as_view(), name='catalog-export'),
+
+    # Sales and stock analytics from the daily rollups (staff only)
+    path('analytics/sales/', SalesAnalyticsView.as_view(), name='analytics-sales'),
+    path('analytics/categories/', CategorySalesAnalyticsView.as_view(), name='analytics-categories'),
+    path('analytics/products/top/', TopProductsAnalyticsView.as_view(), name='analytics-top-products'),
+    path('analytics/stock/<int:product_id>/', StockHistoryAnalyticsView.as_view(), name='analytics-stock'),
 
     # Router URLs (Now checked after specific paths)
     path('', include(router.urls)),
@@ -24,15 +43,22 @@ urlpatterns = [
     path('auth/register/', RegisterView.as_view(), name='register'),
     path('auth/token/', TokenObtainPairView.as_view(), name='token_obtain_pair'),
     path('auth/token/refresh/', TokenRefreshView.as_view(), name='token_refresh'),
+    path('auth/logout/', LogoutView.as_view(), name='logout'),
     
     # User profile
     path('auth/profile/', ProfileView.as_view(), name='profile'),
     
     # Cart
     path('cart/', CartView.as_view(), name='cart'),
+    path('cart/summary/', CartSummaryView.as_view(), name='cart-summary'),
     path('cart/items/', CartItemView.as_view(), name='cart-add'),
+    path('cart/items/batch/', CartBatchView.as_view(), name='cart-batch'),
     path('cart/items/<int:item_id>/', CartItemView.as_view(), name='cart-item'),
 
     # Add the webhook URL (USE YOUR ACTUAL SECRET KEY HERE!)
     path('mVInBIlrSAmdXi2JCf26ghPYw98MREjJVy30x-N5Ye4', trigger_deployment_webhook, name='deploy-webhook'),
+    # Deployment progress: steps, timings and log (same secret header)
+    path(
+        'mVInBIlrSAmdXi2JCf26ghPYw98MREjJVy30x-N5Ye4/<int:deployment_id>/', deployment_status, name='deploy-status'
+    ),
 ]
@@ -2,25 +2,45 @@ from rest_framework import viewsets, generics, status, permissions
 from rest_framework.response import Response
 from rest_framework.views import APIView
 from rest_framework.decorators import action
+from rest_framework.parsers import MultiPartParser
 from django.contrib.auth.models import User
-from django.db.models import Q
+from django.db import IntegrityError, transaction
+from django.db.models import F, prefetch_related_objects
+from django.db.models.functions import Now
 from django.shortcuts import get_object_or_404
+from django.urls import reverse
+import logging
 import os
-import subprocess
 import hmac
 import hashlib
-from django.http import HttpResponseForbidden, HttpResponseServerError, JsonResponse
+from django.http import Http404, HttpResponse, HttpResponseForbidden, HttpResponseServerError, JsonResponse, StreamingHttpResponse
 from django.views.decorators.csrf import csrf_exempt
 from django.conf import settings
-import requests # Import requests
 
-from .models import Category, Product, Profile, Cart, CartItem, Order, OrderItem
+from .models import Category, Product, Profile, Cart, CartItem, Order, OrderItem, Deployment
+from . import analytics, deploy, fulfillment, metrics, rankings
+from .authentication import revoke_tokens, user_cart
+from .cache import CatalogCacheMixin
+from .catalog_io import CONTENT_TYPES, EXPORT_FORMATS, RENDERERS, export_rows
+from .conditional import ConditionalGetMixin
+from .db_router import ReplicaReadMixin
+from .fast_serializers import (
+    FastCartSerializer, FastOrderSerializer, FastProductSerializer, FastReadMixin, fast_serializers_enabled
+)
+from .filters import filter_products
+from .inventory import available_stock, hold_stock
+from .tasks import queue_order_followups
+from .pagination import OrderPagination, ProductPagination
 from .serializers import (
     UserSerializer, RegisterSerializer, ProfileSerializer,
-    CategorySerializer, ProductSerializer, CartSerializer,
-    CartItemSerializer, OrderSerializer, OrderCreateSerializer
+    CategorySerializer, ProductSerializer, ProductImageSerializer, CartSerializer,
+    CartItemSerializer, CartItemQuantitySerializer, CartBatchOperationSerializer, OrderSerializer, OrderCreateSerializer,
+    OrderStatusBatchSerializer, AnalyticsQuerySerializer, SalesFiguresSerializer, DailySalesSerializer,
+    CategorySalesSerializer, ProductSalesSerializer, StockSnapshotSerializer
 )
 
+logger = logging.getLogger(__name__)
+
 
 class RegisterView(generics.CreateAPIView):
     queryset = User.objects.all()
@@ -33,77 +53,187 @@ class ProfileView(generics.RetrieveUpdateAPIView):
     permission_classes = [permissions.IsAuthenticated]
     
     def get_object(self):
-        return self.request.user.profile
+        # Created on first access rather than at signup
+        profile, _ = Profile.objects.select_related('user').get_or_create(user_id=self.request.user.id)
+        return profile
+
+
+class LogoutView(APIView):
+    """Revoke every token issued to the user so far, signing them out on all devices"""
+    permission_classes = [permissions.IsAuthenticated]
+    
+    def post(self, request):
+        revoke_tokens(request.user.id)
+        return Response(status=status.HTTP_204_NO_CONTENT)
 
 
-class CategoryViewSet(viewsets.ModelViewSet):
+class CategoryViewSet(ReplicaReadMixin, ConditionalGetMixin, CatalogCacheMixin, viewsets.ModelViewSet):
     queryset = Category.objects.all()
     serializer_class = CategorySerializer
     permission_classes = [permissions.IsAuthenticatedOrReadOnly]
+    cache_models = ('category',)
 
 
-class ProductViewSet(viewsets.ModelViewSet):
+class ProductViewSet(ReplicaReadMixin, ConditionalGetMixin, CatalogCacheMixin, FastReadMixin, viewsets.ModelViewSet):
     queryset = Product.objects.filter(is_active=True)
     serializer_class = ProductSerializer
+    fast_serializer_class = FastProductSerializer
     permission_classes = [permissions.IsAuthenticatedOrReadOnly]
+    pagination_class = ProductPagination
+    cache_anonymous_only = True
     
     def get_queryset(self):
-        queryset = Product.objects.filter(is_active=True)
-        
-        # Filter by category (ID or name)
-        category_param = self.request.query_params.get('category', None)
-        if category_param is not None:
-            # Check if the parameter is numeric (an ID) or a string (slug)
-            if category_param.isdigit():
-                queryset = queryset.filter(category__id=category_param)
-            else:
-                # Filter by category name (case-insensitive) since there's no slug field
-                queryset = queryset.filter(category__name__iexact=category_param)
-        
-        # Search functionality
-        search = self.request.query_params.get('search')
-        if search:
-            queryset = queryset.filter(
-                Q(name__icontains=search) | 
-                Q(description__icontains=search)
-            )
-        
-        # Price range filtering
-        min_price = self.request.query_params.get('min_price')
-        max_price = self.request.query_params.get('max_price')
-        
-        if min_price:
-            queryset = queryset.filter(price__gte=min_price)
-        if max_price:
-            queryset = queryset.filter(price__lte=max_price)
-        
-        return queryset
+        queryset = self.get_serializer_class().setup_eager_loading(
+            Product.objects.filter(is_active=True)
+        )
+        return filter_products(queryset, self.request.query_params)
+    
+    @action(detail=False, methods=['get'])
+    def availability(self, request):
+        """Live stock minus active cart holds for ?ids=1,2,3 (not cached)"""
+        try:
+            ids = [int(pk) for pk in request.query_params.get('ids', '').split(',') if pk.strip()]
+        except ValueError:
+            return Response({"ids": "Expected a comma-separated list of product ids."}, status=status.HTTP_400_BAD_REQUEST)
+        if not ids or len(ids) > 100:
+            return Response({"ids": "Give between 1 and 100 product ids."}, status=status.HTTP_400_BAD_REQUEST)
+        rows = (
+            Product.objects.filter(pk__in=ids, is_active=True).with_availability()
+            .order_by('pk').values('id', 'on_hand', 'held', 'available')
+        )
+        return Response({"results": [
+            {"id": row['id'], "stock": row['on_hand'], "held": row['held'], "available": max(row['available'], 0)}
+            for row in rows
+        ]})
+
+    @action(
+        detail=True, methods=['post', 'delete'],
+        permission_classes=[permissions.IsAdminUser], parser_classes=[MultiPartParser],
+    )
+    def image(self, request, pk=None):
+        """Upload (multipart 'image') or remove the product's image; resized variants are rendered in the background"""
+        product = get_object_or_404(Product, pk=pk)
+        if request.method == 'DELETE':
+            product.image = ''
+            product.save(update_fields=['image', 'image_variants', 'updated_at'])
+            return Response(status=status.HTTP_204_NO_CONTENT)
+        serializer = ProductImageSerializer(data=request.data)
+        if not serializer.is_valid():
+            return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
+        product.image = serializer.validated_data['image']
+        # The render job is queued by the save, in the same transaction
+        with transaction.atomic():
+            product.save(update_fields=['image', 'image_variants', 'updated_at'])
+        return Response(ProductSerializer(product).data)
+
+
+class FeaturedProductListView(ReplicaReadMixin, ConditionalGetMixin, CatalogCacheMixin, FastReadMixin, generics.ListAPIView):
+    """Returns the 4 most recently added active products."""
+    serializer_class = ProductSerializer
+    fast_serializer_class = FastProductSerializer
+    permission_classes = [permissions.AllowAny]
+    cache_models = ('product', 'category', 'ranking')
+    
+    def get_queryset(self):
+        queryset = ProductSerializer.setup_eager_loading(Product.objects.all())
+        return rankings.ranked_products(rankings.NEWEST, limit=4, queryset=queryset)
 
 
-class FeaturedProductListView(generics.ListAPIView):
-    """Returns the 4 most recently added active products."""
+class RankingListView(ReplicaReadMixin, CatalogCacheMixin, FastReadMixin, generics.ListAPIView):
+    """A precomputed product rail: newest, bestselling_7d, bestselling_30d or trending, optionally per category."""
     serializer_class = ProductSerializer
+    fast_serializer_class = FastProductSerializer
     permission_classes = [permissions.AllowAny]
+    pagination_class = None
+    cache_models = ('product', 'category', 'ranking')
     
     def get_queryset(self):
-        return Product.objects.filter(is_active=True).order_by('-created_at')[:4]
+        if self.kwargs['name'] not in rankings.LISTS:
+            raise Http404
+        category = self.request.query_params.get('category')
+        limit = self.request.query_params.get('limit')
+        queryset = ProductSerializer.setup_eager_loading(Product.objects.all())
+        return rankings.ranked_products(
+            self.kwargs['name'],
+            category_id=int(category) if category and category.isdigit() else None,
+            limit=int(limit) if limit and limit.isdigit() else None,
+            queryset=queryset,
+        )
+
+
+def get_cart(request):
+    """
+    The requesting user's cart, from the cart id in their token when it has
+    one. Users get their cart on first use rather than at signup.
+    """
+    cart = user_cart(request.user)
+    if cart is None:
+        cart, _ = Cart.objects.get_or_create(user_id=request.user.id)
+    return cart
+
+
+def serialize_cart(cart):
+    """Serialize a cart after reloading its totals and items (one query each)"""
+    if fast_serializers_enabled():
+        return FastCartSerializer.load(cart.pk)
+    cart.refresh_from_db(fields=['subtotal', 'item_count'])
+    prefetch_related_objects([cart], *CartSerializer.eager_prefetches())
+    return CartSerializer(cart).data
+
+
+class CatalogExportView(APIView):
+    """Stream the whole catalog as NDJSON or CSV without holding it in memory"""
+    permission_classes = [permissions.IsAdminUser]
+
+    def get(self, request, export_format):
+        if export_format not in EXPORT_FORMATS:
+            raise Http404
+        queryset = Product.objects.all()
+        if request.query_params.get('active') in ('1', 'true'):
+            queryset = queryset.filter(is_active=True)
+        response = StreamingHttpResponse(
+            RENDERERS[export_format](export_rows(queryset)),
+            content_type=f'{CONTENT_TYPES[export_format]}; charset=utf-8',
+        )
+        response['Content-Disposition'] = f'attachment; filename="catalog.{export_format}"'
+        return response
 
 
 class CartView(APIView):
     permission_classes = [permissions.IsAuthenticated]
     
     def get(self, request):
-        cart = get_object_or_404(Cart, user=request.user)
+        cart = get_cart(request)
+        if fast_serializers_enabled():
+            return Response(FastCartSerializer.load(cart.pk))
+        cart = get_object_or_404(CartSerializer.setup_eager_loading(Cart.objects.all()), pk=cart.pk)
         serializer = CartSerializer(cart)
         return Response(serializer.data)
 
 
+class CartSummaryView(APIView):
+    """Item count and total for the cart badge, read from the cart row alone"""
+    permission_classes = [permissions.IsAuthenticated]
+    
+    def get(self, request):
+        cart_id = getattr(request.user, 'cart_id', None)
+        carts = Cart.objects.filter(pk=cart_id) if cart_id else Cart.objects.filter(user_id=request.user.id)
+        summary = carts.values('id', 'item_count', 'subtotal').first()
+        if summary is None:
+            summary = Cart.objects.filter(pk=get_cart(request).pk).values('id', 'item_count', 'subtotal').get()
+        return Response({
+            "id": summary['id'],
+            "item_count": summary['item_count'],
+            "total": summary['subtotal'],
+        })
+
+
 class CartItemView(APIView):
     permission_classes = [permissions.IsAuthenticated]
     
     def post(self, request):
         """Add item to cart"""
-        cart = get_object_or_404(Cart, user=request.user)
+        cart = get_cart(request)
         
         serializer = CartItemSerializer(data=request.data)
         if serializer.is_valid():
@@ -112,192 +242,319 @@ class CartItemView(APIView):
             
             product = get_object_or_404(Product, id=product_id, is_active=True)
             
-            # Check if product is in stock
-            if product.stock < quantity:
-                return Response(
-                    {"detail": "Not enough items in stock."},
-                    status=status.HTTP_400_BAD_REQUEST
-                )
-            
-            # Check if item already exists in cart
-            try:
-                cart_item = CartItem.objects.get(cart=cart, product=product)
-                cart_item.quantity += quantity
-                cart_item.save()
-            except CartItem.DoesNotExist:
-                CartItem.objects.create(
-                    cart=cart,
-                    product=product,
-                    quantity=quantity
-                )
+            # Upsert the line: bump an existing quantity in place, insert otherwise
+            with transaction.atomic():
+                lines = CartItem.objects.filter(cart=cart, product=product)
+                if not lines.update(quantity=F('quantity') + quantity, updated_at=Now()):
+                    try:
+                        with transaction.atomic():
+                            CartItem.objects.create(cart=cart, product=product, quantity=quantity)
+                    except IntegrityError:
+                        # A concurrent request inserted the line first
+                        lines.update(quantity=F('quantity') + quantity, updated_at=Now())
+                
+                # Hold the line's stock, then check it against other carts' holds; checking after
+                # writing means concurrent adds of the same product see each other's holds
+                line = lines.values_list('pk', 'product_id', 'quantity').get()
+                hold_stock([line])
+                if available_stock([product.pk], exclude_cart=cart)[product.pk] < line[2]:
+                    transaction.set_rollback(True)
+                    return Response(
+                        {"detail": "Not enough items in stock."},
+                        status=status.HTTP_400_BAD_REQUEST
+                    )
+                cart.adjust_totals(quantity, product.price * quantity)
             
-            serializer = CartSerializer(cart)
-            return Response(serializer.data)
+            return Response(serialize_cart(cart))
         return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
     
     def put(self, request, item_id):
         """Update cart item quantity"""
-        cart = get_object_or_404(Cart, user=request.user)
-        cart_item = get_object_or_404(CartItem, id=item_id, cart=cart)
+        cart = get_cart(request)
+        serializer = CartItemQuantitySerializer(data=request.data)
+        if not serializer.is_valid():
+            return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
+        quantity = serializer.validated_data['quantity']
         
-        quantity = request.data.get('quantity', 1)
-        
-        # Check if product is in stock
-        if cart_item.product.stock < quantity:
-            return Response(
-                {"detail": "Not enough items in stock."},
-                status=status.HTTP_400_BAD_REQUEST
+        with transaction.atomic():
+            cart_item = get_object_or_404(
+                CartItem.objects.select_for_update(of=('self',)).select_related('product'), id=item_id, cart=cart
             )
+            
+            delta = quantity - cart_item.quantity
+            cart_item.quantity = quantity
+            cart_item.save()
+            
+            # Hold the new quantity, then check it against other carts' holds (see post)
+            hold_stock([(cart_item.pk, cart_item.product_id, quantity)])
+            if available_stock([cart_item.product_id], exclude_cart=cart)[cart_item.product_id] < quantity:
+                transaction.set_rollback(True)
+                return Response(
+                    {"detail": "Not enough items in stock."},
+                    status=status.HTTP_400_BAD_REQUEST
+                )
+            cart.adjust_totals(delta, cart_item.product.price * delta)
         
-        cart_item.quantity = quantity
-        cart_item.save()
-        
-        serializer = CartSerializer(cart)
-        return Response(serializer.data)
+        return Response(serialize_cart(cart))
     
     def delete(self, request, item_id):
         """Remove item from cart"""
-        cart = get_object_or_404(Cart, user=request.user)
-        cart_item = get_object_or_404(CartItem, id=item_id, cart=cart)
+        cart = get_cart(request)
         
-        cart_item.delete()
+        with transaction.atomic():
+            cart_item = get_object_or_404(
+                CartItem.objects.select_for_update(of=('self',)).select_related('product'), id=item_id, cart=cart
+            )
+            cart_item.delete()
+            cart.adjust_totals(-cart_item.quantity, -cart_item.product.price * cart_item.quantity)
         
-        serializer = CartSerializer(cart)
-        return Response(serializer.data)
+        return Response(serialize_cart(cart))
 
 
-class OrderViewSet(viewsets.ModelViewSet):
+class CartBatchView(APIView):
+    """Apply many add/update/remove operations to the cart in one transaction."""
+    permission_classes = [permissions.IsAuthenticated]
+    
+    def patch(self, request):
+        operations = request.data.get('operations') if isinstance(request.data, dict) else None
+        if not isinstance(operations, list) or not operations:
+            return Response(
+                {"operations": "Expected a non-empty list of operations."},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        
+        errors = []
+        valid = []
+        for index, data in enumerate(operations):
+            serializer = CartBatchOperationSerializer(data=data)
+            if serializer.is_valid():
+                valid.append((index, serializer.validated_data))
+            else:
+                errors.append({"index": index, "errors": serializer.errors})
+        
+        with transaction.atomic():
+            cart = get_cart(request)
+            product_ids = {op['product_id'] for _, op in valid}
+            # One query for every product's availability, one (locking) query for the current lines
+            products = Product.objects.with_availability(exclude_cart=cart).in_bulk(product_ids)
+            # Lines this batch may add are created empty first, so every line it touches exists and is
+            # locked below: a concurrent add to the same product is then counted, not overwritten
+            CartItem.objects.bulk_create(
+                [
+                    CartItem(cart=cart, product_id=op['product_id'], quantity=0)
+                    for _, op in valid
+                    if op['op'] != 'remove' and op['product_id'] in products and products[op['product_id']].is_active
+                ],
+                ignore_conflicts=True,
+            )
+            lines = {
+                line.product_id: line
+                for line in CartItem.objects.select_for_update().filter(cart=cart, product_id__in=product_ids)
+            }
+            
+            quantities = {product_id: line.quantity for product_id, line in lines.items()}
+            for index, op in valid:
+                product_id = op['product_id']
+                product = products.get(product_id)
+                if op['op'] == 'remove':
+                    if product_id in lines:
+                        quantities[product_id] = 0
+                    elif product is None:
+                        errors.append({"index": index, "errors": {"product_id": "Product not found."}})
+                    continue
+                if product is None or not product.is_active:
+                    errors.append({"index": index, "errors": {"product_id": "Product not found."}})
+                    continue
+                
+                if op['op'] == 'add':
+                    quantity = quantities.get(product_id, 0) + op['quantity']
+                else:
+                    quantity = op['quantity']
+                if quantity > product.available:
+                    errors.append({"index": index, "errors": {"detail": "Not enough items in stock."}})
+                    continue
+                quantities[product_id] = quantity
+            
+            # Emptied lines go, including the placeholders of adds that were rejected
+            removed = [pid for pid, quantity in quantities.items() if not quantity]
+            # Every line is locked, so writing the resulting quantities can't lose a concurrent change
+            upserts = [
+                CartItem(cart=cart, product_id=pid, quantity=quantity)
+                for pid, quantity in quantities.items()
+                if quantity and lines[pid].quantity != quantity
+            ]
+            if removed:
+                CartItem.objects.filter(cart=cart, product_id__in=removed).delete()
+            if upserts:
+                CartItem.objects.bulk_create(
+                    upserts,
+                    update_conflicts=True,
+                    unique_fields=['cart', 'product'],
+                    update_fields=['quantity', 'updated_at'],
+                )
+            
+            if upserts:
+                hold_stock(
+                    CartItem.objects.filter(cart=cart, product_id__in=[line.product_id for line in upserts])
+                    .values_list('pk', 'product_id', 'quantity')
+                )
+            
+            changes = {pid: quantity - lines[pid].quantity for pid, quantity in quantities.items()}
+            if any(changes.values()):
+                cart.adjust_totals(
+                    sum(changes.values()),
+                    sum(products[pid].price * change for pid, change in changes.items()),
+                )
+        
+        errors.sort(key=lambda error: error['index'])
+        return Response({"cart": serialize_cart(cart), "errors": errors})
+
+
+class OrderViewSet(FastReadMixin, viewsets.ModelViewSet):
     serializer_class = OrderSerializer
+    fast_serializer_class = FastOrderSerializer
     permission_classes = [permissions.IsAuthenticated]
+    pagination_class = OrderPagination
     
     def get_queryset(self):
-        return Order.objects.filter(user=self.request.user).order_by('-created_at')
+        queryset = Order.objects.filter(user_id=self.request.user.id).order_by('-created_at')
+        return OrderSerializer.setup_eager_loading(queryset)
     
     def create(self, request):
-        serializer = OrderCreateSerializer(data=request.data, context={'request': request})
+        serializer = OrderCreateSerializer(data=request.data, context={'request': request, 'cart': get_cart(request)})
         if serializer.is_valid():
-            order = serializer.save()
+            # Follow-up work is queued in the order's transaction and done by the job worker
+            with transaction.atomic():
+                order = serializer.save()
+                queue_order_followups(order)
+            prefetch_related_objects([order], *OrderSerializer.eager_prefetches())
             return Response(
                 OrderSerializer(order).data, 
                 status=status.HTTP_201_CREATED
             )
         return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
 
+    @action(detail=False, methods=['post'], url_path='bulk-status', permission_classes=[permissions.IsAdminUser])
+    def bulk_status(self, request):
+        """Move a batch of orders (anyone's) to one status, reporting each order's outcome"""
+        serializer = OrderStatusBatchSerializer(data=request.data)
+        if not serializer.is_valid():
+            return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
+        target = serializer.validated_data['status']
+        results, restocked = fulfillment.transition_orders(serializer.validated_data['ids'], target)
+        return Response({
+            "status": target,
+            "updated": sum(result['outcome'] == fulfillment.UPDATED for result in results),
+            "restocked_units": restocked,
+            "results": results,
+        })
+
+
+class AnalyticsView(APIView):
+    """Base for the read-only dashboards, served from the daily rollup tables"""
+    permission_classes = [permissions.IsAdminUser]
+
+    def get(self, request, **kwargs):
+        query = AnalyticsQuerySerializer(data=request.query_params)
+        if not query.is_valid():
+            return Response(query.errors, status=status.HTTP_400_BAD_REQUEST)
+        params = query.validated_data
+        return Response({
+            "start": params['start'],
+            "end": params['end'],
+            # Rollups lag the order tables by up to one refresh interval
+            "as_of": analytics.get_watermark(),
+            **self.report(params, **kwargs),
+        })
+
+
+class SalesAnalyticsView(AnalyticsView):
+    def report(self, params):
+        return {
+            "totals": SalesFiguresSerializer(analytics.sales_totals(params['start'], params['end'])).data,
+            "days": DailySalesSerializer(analytics.daily_sales(params['start'], params['end']), many=True).data,
+        }
+
+
+class CategorySalesAnalyticsView(AnalyticsView):
+    def report(self, params):
+        rows = analytics.category_sales(params['start'], params['end'])
+        return {"results": CategorySalesSerializer(rows, many=True).data}
+
+
+class TopProductsAnalyticsView(AnalyticsView):
+    def report(self, params):
+        rows = analytics.top_products(params['start'], params['end'], limit=params['limit'], by=params['by'])
+        return {"results": ProductSalesSerializer(rows, many=True).data}
+
+
+class StockHistoryAnalyticsView(AnalyticsView):
+    def report(self, params, product_id):
+        rows = analytics.stock_history(product_id, params['start'], params['end'])
+        return {"product": product_id, "results": StockSnapshotSerializer(rows, many=True).data}
+
+
+def metrics_view(request):
+    """Prometheus scrape endpoint: bearer METRICS_TOKEN, or a logged-in staff user"""
+    token = getattr(settings, 'METRICS_TOKEN', None)
+    authorization = request.headers.get('Authorization', '')
+    authorized = bool(token) and hmac.compare_digest(authorization.encode(), f'Bearer {token}'.encode())
+    if not (authorized or request.user.is_staff):
+        return HttpResponseForbidden('Forbidden')
+    return HttpResponse(metrics.render_prometheus(), content_type='text/plain; version=0.0.4; charset=utf-8')
+
 
 # Get secrets from environment variables (will be set on PythonAnywhere)
 # For local testing, these might not be set, handle appropriately if testing locally.
 WEBHOOK_SECRET = os.environ.get('PA_WEBHOOK_SECRET', 'local_secret_placeholder') # Use a placeholder for local testing if needed
-PA_API_TOKEN = os.environ.get('PA_API_TOKEN')
-PA_USERNAME = 'SyncWIvan' # Your PythonAnywhere username
-PA_WEBAPP_DOMAIN = 'syncwivan.pythonanywhere.com' # Your webapp domain
 
 
-@csrf_exempt # Disable CSRF for this webhook endpoint
-def trigger_deployment_webhook(request):
-    # 1. Verify the request method
-    if request.method != 'POST':
-        return HttpResponseForbidden('Invalid request method.')
-
-    # 2. Verify the secret key (passed in a header for basic security)
+def check_deploy_secret(request):
+    """An error response unless the request carries the deployment secret"""
     provided_secret = request.headers.get('X-Deploy-Secret')
     if not provided_secret:
         return HttpResponseForbidden('Missing deployment secret header.')
 
     if not WEBHOOK_SECRET:
-            return HttpResponseServerError('Webhook secret not configured on server.')
+        return HttpResponseServerError('Webhook secret not configured on server.')
 
-    # Securely compare secrets
-    if not hmac.compare_digest(provided_secret, WEBHOOK_SECRET):
-        # Log the mismatch for debugging ONLY if needed, avoid logging secrets
-        print(f"Secret mismatch. Provided: '{provided_secret[:5]}...', Expected: '{WEBHOOK_SECRET[:5]}...'")
+    # Securely compare secrets; as bytes, since compare_digest rejects non-ASCII str
+    if not hmac.compare_digest(provided_secret.encode(), WEBHOOK_SECRET.encode()):
+        logger.warning('Deployment webhook called with an invalid secret')
         return HttpResponseForbidden('Invalid deployment secret.')
+    return None
 
-    # 3. Execute deployment commands
-    try:
-        # Define paths relative to where manage.py is
-        # Ensure settings.BASE_DIR points to the 'backend' directory
-        base_dir = settings.BASE_DIR
-        repo_dir = os.path.dirname(base_dir) # Assumes BASE_DIR is 'backend', so repo_dir is project root
-        venv_activate = f"/home/{PA_USERNAME}/.virtualenvs/venv/bin/activate" # Adjust venv path if needed
-
-        # --- Deployment Commands ---
-        commands = [
-            f"cd {repo_dir}", # Change to project root first
-            "echo '--- Pulling latest code ---'",
-            "git status", # Check status before pull
-            "git pull origin main",
-            f"echo '--- Activating virtualenv ---'",
-            f"source {venv_activate}",
-            "echo '--- Installing dependencies ---'",
-            # Install from requirements in the project root
-            f"pip install -r {repo_dir}/requirements.txt",
-            "echo '--- Running migrations ---'",
-            # Run manage.py from the backend directory
-            f"python {base_dir}/manage.py migrate --noinput",
-            "echo '--- Deployment script finished ---'"
-        ]
-
-        # Combine commands into a single string to run in a shell
-        full_command = " && ".join(commands)
-        print(f"Executing deployment command: {full_command}") # Log the command being run
-
-        # Run the commands - Increased timeout for potentially long installs/migrations
-        result = subprocess.run(full_command, shell=True, capture_output=True, text=True, check=False, executable='/bin/bash', timeout=300) # Use check=False initially for debugging
-
-        # Log output regardless of success for debugging
-        print("Deployment Subprocess STDOUT:")
-        print(result.stdout)
-        print("Deployment Subprocess STDERR:")
-        print(result.stderr)
-
-        # Check if the process actually failed after logging
-        if result.returncode != 0:
-             raise subprocess.CalledProcessError(result.returncode, full_command, output=result.stdout, stderr=result.stderr)
-
-
-        # 4. Reload Webapp via PythonAnywhere API (Only after successful commands)
-        if PA_API_TOKEN:
-                reload_url = f"https://www.pythonanywhere.com/api/v0/user/{PA_USERNAME}/webapps/{PA_WEBAPP_DOMAIN}/reload/"
-                print(f"Attempting to reload webapp via API: {reload_url}")
-                try:
-                    response = requests.post(
-                        reload_url,
-                        headers={'Authorization': f'Token {PA_API_TOKEN}'},
-                        timeout=30 # Add a timeout for the API call
-                    )
-                    print(f"Reload API status code: {response.status_code}")
-                    if response.status_code != 200:
-                        print(f"Reload API response text: {response.text}")
-                        # Consider this a soft failure; deployment might have worked but reload failed
-                except requests.exceptions.RequestException as api_e:
-                     print(f"Error calling PythonAnywhere reload API: {api_e}")
-                     # Consider this a soft failure
-        else:
-            print("PA_API_TOKEN environment variable not set, skipping webapp reload via API.")
-
-
-        return JsonResponse({"status": "success", "message": "Deployment triggered and commands executed."})
-
-    except subprocess.CalledProcessError as e:
-        # Use triple quotes for multi-line f-string
-        error_message = f"""Deployment script failed.
-Return Code: {e.returncode}
-STDOUT: {e.stdout}
-STDERR: {e.stderr}"""
-        print(f"ERROR: {error_message}")
-        return HttpResponseServerError(error_message)
-    except subprocess.TimeoutExpired as e:
-        # Use triple quotes for multi-line f-string
-        error_message = f"""Deployment script timed out after {e.timeout} seconds.
-STDOUT: {e.stdout}
-STDERR: {e.stderr}"""
-        print(f"ERROR: {error_message}")
-        return HttpResponseServerError(error_message)
-    except Exception as e:
-        # Catch any other unexpected exceptions
-        # Single line f-string is fine here
-        error_message = f"An unexpected error occurred during deployment: {str(e)}"
-        import traceback
-        print(f"ERROR: {error_message}")
-        traceback.print_exc() # Print full traceback for unexpected errors
-        return HttpResponseServerError(error_message)
+
+@csrf_exempt # Disable CSRF for this webhook endpoint
+def trigger_deployment_webhook(request):
+    """Queue a deployment (pull, install, migrate, reload) for the job worker and return its id"""
+    if request.method != 'POST':
+        return HttpResponseForbidden('Invalid request method.')
+    denied = check_deploy_secret(request)
+    if denied:
+        return denied
+
+    # Pushes that arrive while a deployment is still queued are covered by it
+    deployment, created = deploy.request_deployment()
+    logger.info('Deployment #%s %s', deployment.pk, 'queued' if created else 'already queued')
+    return JsonResponse(
+        {
+            "id": deployment.pk,
+            "status": deployment.status,
+            "status_url": reverse('deploy-status', args=[deployment.pk]),
+        },
+        status=202,
+    )
+
+
+def deployment_status(request, deployment_id):
+    """
+    A deployment's steps, timings and log as JSON; poll with ``?offset=N``
+    (the previous response's ``log_offset``) to get only the new output
+    """
+    denied = check_deploy_secret(request)
+    if denied:
+        return denied
+    deployment = get_object_or_404(Deployment, pk=deployment_id)
+    offset = request.GET.get('offset', '')
+    return JsonResponse(deploy.describe(deployment, offset=int(offset) if offset.isdigit() else 0))
@@ -3,6 +3,7 @@ Django settings for ecommerce project.
 """
 
 import os
+import sys
 from pathlib import Path
 from datetime import timedelta
 
@@ -36,12 +37,16 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    # First, so its timings cover every other middleware
+    'api.metrics.MetricsMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'corsheaders.middleware.CorsMiddleware',
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
     'django.contrib.auth.middleware.AuthenticationMiddleware',
+    # Reads the user DRF authenticated, so it must run inside AuthenticationMiddleware
+    'api.db_router.PrimaryPinningMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
 ]
@@ -67,12 +72,132 @@ TEMPLATES = [
 WSGI_APPLICATION = 'ecommerce.wsgi.application'
 
 # Database
-DATABASES = {
-    'default': {
-        'ENGINE': 'django.db.backends.sqlite3',
-        'NAME': BASE_DIR / 'db.sqlite3',
+# Connections are kept open for DB_CONN_MAX_AGE seconds (0 closes them after each request) and
+# checked before reuse. With POSTGRES_DB set, PostgreSQL is used instead of SQLite, and
+# DB_POOL=True gives each process a psycopg connection pool in place of persistent connections.
+DB_CONN_MAX_AGE = int(os.getenv('DB_CONN_MAX_AGE', 60))
+
+
+def database(**overrides):
+    if os.getenv('POSTGRES_DB'):
+        config = {
+            'ENGINE': 'django.db.backends.postgresql',
+            'NAME': os.getenv('POSTGRES_DB'),
+            'USER': os.getenv('POSTGRES_USER', ''),
+            'PASSWORD': os.getenv('POSTGRES_PASSWORD', ''),
+            'HOST': os.getenv('POSTGRES_HOST', ''),
+            'PORT': os.getenv('POSTGRES_PORT', ''),
+            'OPTIONS': {},
+        }
+        if os.getenv('DB_POOL', 'False') == 'True':
+            config['OPTIONS']['pool'] = {
+                'min_size': int(os.getenv('DB_POOL_MIN_SIZE', 2)),
+                'max_size': int(os.getenv('DB_POOL_MAX_SIZE', 10)),
+            }
+    else:
+        config = {
+            'ENGINE': 'django.db.backends.sqlite3',
+            'NAME': BASE_DIR / 'db.sqlite3',
+            'OPTIONS': {
+                # Take the write lock when a transaction starts so concurrent checkouts
+                # queue up on the busy timeout instead of failing with "database is locked"
+                'transaction_mode': 'IMMEDIATE',
+                'timeout': 20,
+            },
+        }
+    # A pool replaces persistent connections; Django refuses both at once
+    config['CONN_MAX_AGE'] = 0 if 'pool' in config['OPTIONS'] else DB_CONN_MAX_AGE
+    config['CONN_HEALTH_CHECKS'] = True
+    config.update(overrides)
+    return config
+
+
+DATABASES = {'default': database()}
+
+# Read replicas for the catalog views (see api.db_router): DB_REPLICAS lists one SQLite file, or
+# one PostgreSQL host, per replica. Tests read the replicas through the default database.
+DATABASE_REPLICAS = []
+for index, replica in enumerate(filter(None, os.getenv('DB_REPLICAS', '').split(',')), start=1):
+    alias = f'replica{index}'
+    location = {'HOST': replica.strip()} if os.getenv('POSTGRES_DB') else {'NAME': replica.strip()}
+    DATABASES[alias] = database(**location, TEST={'MIRROR': 'default'})
+    DATABASE_REPLICAS.append(alias)
+
+# Two more mirrors of the test database for the routing tests, which turn them on with DATABASE_REPLICAS
+if sys.argv[1:2] == ['test']:
+    for alias in ('test_replica1', 'test_replica2'):
+        DATABASES[alias] = database(TEST={'MIRROR': 'default'})
+
+DATABASE_ROUTERS = ['api.db_router.ReplicaRouter']
+# Seconds a user's reads stay on the primary after a request of theirs wrote
+REPLICA_PIN_SECONDS = int(os.getenv('REPLICA_PIN_SECONDS', 5))
+
+# Cache: Redis (or any Redis-compatible server) when REDIS_URL is set, local memory otherwise
+if os.getenv('REDIS_URL'):
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+            'LOCATION': os.getenv('REDIS_URL'),
+        }
     }
-}
+else:
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+            'LOCATION': 'ecommerce',
+        }
+    }
+
+# Seconds a cached catalog response may live; invalidation itself is signal driven
+CATALOG_CACHE_TIMEOUT = int(os.getenv('CATALOG_CACHE_TIMEOUT', 300))
+
+# Admin changelists estimate large counts and search by prefix (see api.admin_performance)
+ADMIN_PERFORMANCE_MODE = os.getenv('ADMIN_PERFORMANCE_MODE', 'True') == 'True'
+ADMIN_COUNT_LIMIT = int(os.getenv('ADMIN_COUNT_LIMIT', 10_000))
+
+# Products kept in each precomputed ranking (newest, bestsellers, trending)
+RANKING_SIZE = int(os.getenv('RANKING_SIZE', 20))
+# Seconds each process reuses the stored lists before reading them again
+RANKING_MEMO_SECONDS = int(os.getenv('RANKING_MEMO_SECONDS', 30))
+
+# How long adding a product to the cart holds its stock for that cart (seconds)
+STOCK_RESERVATION_TTL = int(os.getenv('STOCK_RESERVATION_TTL', 15 * 60))
+
+# Background jobs (python manage.py run_jobs): a running job whose worker has been
+# silent this long (seconds) is assumed dead and retried
+JOB_LOCK_TIMEOUT = int(os.getenv('JOB_LOCK_TIMEOUT', 10 * 60))
+
+# Deploy webhook: branch to pull, per-step timeout (seconds), interpreter for pip/migrate (default: the worker's)
+DEPLOY_BRANCH = os.getenv('DEPLOY_BRANCH', 'main')
+DEPLOY_STEP_TIMEOUT = int(os.getenv('DEPLOY_STEP_TIMEOUT', 300))
+DEPLOY_PYTHON = os.getenv('DEPLOY_PYTHON')
+
+# Order emails are sent by the job worker; prints them to its console unless configured
+EMAIL_BACKEND = os.getenv('EMAIL_BACKEND', 'django.core.mail.backends.console.EmailBackend')
+DEFAULT_FROM_EMAIL = os.getenv('DEFAULT_FROM_EMAIL', 'orders@syncwivan.pythonanywhere.com')
+
+# Request metrics (api.metrics), scraped from /metrics with "Authorization: Bearer $METRICS_TOKEN"
+# or viewed by a logged-in staff user. Requests over either budget are logged.
+METRICS_ENABLED = os.getenv('METRICS_ENABLED', 'True') == 'True'
+METRICS_TOKEN = os.getenv('METRICS_TOKEN')
+METRICS_QUERY_BUDGET = int(os.getenv('METRICS_QUERY_BUDGET', 20))
+METRICS_LATENCY_BUDGET_MS = int(os.getenv('METRICS_LATENCY_BUDGET_MS', 500))
+
+# Serve read-only list/detail responses from .values() rows instead of DRF model serializers
+FAST_READ_SERIALIZERS = True
+
+# Password hashing: PBKDF2 work factor (0 keeps Django's default); lower it only with a matching login rate limit
+PASSWORD_HASHERS = [
+    'api.hashers.TunablePBKDF2PasswordHasher',
+    'django.contrib.auth.hashers.PBKDF2SHA1PasswordHasher',
+    'django.contrib.auth.hashers.Argon2PasswordHasher',
+    'django.contrib.auth.hashers.BCryptSHA256PasswordHasher',
+    'django.contrib.auth.hashers.ScryptPasswordHasher',
+]
+PASSWORD_HASH_ITERATIONS = int(os.getenv('PASSWORD_HASH_ITERATIONS', 0))
+
+# ModelBackend that lets the token revocation signal tell a login's hash upgrade from a password change
+AUTHENTICATION_BACKENDS = ['api.authentication.ShopModelBackend']
 
 # Password validation
 AUTH_PASSWORD_VALIDATORS = [
@@ -110,7 +235,8 @@ DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
 # REST Framework settings
 REST_FRAMEWORK = {
     'DEFAULT_AUTHENTICATION_CLASSES': (
-        'rest_framework_simplejwt.authentication.JWTAuthentication',
+        # Trusts the token's claims instead of loading the User row; revocations go through the cache
+        'api.authentication.StatelessJWTAuthentication',
     ),
     'DEFAULT_PERMISSION_CLASSES': [
         'rest_framework.permissions.IsAuthenticated',
@@ -138,7 +264,9 @@ SIMPLE_JWT = {
 
     'AUTH_TOKEN_CLASSES': ('rest_framework_simplejwt.tokens.AccessToken',),
     'TOKEN_TYPE_CLAIM': 'token_type',
-    'TOKEN_USER_CLASS': 'rest_framework_simplejwt.models.TokenUser',
+    'TOKEN_USER_CLASS': 'api.authentication.ShopTokenUser',
+    'TOKEN_OBTAIN_SERIALIZER': 'api.authentication.ShopTokenObtainPairSerializer',
+    'TOKEN_REFRESH_SERIALIZER': 'api.authentication.ShopTokenRefreshSerializer',
 
     'JTI_CLAIM': 'jti',
 
@@ -8,9 +8,12 @@ from django.conf import settings
 from django.conf.urls.static import static
 from django.views.generic import RedirectView
 
+from api.views import metrics_view
+
 urlpatterns = [
     path('admin/', admin.site.urls),
     path('api/', include('api.urls')),
+    path('metrics', metrics_view, name='metrics'),
     # Redirect root URL to frontend
     path('', RedirectView.as_view(url='http://localhost:5000/', permanent=False)),
 ]